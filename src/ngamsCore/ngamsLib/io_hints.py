@@ -0,0 +1,66 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Hints given to the kernel about how files are going to be read, so that
+sequential reads benefit from read-ahead, and reads that are not expected to
+be repeated soon don't evict the data other requests depend on from the page
+cache. Hints are silently ignored where posix_fadvise(2) is not available.
+"""
+
+import contextlib
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+# Only the first bytes of a file are explicitly requested to be read in
+# advance; the kernel's read-ahead takes care of the rest as reading progresses
+_WILLNEED_SIZE = 8 * 1024 * 1024
+
+_fadvise = getattr(os, 'posix_fadvise', None)
+
+def _advise(f, offset, length, advice):
+    try:
+        _fadvise(f.fileno(), offset, length, advice)
+    except (OSError, IOError) as e:
+        logger.debug("Couldn't give advice %d on %r: %s", advice, f, e)
+
+@contextlib.contextmanager
+def sequential_read(f, offset=0, length=0, enabled=True, drop=False):
+    """
+    Hints the kernel that `length` bytes of the open file `f` starting at
+    `offset` (or up to its end if `length` is 0) are about to be read
+    sequentially. If `drop` is given, the kernel is also told after reading
+    that the data doesn't need to be kept in the page cache anymore.
+    Nothing is done if `enabled` is false.
+    """
+    enabled = enabled and _fadvise is not None
+    if enabled:
+        _advise(f, offset, length, os.POSIX_FADV_SEQUENTIAL)
+        willneed = min(length, _WILLNEED_SIZE) if length else _WILLNEED_SIZE
+        _advise(f, offset, willneed, os.POSIX_FADV_WILLNEED)
+    try:
+        yield f
+    finally:
+        if enabled and drop:
+            _advise(f, offset, length, os.POSIX_FADV_DONTNEED)
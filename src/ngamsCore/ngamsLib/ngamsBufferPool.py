@@ -0,0 +1,103 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Pools of preallocated, reusable buffers used to receive data without
+allocating new memory for each block being read.
+"""
+
+import contextlib
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+class BufferPool(object):
+    """
+    A pool of reusable buffers of `size` bytes each. Buffers are handed out as
+    memoryview objects, and should be given back to the pool when they are not
+    used anymore. New buffers are allocated when the pool is empty, and up to
+    `max_idle` buffers are retained for reuse when they are given back.
+    """
+
+    def __init__(self, size, max_idle=64):
+        self.size = size
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self.allocated = 0
+
+    def acquire(self):
+        """Returns a buffer from the pool, allocating a new one if necessary"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.allocated += 1
+        logger.debug("Allocating new %d bytes buffer", self.size)
+        return memoryview(bytearray(self.size))
+
+    def release(self, buf):
+        """Gives `buf` back to the pool"""
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(buf)
+
+    @contextlib.contextmanager
+    def buffer(self):
+        """Context manager that acquires a buffer and then releases it"""
+        buf = self.acquire()
+        try:
+            yield buf
+        finally:
+            self.release(buf)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(size):
+    """Returns the process-wide pool of buffers of `size` bytes"""
+    with _pools_lock:
+        if size not in _pools:
+            _pools[size] = BufferPool(size)
+        return _pools[size]
+
+def reset_pools():
+    """
+    Forgets all pools. Forked processes call this so they don't share the
+    pools (or their locks) of their parent
+    """
+    global _pools, _pools_lock
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+def readinto(fin, view):
+    """
+    Reads up to len(`view`) bytes from `fin` into `view` and returns the number
+    of bytes actually read. File-like objects without readinto() support are
+    read normally, and their data copied into `view`.
+    """
+    if hasattr(fin, 'readinto'):
+        return fin.readinto(view) or 0
+    data = fin.read(len(view))
+    n = len(data)
+    view[:n] = data
+    return n
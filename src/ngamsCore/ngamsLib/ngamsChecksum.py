@@ -0,0 +1,393 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Checksums and digests of files and data streams, and the combination of the
+partial CRCs of consecutive pieces of data. These are shared by the server,
+which calculates them while archiving and checking files, and by clients,
+which use them to verify the files they retrieve.
+"""
+
+import binascii
+import collections
+import functools
+import hashlib
+import os
+import struct
+from multiprocessing.pool import ThreadPool
+
+import six
+
+from . import io_hints
+
+_crc32c_available = True
+try:
+    import crc32c
+except ImportError:
+    _crc32c_available = False
+
+_xxhash_available = True
+try:
+    import xxhash
+except ImportError:
+    _xxhash_available = False
+
+# The checksum_info fields are:
+#  * init: the initial value of the checksum before running over the data
+#  * method: the accumulative checksum method invoked for each piece of data
+#  * final: Converts the final checksum to get the final value
+#  * from_bytes: converts a sequence of bytes into a checksum value
+#
+# In NGAS checksum values are treated as integers (and then stored as their
+# string representation in the database), which is why the `final` and
+# `from_bytes` functions need to be aligned.
+checksum_info = collections.namedtuple('crc_info', 'init method final from_bytes equals')
+
+CHECKSUM_NULL = -1
+CHECKSUM_CRC32_INCONSISTENT = 0
+CHECKSUM_CRC32C = 1
+CHECKSUM_CRC32Z = 2
+
+def _normalize_variant(variant_or_name):
+
+    variant = variant_or_name
+
+    if variant is None:
+        variant = CHECKSUM_NULL
+
+    # A plug-in name or variant name
+    elif isinstance(variant, six.string_types):
+        # In NGAS versions <= 8 the CRC was calculated as a separate step after
+        # archiving a file, and therefore was loaded as a plugin that received a
+        # filename when invoked.
+        # These two are the names stored at the database of those plugins, although
+        # the second one is simply a dummy name
+        if variant in ('ngamsGenCrc32', 'StreamCrc32', 'crc32'):
+            variant = CHECKSUM_CRC32_INCONSISTENT
+        elif variant == 'crc32c':
+            variant = CHECKSUM_CRC32C
+        elif variant == 'crc32z':
+            variant = CHECKSUM_CRC32Z
+        else:
+            variant = int(variant)
+
+    return variant
+
+def _filter_none(cond):
+    def wrapped(x, y):
+        if x is None:
+            return y is None
+        elif y is None:
+            return x is None
+        return cond(x, y)
+    return wrapped
+
+# Digests that can be calculated in addition to the CRC of a file.
+# Their values are the hexadecimal representation of the digest
+_digest_factories = {
+    'md5': hashlib.md5,
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+    'sha512': hashlib.sha512,
+}
+if _xxhash_available:
+    _digest_factories['xxh32'] = xxhash.xxh32
+    _digest_factories['xxh64'] = xxhash.xxh64
+
+def is_digest(variant_or_name):
+    """Whether `variant_or_name` names a digest rather than a CRC variant"""
+    return isinstance(variant_or_name, six.string_types) and \
+           variant_or_name.lower() in _digest_factories
+
+def _get_digest_info(name):
+
+    factory = _digest_factories[name.lower()]
+    def update(data, digest):
+        digest = digest or factory()
+        digest.update(data)
+        return digest
+    def final(digest):
+        return (digest or factory()).hexdigest()
+    def from_bytes(x):
+        return binascii.hexlify(x).decode('ascii')
+    def equals(x, y):
+        if x is None or y is None:
+            return x is y
+        return x.lower() == y.lower()
+    return checksum_info(None, update, final, from_bytes, equals)
+
+def get_checksum_info(variant_or_name):
+    """
+    Given a CRC variant, this method returns the method that should be
+    continuously called to calculate the CRC of a given byte stream.
+
+    The variant_or_name argument can be a number, where 0 is python's binascii
+    crc32 implementation and 1 is Intel's SSE 4.2 CRC32c implementation, or a
+    name indicating one of the old NGAMS plug-in names for performing CRC.
+    The special value -1 means that no checksum is performed, and thus this
+    method returns None
+
+    The name of a digest (e.g., sha256) can also be given. Finally, if a list
+    of variants or names is given, a list with the information of each of them
+    is returned, so they can all be calculated over the same data.
+    """
+    if isinstance(variant_or_name, (list, tuple)):
+        return [get_checksum_info(v) for v in variant_or_name]
+    if is_digest(variant_or_name):
+        return _get_digest_info(variant_or_name)
+    variant = _normalize_variant(variant_or_name)
+    if variant == CHECKSUM_NULL:
+        return None
+    if variant == CHECKSUM_CRC32_INCONSISTENT:
+        # This version of the crc is inconsistent because depending on the
+        # python version binascii.crc32 returns signed or unsigned values.
+        # python version <2.6 returned signed/unsigned depending on the platform,
+        # 2.6+ returns always signed, 3+ returns always unsigned).
+        fmt = '!i' if six.PY2 else '!I'
+        return checksum_info(0, binascii.crc32, lambda x: x, lambda x: struct.unpack(fmt, x)[0], _filter_none(lambda x, y: (int(x) & 0xffffffff) == (int(y) & 0xffffffff)))
+    elif variant == CHECKSUM_CRC32C:
+        if not _crc32c_available:
+            raise Exception('Intel SSE 4.2 CRC32c instruction is not available')
+        return checksum_info(0, crc32c.crc32, lambda x: x & 0xffffffff, lambda x: struct.unpack('!I', x)[0], _filter_none(lambda x, y: int(x) == int(y)))
+    elif variant == CHECKSUM_CRC32Z:
+        # A consistent way of using binascii.crc32.
+        return checksum_info(0, binascii.crc32, lambda x: x & 0xffffffff, lambda x: struct.unpack('!I', x)[0], _filter_none(lambda x, y: int(x) == int(y)))
+    raise Exception('Unknown CRC variant: %r' % (variant_or_name,))
+
+def get_checksum_name(variant_or_name):
+    """
+    Given a CRC variant, this method returns the name used to denote that
+    variant.
+
+    The variant_or_name argument can be a number, where 0 is python's binascii
+    crc32 implementation and 1 is Intel's SSE 4.2 CRC32c implementation, or a
+    name indicating one of the old NGAMS plug-in names for performing CRC.
+    The special value -1 means that no checksum is performed, and thus this
+    method returns 'nocrc'
+    """
+    if is_digest(variant_or_name):
+        return variant_or_name.lower()
+    variant = _normalize_variant(variant_or_name)
+    if variant == CHECKSUM_NULL:
+        return None
+    if variant == CHECKSUM_CRC32_INCONSISTENT:
+        return 'crc32'
+    elif variant == CHECKSUM_CRC32C:
+        return 'crc32c'
+    elif variant == CHECKSUM_CRC32Z:
+        return 'crc32z'
+    raise Exception('Unknown CRC variant: %d' % (variant_or_name,))
+
+def get_checksum(blocksize, fin, checksum_variant, hints=False, drop_cache=False):
+    """
+    Returns the checksum of a file (or file object) using the given checksum type.
+    When given a filename, `hints` and `drop_cache` are passed down to
+    io_hints.sequential_read as `enabled` and `drop` respectively.
+    """
+    crc_info = get_checksum_info(checksum_variant)
+    if crc_info is None:
+        return None
+
+    crc_m = crc_info.method
+
+    # fin can be a filename, in which case we open (and then close) it
+    my_fileobj = None
+    fileobj = fin
+    if isinstance(fin, six.string_types):
+        my_fileobj = fileobj = open(fin, 'rb')
+
+    # Read and checksum, thank you very much
+    read = fileobj.read
+    crc = crc_info.init
+    try:
+        with io_hints.sequential_read(fileobj, enabled=hints and my_fileobj is not None,
+                                      drop=drop_cache):
+            while True:
+                block = read(blocksize)
+                if not block:
+                    break
+                crc = crc_m(block, crc)
+    finally:
+        # We opened it, we close it
+        if my_fileobj:
+            try:
+                my_fileobj.close()
+            except:
+                pass
+
+    crc = crc_info.final(crc)
+    return crc
+
+def get_checksum_interruptible(blocksize, filename, checksum_variant,
+                               checksum_allow_evt, checksum_stop_evt,
+                               hints=False, drop_cache=False):
+    """
+    Like get_checksum, but the inner loop's execution is conditioned by two
+    events to signal a full stop, and whether the execution of the inner loop
+    should continue or not.
+
+    When the caller sets the `stop_evt`, the `allowed_evt` should also be set;
+    otherwise the execution will hang indefinitely.
+    """
+    crc_info = get_checksum_info(checksum_variant)
+    if crc_info is None:
+        return None
+    crc_m = crc_info.method
+    crc = crc_info.init
+    with open(filename, 'rb') as f, \
+         io_hints.sequential_read(f, enabled=hints, drop=drop_cache):
+        for block in iter(functools.partial(f.read, blocksize), b''):
+            checksum_allow_evt.wait()
+            if checksum_stop_evt.is_set():
+                return
+            crc = crc_m(block, crc)
+    crc = crc_info.final(crc)
+    return crc
+
+# Reversed polynomials of the CRC variants, used to combine partial CRCs
+_crc_polynomials = {
+    CHECKSUM_CRC32_INCONSISTENT: 0xedb88320,
+    CHECKSUM_CRC32Z: 0xedb88320,
+    CHECKSUM_CRC32C: 0x82f63b78
+}
+_x2n_tables = {}
+
+def _multmodp(a, b, poly):
+    """Multiplies a(x) by b(x) modulo p(x), all in reflected bit order"""
+    m = 1 << 31
+    p = 0
+    while True:
+        if a & m:
+            p ^= b
+            if not a & (m - 1):
+                break
+        m >>= 1
+        b = (b >> 1) ^ poly if b & 1 else b >> 1
+    return p
+
+def _x2nmodp(n, k, poly):
+    """Returns x^(n * 2^k) modulo p(x)"""
+    table = _x2n_tables.get(poly)
+    if table is None:
+        table = [1 << 30]
+        for _ in range(31):
+            table.append(_multmodp(table[-1], table[-1], poly))
+        _x2n_tables[poly] = table
+    p = 1 << 31
+    while n:
+        if n & 1:
+            p = _multmodp(table[k & 31], p, poly)
+        n >>= 1
+        k += 1
+    return p
+
+def crc_combine(crc1, crc2, len2, variant_or_name):
+    """
+    Given the CRCs `crc1` and `crc2` of two consecutive pieces of data (each
+    calculated independently from the initial CRC value), the second of which
+    is `len2` bytes long, returns the CRC of the concatenation of both pieces.
+    CRC values are handled as unsigned integers.
+    """
+    poly = _crc_polynomials[_normalize_variant(variant_or_name)]
+    crc1 &= 0xffffffff
+    crc2 &= 0xffffffff
+    return _multmodp(_x2nmodp(len2, 3, poly), crc1, poly) ^ crc2
+
+def _extent_checksum(blocksize, filename, crc_info, offset, size,
+                     checksum_allow_evt, checksum_stop_evt, hints, drop_cache):
+    crc_m = crc_info.method
+    crc = crc_info.init
+    with open(filename, 'rb') as f, \
+         io_hints.sequential_read(f, offset, size, enabled=hints, drop=drop_cache):
+        f.seek(offset)
+        while size:
+            block = f.read(min(blocksize, size))
+            if not block:
+                raise Exception("%s is shorter than expected" % (filename,))
+            if checksum_allow_evt is not None:
+                checksum_allow_evt.wait()
+                if checksum_stop_evt.is_set():
+                    return None
+            crc = crc_m(block, crc)
+            size -= len(block)
+    return crc
+
+# Files smaller than this are not worth splitting
+_min_extent_size = 8 * 1024 * 1024
+
+def get_checksum_parallel(blocksize, filename, checksum_variant, nthreads,
+                          checksum_allow_evt=None, checksum_stop_evt=None,
+                          hints=False, drop_cache=False):
+    """
+    Like get_checksum, but the file is split into up to `nthreads` extents
+    that are checksumed concurrently by separate threads, and whose partial
+    checksums are then combined into the checksum of the whole file.
+    Small files, an `nthreads` lower than 2, or digests (which cannot be
+    combined) result in the file being checksumed sequentially.
+
+    If given, the `checksum_allow_evt` and `checksum_stop_evt` events are
+    obeyed like in get_checksum_interruptible. `hints` and `drop_cache` are
+    applied to each extent like in get_checksum.
+    """
+    crc_info = get_checksum_info(checksum_variant)
+    if crc_info is None:
+        return None
+
+    # Digests cannot be combined
+    fsize = os.path.getsize(filename)
+    nthreads = min(nthreads, fsize // _min_extent_size)
+    if is_digest(checksum_variant):
+        nthreads = 1
+    if nthreads < 2:
+        if checksum_allow_evt is None:
+            return get_checksum(blocksize, filename, checksum_variant,
+                                hints=hints, drop_cache=drop_cache)
+        return get_checksum_interruptible(blocksize, filename, checksum_variant,
+                                          checksum_allow_evt, checksum_stop_evt,
+                                          hints=hints, drop_cache=drop_cache)
+
+    # Extents are aligned to the block size
+    extent_size = -(-fsize // nthreads)
+    extent_size += -extent_size % blocksize
+    extents = [(offset, min(extent_size, fsize - offset))
+               for offset in range(0, fsize, extent_size)]
+
+    def checksum_extent(extent):
+        return _extent_checksum(blocksize, filename, crc_info, extent[0],
+                                extent[1], checksum_allow_evt, checksum_stop_evt,
+                                hints, drop_cache)
+    pool = ThreadPool(len(extents))
+    try:
+        crcs = pool.map(checksum_extent, extents)
+    finally:
+        pool.close()
+    if None in crcs:
+        return None
+
+    crc = crcs[0]
+    for part_crc, (_, size) in zip(crcs[1:], extents[1:]):
+        crc = crc_combine(crc, part_crc, size, checksum_variant)
+
+    # binascii.crc32 returns signed values under python 2,
+    # and so should this method for that variant
+    if six.PY2 and _normalize_variant(checksum_variant) == CHECKSUM_CRC32_INCONSISTENT:
+        crc = struct.unpack('!i', struct.pack('!I', crc))[0]
+    return crc_info.final(crc)
@@ -891,6 +891,87 @@ class ngamsConfig:
         par = "ArchiveHandling[1].CRCVariant"
         return getInt(par, self.getVal(par), 0)
 
+    def getChecksumThreads(self):
+        """
+        Get the number of threads used to calculate the checksum of a file
+        already stored on disk.
+
+        Returns:   Number of checksum threads, files are checksumed
+                   sequentially if less than 2 (integer).
+        """
+        par = "ArchiveHandling[1].ChecksumThreads"
+        return getInt(par, self.getVal(par), 1)
+
+
+    def getArchivePipelineBuffers(self):
+        """
+        Get the number of buffers used to pipeline the reading, writing and
+        checksumming of incoming data during archiving.
+
+        Returns:   Number of pipeline buffers, pipelining is disabled
+                   if less than 2 (integer).
+        """
+        par = "ArchiveHandling[1].PipelineBuffers"
+        return getInt(par, self.getVal(par), 0)
+
+    def getSpliceTransfer(self):
+        """
+        Get whether incoming data pushed by clients should be moved into the
+        staging files using splice(2), when supported by the platform.
+
+        Returns:   1 if splicing is enabled, 0 otherwise (integer).
+        """
+        par = "ArchiveHandling[1].SpliceTransfer"
+        return getInt(par, self.getVal(par), 0)
+
+    def getPreallocateStagingFiles(self):
+        """
+        Get whether the disk space for incoming data should be preallocated
+        in the staging files before receiving it.
+
+        Returns:   1 if preallocation is enabled, 0 otherwise (integer).
+        """
+        par = "ArchiveHandling[1].Preallocate"
+        return getInt(par, self.getVal(par), 0)
+
+    def getArchiveDurability(self):
+        """
+        Get the durability policy applied to archived files before they are
+        registered in the database.
+
+        Returns:   One of 'none', 'file' or 'group', or None if not
+                   specified (string).
+        """
+        val = self.getVal("ArchiveHandling[1].Durability")
+
+        allowed_values = (None, '', 'none', 'file', 'group')
+        if val not in allowed_values:
+            raise Exception('Durability %s not one of %s' % (val, allowed_values))
+        return val or None
+
+    def getGroupCommitWindow(self):
+        """
+        Get the time that files archived under the 'group' durability policy
+        wait for other files to be flushed to disk together with them.
+
+        Returns:   Group commit window in milliseconds (integer).
+        """
+        par = "ArchiveHandling[1].GroupCommitWindow"
+        return getInt(par, self.getVal(par), 10)
+
+
+    def getArchiveDigests(self):
+        """
+        Get the names of the additional digests calculated for incoming data.
+
+        Returns:   List with the names of the digests, empty if no additional
+                   digests should be calculated (list).
+        """
+        val = self.getVal("ArchiveHandling[1].Digests")
+        if not val:
+            return []
+        return [name.strip() for name in val.split(',') if name.strip()]
+
 
     def getBlockSize(self):
         """
@@ -927,6 +1008,245 @@ class ngamsConfig:
         return getInt(par, self.getVal(par))
 
 
+    def getWorkerThreads(self):
+        """
+        Get the number of pre-started threads serving requests. If 0, a new
+        thread is started to serve each request instead.
+
+        Returns:   Number of worker threads (integer).
+        """
+        par = "Server[1].WorkerThreads"
+        return getInt(par, self.getVal(par), 0)
+
+
+    def getQuickWorkerThreads(self):
+        """
+        Get the number of pre-started threads serving only quick requests,
+        when worker threads are used.
+
+        Returns:   Number of quick worker threads (integer).
+        """
+        par = "Server[1].QuickWorkerThreads"
+        return getInt(par, self.getVal(par), 2)
+
+
+    def getQuickCommands(self):
+        """
+        Get the commands served by the quick worker threads.
+
+        Returns:   List of command names (list).
+        """
+        val = self.getVal("Server[1].QuickCommands")
+        if val is None:
+            return ['STATUS', 'QUERY']
+        return [cmd.strip() for cmd in val.split(',') if cmd.strip()]
+
+
+    def getRequestQueueSize(self):
+        """
+        Get the maximum number of requests waiting to be served by each group
+        of worker threads. Defaults to the maximum number of simultaneous
+        requests.
+
+        Returns:   Request queue size (integer).
+        """
+        par = "Server[1].RequestQueueSize"
+        return getInt(par, self.getVal(par), self.getMaxSimReqs())
+
+
+    def getRequestQueueTimeout(self):
+        """
+        Get the maximum time a request waits to be picked up by a worker
+        thread before it is rejected.
+
+        Returns:   Request queue timeout in seconds (integer).
+        """
+        par = "Server[1].RequestQueueTimeout"
+        return getInt(par, self.getVal(par), 10)
+
+
+    def getKeepAliveTimeout(self):
+        """
+        Get the time an HTTP/1.1 connection is kept open waiting for the next
+        request from the client. If 0, connections are closed after serving
+        a single request (i.e., HTTP/1.0 behavior).
+
+        Returns:   Keep-alive timeout in seconds (integer).
+        """
+        par = "Server[1].KeepAliveTimeout"
+        return getInt(par, self.getVal(par), 0)
+
+
+    def getKeepAliveMaxRequests(self):
+        """
+        Get the maximum number of requests served through a single
+        HTTP/1.1 connection before it is closed.
+
+        Returns:   Maximum number of requests per connection (integer).
+        """
+        par = "Server[1].KeepAliveMaxRequests"
+        return getInt(par, self.getVal(par), 100)
+
+
+    def getLocationCacheSize(self):
+        """
+        Get the maximum number of file locations cached by the server for
+        serving RETRIEVE requests. If 0, file locations are not cached.
+
+        Returns:   Maximum number of cached file locations (integer).
+        """
+        par = "Server[1].LocationCacheSize"
+        return getInt(par, self.getVal(par), 0)
+
+
+    def getLocationCacheTtl(self):
+        """
+        Get the time a file location is kept in the location cache.
+
+        Returns:   Time-to-live of cached file locations in seconds (integer).
+        """
+        par = "Server[1].LocationCacheTtl"
+        return getInt(par, self.getVal(par), 60)
+
+
+    def getFileAccessProbeTimeout(self):
+        """
+        Get the timeout applied when asking other servers whether they can
+        access a file. If greater than 0 all candidate servers are asked
+        concurrently; otherwise they are asked one after the other, without
+        a timeout.
+
+        Returns:   File access probe timeout in seconds (integer).
+        """
+        par = "Server[1].FileAccessProbeTimeout"
+        return getInt(par, self.getVal(par), 0)
+
+
+    def getFileAccessProbeThreads(self):
+        """
+        Get the number of threads available to probe other servers
+        concurrently when FileAccessProbeTimeout is set.
+
+        Returns:   Number of file access probe threads (integer).
+        """
+        par = "Server[1].FileAccessProbeThreads"
+        return getInt(par, self.getVal(par), 16)
+
+
+    def getUnreachableHostTtl(self):
+        """
+        Get the time during which servers that failed to answer a file access
+        probe are not asked again.
+
+        Returns:   Time to remember unreachable servers in seconds (integer).
+        """
+        par = "Server[1].UnreachableHostTtl"
+        return getInt(par, self.getVal(par), 30)
+
+
+    def getBatchRetrieveConcurrency(self):
+        """
+        Get the maximum number of files fetched concurrently from other servers
+        while serving a BRETRIEVE request.
+
+        Returns:   Maximum number of concurrent fetches (integer).
+        """
+        par = "Server[1].BatchRetrieveConcurrency"
+        return getInt(par, self.getVal(par), 4)
+
+
+    def getHostTopologyRefresh(self):
+        """
+        Get the period after which the server reloads its cached view of the
+        hosts in the ngas_hosts table. If 0, host information is not cached
+        and queried every time it is needed.
+
+        Returns:   Host topology refresh period in seconds (integer).
+        """
+        par = "Server[1].HostTopologyRefresh"
+        return getInt(par, self.getVal(par), 0)
+
+
+    def getRequestProcesses(self):
+        """
+        Get the number of processes that serve requests on behalf of the
+        server. If 0, requests are served by the server process itself.
+
+        Returns:   Number of request processes (integer).
+        """
+        par = "Server[1].RequestProcesses"
+        return getInt(par, self.getVal(par), 0)
+
+
+    def getDiskStatsFlushInterval(self):
+        """
+        Get the maximum time, in seconds, that changes to the disk statistics
+        are held in memory before being written to the ngas_disks table. If 0,
+        they are written as each new file is archived.
+
+        Returns:   Flush interval in seconds (integer).
+        """
+        par = "Server[1].DiskStatsFlushInterval"
+        return getInt(par, self.getVal(par), 0)
+
+
+    def getDiskStatsFlushFiles(self):
+        """
+        Get the number of archived files after which the changes to the disk
+        statistics held in memory are written to the ngas_disks table.
+
+        Returns:   Number of files (integer).
+        """
+        par = "Server[1].DiskStatsFlushFiles"
+        return getInt(par, self.getVal(par), 100)
+
+
+    def getDbSlowQueryMs(self):
+        """
+        Get the time, in milliseconds, above which DB queries are logged as
+        slow. If 0, no queries are logged.
+
+        Returns:   Slow query threshold in milliseconds (integer).
+        """
+        par = "Server[1].DbSlowQueryMs"
+        return getInt(par, self.getVal(par), 0)
+
+
+    def getIoHints(self):
+        """
+        Get the flag indicating whether the kernel should be told that files
+        sent to clients, checked or delivered to subscribers are read
+        sequentially.
+
+        Returns:   I/O hints flag (integer/0|1).
+        """
+        par = "Server[1].IoHints"
+        return getInt(par, self.getVal(par), 1)
+
+
+    def getDropCacheAfterRetrieve(self):
+        """
+        Get the flag indicating whether files sent to clients should be
+        dropped from the page cache afterwards.
+
+        Returns:   Drop cache after retrieval flag (integer/0|1).
+        """
+        par = "Server[1].DropCacheAfterRetrieve"
+        return getInt(par, self.getVal(par), 0)
+
+
+    def getDropCacheAfterBackgroundReads(self):
+        """
+        Get the flag indicating whether files read by the Data Check Thread
+        or delivered to subscribers should be dropped from the page cache
+        afterwards.
+
+        Returns:   Drop cache after background reads flag (integer/0|1).
+        """
+        par = "Server[1].DropCacheAfterBackgroundReads"
+        return getInt(par, self.getVal(par), 1)
+
+
     def getMinSpaceSysDirMb(self):
         """
         Get the minimum amount of free disk space required on the NG/AMS System
@@ -154,10 +154,13 @@ NGAMS_HTTP_INT_AUTH_USER  = "ngas-int"
 
 # HTTP Status Codes.
 NGAMS_HTTP_SUCCESS        = 200
+NGAMS_HTTP_PARTIAL        = 206
 NGAMS_HTTP_REDIRECT       = 303
+NGAMS_HTTP_NOT_MODIFIED   = 304
 NGAMS_HTTP_BAD_REQ        = 400
 NGAMS_HTTP_UNAUTH         = 401
 NGAMS_HTTP_UNAUTH_STR     = "Unauthorized"
+NGAMS_HTTP_BAD_RANGE      = 416
 NGAMS_HTTP_SERVICE_NA     = 503 # service is not available
 
 # Request Processing Data Types.
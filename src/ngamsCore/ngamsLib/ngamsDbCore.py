@@ -31,6 +31,8 @@
 Core class for the NG/AMS DB interface.
 """
 
+import bisect
+import contextlib
 import importlib
 import logging
 import random
@@ -46,6 +48,12 @@ from .ngamsCore import TRACE, toiso8601, fromiso8601
 # Global DB Semaphore to protect critical, global DB interaction.
 _globalDbSem = threading.Semaphore(1)
 
+# Maximum number of formatted SQL templates kept by ngamsDbCore
+SQL_CACHE_SIZE = 1000
+
+# Maximum number of SQL statements whose latency statistics are kept apart
+QUERY_STATS_SIZE = 1000
+
 logger = logging.getLogger(__name__)
 
 # Define lay-out of ngas_disks table
@@ -400,14 +408,69 @@ def getNgasMirQueueNamesMap():
     return _ngasMirQueueNamesMap
 
 
+_query_context = threading.local()
+
+@contextlib.contextmanager
+def query_context(name):
+    """
+    Context manager under which queries issued by the current thread are
+    attributed to ``name`` (e.g., the command being served) in the slow-query
+    log.
+    """
+    prev = getattr(_query_context, 'name', None)
+    _query_context.name = name
+    try:
+        yield
+    finally:
+        _query_context.name = prev
+
+def get_query_context():
+    """Returns the name queries of the current thread are attributed to"""
+    name = getattr(_query_context, 'name', None)
+    return name or threading.current_thread().name
+
+
+class QueryStats(object):
+    """
+    Latency statistics of the executions of an SQL statement. Latencies are
+    counted in buckets growing exponentially from 0.1 ms, so percentiles are
+    reported as the upper bound of the bucket they fall into.
+    """
+
+    buckets = [0.0001 * 2 ** i for i in range(21)]
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.counts = [0] * (len(self.buckets) + 1)
+
+    def add(self, latency):
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+        self.counts[bisect.bisect_left(self.buckets, latency)] += 1
+
+    def percentile(self, p):
+        """Returns the latency under which ``p`` percent of executions fall"""
+        target = self.count * p / 100.
+        seen = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bucket, self.max)
+        return self.max
+
+
 class ngamsDbTimer:
     """
     Small timer class use to measure the time spent for DB access.
     """
 
-    def __init__(self, dbConObj, query):
+    def __init__(self, dbConObj, query, args=()):
         self.__dbConObj = dbConObj
         self.__query = query
+        self.__args = args
 
     def __enter__(self):
         self.__startTime = time.time()
@@ -415,7 +478,7 @@ class ngamsDbTimer:
 
     def __exit__(self, typ, value, traceback):
         deltaTime = (time.time() - self.__startTime)
-        self.__dbConObj.updateDbTime(deltaTime)
+        self.__dbConObj.updateDbTime(deltaTime, self.__query, self.__args)
         logger.debug("DB-TIME: Time spent for DB query: |%s|: %.6fs", self.__query, deltaTime)
 
 def cleanSrvList(srvList):
@@ -560,7 +623,7 @@ class transaction(object):
         sql, args = self.db_core._prepare_query(sql, args)
         cursor = self.cursor
 
-        with ngamsDbTimer(self.db_core, sql):
+        with ngamsDbTimer(self.db_core, sql, args):
 
             # Some drivers complain when an empty argument list/tuple is passed
             # so let's avoid it
@@ -581,6 +644,18 @@ class transaction(object):
                 res = cursor.fetchall()
             return res
 
+    def executemany(self, sql, argsList):
+        """Executes `sql` once for each element of `argsList`"""
+
+        argsList = list(argsList)
+        if not argsList:
+            return
+        logger.debug("Performing SQL query %d times: %s", len(argsList), sql)
+        sql, _ = self.db_core._prepare_query(sql, argsList[0])
+        argsList = [self.db_core._data_to_bind(args) for args in argsList]
+        with ngamsDbTimer(self.db_core, sql, "<%d sets of parameters>" % len(argsList)):
+            self.cursor.executemany(sql, argsList)
+
 class ngamsDbCore(object):
     """
     Core class for the NG/AMS DB interface.
@@ -592,7 +667,8 @@ class ngamsDbCore(object):
                  createSnapshot = 1,
                  maxpoolcons = 6,
                  use_file_ignore=True,
-                 session_sql=None):
+                 session_sql=None,
+                 use_file_digests=False):
         """
         Creates a new ngamsDbCore object using ``interface`` as the underlying
         PEP-249-compliant database connection driver. Connections creation
@@ -607,6 +683,9 @@ class ngamsDbCore(object):
         table. ``use_file_ignore`` controls this behavior to provide
         backwards-compatibility. If true, the code will use "file_ignore" for
         the column name as opposed to "ignore".
+
+        If ``use_file_digests`` is true, the additional digests stored in the
+        "ngas_files_digests" table are also removed when files are deleted.
         """
         T = TRACE()
 
@@ -622,6 +701,12 @@ class ngamsDbCore(object):
         # Timer for analyzing time spent for DB access
         self.__dbAccessTime = 0.0
 
+        # Latency statistics per SQL statement, and threshold for logging
+        # slow queries
+        self.__queryStats = {}
+        self.__queryStatsLock = threading.Lock()
+        self.__slowQueryTime = 0
+
         # Import the DB Interface Plug-In (PEP-249 compliant)
         logger.info("Importing DB Module: %s", interface)
         self.module_name = interface
@@ -630,6 +715,13 @@ class ngamsDbCore(object):
         logger.info("DB Module API Level: %s", self.__dbModule.apilevel)
         self.__paramstyle = self.__dbModule.paramstyle
 
+        # SQL templates already formatted for the paramstyle of the driver,
+        # which saves formatting them again each time they are executed
+        self.__sqlCache = {}
+        self.__sqlCacheHits = 0
+        self.__sqlCacheMisses = 0
+        self.__sqlCacheLock = threading.Lock()
+
         logger.info('Preparing database pool with %d connections. Initial SQL: %s', maxpoolcons, session_sql)
         self.__pool = PooledDB(self.__dbModule,
                                 maxshared = maxpoolcons,
@@ -642,6 +734,7 @@ class ngamsDbCore(object):
 
         self._use_file_ignore = use_file_ignore
         self._file_ignore_columnname = 'file_ignore' if use_file_ignore else 'ignore'
+        self._use_file_digests = use_file_digests
 
     def takeGlobalDbSem(self):
         """
@@ -669,18 +762,64 @@ class ngamsDbCore(object):
         _globalDbSem.release()
 
 
-    def updateDbTime(self, dbAccessTime):
+    def updateDbTime(self, dbAccessTime, query=None, args=()):
         """
-        Update the DB access timer.
+        Update the DB access timer, and the latency statistics of ``query``.
+        If the query took longer than the slow-query threshold it is logged.
 
         dbAccessTime:   DB access time to add in seconds (float).
 
+        query:          SQL statement that was executed (string).
+
+        args:           Parameters of the statement (sequence).
+
         Returns:  Reference to object itself.
         """
         self.__dbAccessTime += dbAccessTime
+        if query is None:
+            return self
+
+        with self.__queryStatsLock:
+            stats = self.__queryStats.get(query)
+            if stats is None:
+                # Statements with values embedded in their text are not
+                # told apart once too many statements have been seen
+                key = query
+                if len(self.__queryStats) >= QUERY_STATS_SIZE:
+                    key = '<other>'
+                stats = self.__queryStats.setdefault(key, QueryStats())
+            stats.add(dbAccessTime)
+
+        if self.__slowQueryTime and dbAccessTime >= self.__slowQueryTime:
+            logger.warning("Slow DB query from %s took %.3f [s]: %s / %r",
+                           get_query_context(), dbAccessTime, query, args)
+        return self
+
+
+    def setSlowQueryTime(self, slowQueryTime):
+        """
+        Set the time above which queries are logged as slow.
+
+        slowQueryTime:  Time in seconds, or 0 to log no queries (float).
+
+        Returns:  Reference to object itself.
+        """
+        self.__slowQueryTime = slowQueryTime
         return self
 
 
+    def getQueryStats(self):
+        """
+        Return the latency statistics of the queries executed so far.
+
+        Returns:  SQL statements and their statistics, sorted by the total
+                  time spent on them (list/(string, QueryStats)).
+        """
+        with self.__queryStatsLock:
+            stats = list(self.__queryStats.items())
+        return sorted(stats, key=lambda x: x[1].total, reverse=True)
+
+
     def getDbTime(self):
         """
         Return the time spent for the last DB access.
@@ -692,11 +831,13 @@ class ngamsDbCore(object):
 
     def resetDbTime(self):
         """
-        Reset the Db timer.
+        Reset the Db timer and the latency statistics of queries.
 
         Returns:    Reference to object itself.
         """
         self.__dbAccessTime = 0.0
+        with self.__queryStatsLock:
+            self.__queryStats = {}
         return self
 
 
@@ -816,17 +957,45 @@ class ngamsDbCore(object):
 
     def _prepare_query(self, sql, args):
 
-        # Depending on the database vendor and its declared paramstyle
-        # we will need to escape '%' literals so they are not considered
-        # a parameter in the query
-        if self.__paramstyle in ('format', 'pyformat') and '%' in sql:
-            sql = sql.replace('%', '%%')
+        key = (sql, len(args) if args else 0)
+        prepared = self.__sqlCache.get(key)
+        with self.__sqlCacheLock:
+            if prepared is not None:
+                self.__sqlCacheHits += 1
+            else:
+                self.__sqlCacheMisses += 1
+
+        if prepared is None:
+            # Depending on the database vendor and its declared paramstyle
+            # we will need to escape '%' literals so they are not considered
+            # a parameter in the query
+            prepared = sql
+            if self.__paramstyle in ('format', 'pyformat') and '%' in prepared:
+                prepared = prepared.replace('%', '%%')
+            if args:
+                prepared = self._format_query(prepared, args)
+
+            # Queries with values embedded in their text could fill the
+            # cache, in which case we start over
+            with self.__sqlCacheLock:
+                if len(self.__sqlCache) >= SQL_CACHE_SIZE:
+                    self.__sqlCache = {}
+                self.__sqlCache[key] = prepared
 
         if args:
-            sql = self._format_query(sql, args)
             args = self._data_to_bind(args)
 
-        return sql, args
+        return prepared, args
+
+    def getSqlCacheStats(self):
+        """
+        Return the number of SQL templates in the cache of formatted SQL,
+        and the number of hits and misses of the cache.
+
+        Returns:    Size, hits and misses (tuple).
+        """
+        with self.__sqlCacheLock:
+            return len(self.__sqlCache), self.__sqlCacheHits, self.__sqlCacheMisses
 
     def transaction(self):
         """Creates a new transaction object and return it"""
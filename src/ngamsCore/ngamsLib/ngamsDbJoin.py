@@ -36,7 +36,9 @@ This class is not supposed to be used standalone in the present implementation.
 It should be used as part of the ngamsDbBase parent classes.
 """
 
+import collections
 import logging
+import sys
 
 from . import ngamsDbm, ngamsDbCore, ngamsLib, ngamsFileInfo
 from .ngamsCore import TRACE, rmFile
@@ -221,7 +223,8 @@ class ngamsDbJoin(ngamsDbCore.ngamsDbCore):
                         domain = None,
                         diskId = None,
                         fileVersion = -1,
-                        cursor = True):
+                        cursor = True,
+                        validators = False):
         """
         Return information about files matching the conditions which are not
         in ignore and which are not marked as bad.
@@ -231,7 +234,7 @@ class ngamsDbJoin(ngamsDbCore.ngamsDbCore):
         The resulting file information will be:
 
           <Host ID>, <Ip Address>, <Port>, <Mountpoint>, <Filename>,
-          <File Version>, <format>
+          <File Version>, <format>[, <Checksum>, <Ingestion Date>]
 
 
         fileId:            ID of file to retrieve (string).
@@ -246,6 +249,9 @@ class ngamsDbJoin(ngamsDbCore.ngamsDbCore):
 
         cursor:            Return DB cursor rather than the results (boolean).
 
+        validators:        Include also the checksum and ingestion date of
+                           the files (boolean).
+
         Returns:           Cursor object (<NG/AMS DB Cursor Object API>).
         """
         T = TRACE(5)
@@ -254,10 +260,12 @@ class ngamsDbJoin(ngamsDbCore.ngamsDbCore):
         vals = []
         sql.append(("SELECT nh.host_id, nh.ip_address, nh.srv_port, "
                    "nd.mount_point, nf.file_name, nf.file_version, "
-                   "nf.format FROM ngas_files nf, ngas_disks nd, ngas_hosts nh "
+                   "nf.format%s FROM ngas_files nf, ngas_disks nd, ngas_hosts nh "
                    "WHERE nf.file_id={} AND nf.disk_id=nd.disk_id AND "
                    "nd.host_id=nh.host_id AND nf.%s=0 AND "
-                   "nf.file_status='00000000'") % (self._file_ignore_columnname,))
+                   "nf.file_status='00000000'") %
+                   (", nf.checksum, nf.ingestion_date" if validators else "",
+                    self._file_ignore_columnname))
         vals.append(fileId)
         if hostId:
             sql.append(" AND nh.host_id={}")
@@ -769,6 +777,74 @@ class ngamsDbJoin(ngamsDbCore.ngamsDbCore):
         return fileInfoDbmName
 
 
+    def _upsertDialect(self):
+        """
+        Returns the flavour of single-statement INSERT-or-UPDATE supported by
+        the database in use, or None if it doesn't support any.
+        """
+        name = self.module_name.lower()
+        if 'psycopg' in name:
+            return 'postgresql'
+        if name == 'sqlite3':
+            # ON CONFLICT was introduced in SQLite 3.24
+            if sys.modules['sqlite3'].sqlite_version_info >= (3, 24, 0):
+                return 'sqlite'
+            return None
+        if 'oracle' in name:
+            return 'oracle'
+        if 'mysql' in name:
+            return 'mysql'
+        return None
+
+
+    def _fileEntryColumns(self):
+        """
+        Returns the columns of ngas_files written for a file, in the order in
+        which their values are bound; the columns identifying the file; and
+        the columns that are updated when the file already has an entry.
+        """
+        cols = ['disk_id', 'file_name', 'file_id', 'file_version', 'format',
+                'file_size', 'uncompressed_file_size', 'compression',
+                'ingestion_date', self._file_ignore_columnname, 'checksum',
+                'checksum_plugin', 'file_status', 'creation_date', 'io_time',
+                'ingestion_rate']
+        keys = ('file_id', 'file_version', 'disk_id')
+        updated = [c for c in cols if c not in keys and c != 'ingestion_date']
+        return cols, keys, updated
+
+
+    def _upsertFileEntrySql(self, dialect):
+        """
+        Returns the statement inserting a row in ngas_files, or updating the
+        existing one for the same file, in the given ``dialect``. Parameters
+        are bound in the same order as in writeFileEntry's INSERT statement.
+        For PostgreSQL the statement returns whether a new row was inserted.
+        """
+        cols, keys, updated = self._fileEntryColumns()
+
+        if dialect == 'oracle':
+            return ("MERGE INTO ngas_files f USING (SELECT %s FROM dual) n "
+                    "ON (%s) WHEN MATCHED THEN UPDATE SET %s "
+                    "WHEN NOT MATCHED THEN INSERT (%s) VALUES (%s)" % (
+                        ', '.join('{} %s' % c for c in cols),
+                        ' AND '.join('f.%s=n.%s' % (c, c) for c in keys),
+                        ', '.join('f.%s=n.%s' % (c, c) for c in updated),
+                        ', '.join(cols),
+                        ', '.join('n.%s' % c for c in cols)))
+
+        sql = "INSERT INTO ngas_files (%s) VALUES (%s)" % (
+            ', '.join(cols), ', '.join('{}' for _ in cols))
+        if dialect == 'mysql':
+            return sql + " ON DUPLICATE KEY UPDATE " +\
+                   ', '.join('%s=VALUES(%s)' % (c, c) for c in updated)
+        sql += " ON CONFLICT (%s) DO UPDATE SET %s" % (
+            ', '.join(keys), ', '.join('%s=excluded.%s' % (c, c) for c in updated))
+        if dialect == 'postgresql':
+            # xmax is 0 only for rows that didn't exist before
+            sql += " RETURNING (xmax = 0)"
+        return sql
+
+
     def writeFileEntry(self,
                        hostId,
                        diskId,
@@ -820,7 +896,24 @@ class ngamsDbJoin(ngamsDbCore.ngamsDbCore):
         vals = []
         sql_str = None
 
-        if (self.fileInDb(diskId, fileId, fileVersion)):
+        # A single INSERT-or-UPDATE statement saves a round trip and the race
+        # between checking and writing. It can be used only for a specific
+        # version, and when we need to know which operation took place
+        # only if the backend can tell us.
+        dialect = self._upsertDialect() if int(fileVersion) != -1 else None
+        needOperation = updateDiskInfo or (self.getCreateDbSnapshot() and genSnapshot)
+        if dialect and (dialect == 'postgresql' or not needOperation):
+            vals = (diskId, filename, fileId, fileVersion, format, fileSize,\
+                    uncompressedFileSize, compression, ingDate, ignore,\
+                    checksum, checksumPlugIn, fileStatus, creDate,\
+                    int(iotime*1000), ingestionRate)
+            res = self.query2(self._upsertFileEntrySql(dialect), args = vals)
+            if res and res[0][0]:
+                dbOperation = NGAMS_DB_CH_FILE_INSERT
+            else:
+                dbOperation = NGAMS_DB_CH_FILE_UPDATE
+
+        elif (self.fileInDb(diskId, fileId, fileVersion)):
             # We only allow to modify a limited set of columns.
             sql.append(("UPDATE ngas_files SET "
                        "file_name={}, format={}, file_size={}, "
@@ -851,7 +944,8 @@ class ngamsDbJoin(ngamsDbCore.ngamsDbCore):
                     int(iotime*1000), ingestionRate)
             dbOperation = NGAMS_DB_CH_FILE_INSERT
 
-        self.query2(sql_str, args = vals)
+        if sql_str:
+            self.query2(sql_str, args = vals)
 
         # Update the Disk Info of the disk concerned if requested and
         # if a new entry was added.
@@ -879,6 +973,114 @@ class ngamsDbJoin(ngamsDbCore.ngamsDbCore):
         self.triggerEvents([diskId, None])
 
 
+    def writeFileEntries(self,
+                         hostId,
+                         fileInfoObjList,
+                         genSnapshot = 1,
+                         updateDiskInfo = 0):
+        """
+        Write the information of many files in the NGAS DB within a single
+        transaction. Like in writeFileEntry, existing entries are updated and
+        new ones are inserted; both are written in bulk.
+
+        A single DB Change Snapshot document is created for the new entries,
+        and another one for the updated entries. The disk statistics are
+        updated once for each disk.
+
+        hostId:           Host ID of the NGAS node (string).
+
+        fileInfoObjList:  File Info Objects with the information of the files,
+                          each one referring to a specific File Version
+                          (list/ngamsFileInfo).
+
+        genSnapshot:      Generate a snapshot file (integer/0|1).
+
+        updateDiskInfo:   Update automatically the disk info for the
+                          disks hosting the new files (integer/0|1).
+
+        Returns:          File Info Objects for which a new entry was
+                          created (list/ngamsFileInfo).
+        """
+        T = TRACE()
+
+        # Only the last information given for each file is written
+        files = collections.OrderedDict()
+        for fileInfo in fileInfoObjList:
+            key = (fileInfo.getDiskId(), fileInfo.getFileId(),
+                   int(fileInfo.getFileVersion()))
+            files.pop(key, None)
+            files[key] = fileInfo
+        if not files:
+            return []
+
+        cols, keys, updated = self._fileEntryColumns()
+        insertSql = "INSERT INTO ngas_files (%s) VALUES (%s)" % (
+            ', '.join(cols), ', '.join('{}' for _ in cols))
+        updateSql = "UPDATE ngas_files SET %s WHERE %s" % (
+            ', '.join('%s={}' % c for c in updated),
+            ' AND '.join('%s={}' % c for c in keys))
+
+        def values(fileInfo):
+            ignore = fileInfo.getIgnore()
+            checksum = fileInfo.getChecksum()
+            return dict(zip(cols, (fileInfo.getDiskId(), fileInfo.getFilename(),
+                fileInfo.getFileId(), fileInfo.getFileVersion(),
+                fileInfo.getFormat(), fileInfo.getFileSize(),
+                fileInfo.getUncompressedFileSize(), fileInfo.getCompression(),
+                self.convertTimeStamp(fileInfo.getIngestionDate()),
+                0 if ignore == -1 else ignore,
+                str(checksum) if checksum else None,
+                fileInfo.getChecksumPlugIn(), fileInfo.getFileStatus(),
+                self.convertTimeStamp(fileInfo.getCreationDate()),
+                int(fileInfo.getIoTime()*1000), fileInfo.getIngestionRate())))
+
+        with self.transaction() as t:
+
+            # Find which files already have an entry, a few at a time
+            fileIds = collections.defaultdict(set)
+            for diskId, fileId, _ in files:
+                fileIds[diskId].add(fileId)
+            existing = set()
+            for diskId, ids in fileIds.items():
+                ids = sorted(ids)
+                for i in range(0, len(ids), 500):
+                    chunk = ids[i:i + 500]
+                    sql = ("SELECT file_id, file_version FROM ngas_files "
+                           "WHERE disk_id={} AND file_id IN (%s)" %
+                           ', '.join('{}' for _ in chunk))
+                    for fileId, fileVersion in t.execute(sql, [diskId] + chunk):
+                        existing.add((diskId, fileId, int(fileVersion)))
+
+            inserted = [f for k, f in files.items() if k not in existing]
+            updatedFiles = [f for k, f in files.items() if k in existing]
+            rows = [values(f) for f in inserted]
+            t.executemany(insertSql, [[r[c] for c in cols] for r in rows])
+            rows = [values(f) for f in updatedFiles]
+            t.executemany(updateSql, [[r[c] for c in updated] +
+                                      [r[c] for c in keys] for r in rows])
+
+        if updateDiskInfo:
+            stats = collections.OrderedDict()
+            for fileInfo in inserted:
+                diskStats = stats.setdefault(fileInfo.getDiskId(), [0, 0])
+                diskStats[0] += 1
+                diskStats[1] += fileInfo.getFileSize()
+            for diskId, (numberOfFiles, bytesStored) in stats.items():
+                self._addDiskStats(diskId, numberOfFiles, bytesStored)
+
+        if (self.getCreateDbSnapshot() and genSnapshot):
+            if inserted:
+                self.createDbFileChangeStatusDoc(hostId, NGAMS_DB_CH_FILE_INSERT,
+                                                 inserted)
+            if updatedFiles:
+                self.createDbFileChangeStatusDoc(hostId, NGAMS_DB_CH_FILE_UPDATE,
+                                                 updatedFiles)
+
+        for diskId in fileIds:
+            self.triggerEvents([diskId, None])
+        return inserted
+
+
     def getClusterReadyArchivingUnits(self,
                                       clusterName):
         """
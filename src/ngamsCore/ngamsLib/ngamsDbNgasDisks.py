@@ -36,6 +36,7 @@ It should be used as part of the ngamsDbBase parent classes.
 """
 
 import logging
+import threading
 
 from . import ngamsDbm, ngamsDbCore, ngamsFileInfo, ngamsDiskInfo
 from .ngamsCore import TRACE, getDiskSpaceAvail, rmFile, NGAMS_DB_CH_FILE_DELETE, fromiso8601
@@ -49,42 +50,160 @@ class ngamsDbNgasDisks(ngamsDbCore.ngamsDbCore):
     Contains queries for accessing the NGAS Disks Table.
     """
 
-    def updateDiskFileStatus(self, diskId, fileSize):
+    def __init__(self, *args, **kwargs):
+        super(ngamsDbNgasDisks, self).__init__(*args, **kwargs)
+
+        # Per-disk changes to number_of_files and bytes_stored which have
+        # not been written to ngas_disks yet, see setDiskStatsFlush
+        self._diskStatsLock = threading.Lock()
+        self._diskStats = {}
+        self._diskStatsFiles = 0
+        self._diskStatsTimer = None
+        self._diskStatsInterval = 0
+        self._diskStatsMaxFiles = 0
+        self._diskMountPoints = {}
+
+
+    def setDiskStatsFlush(self, interval, maxFiles):
         """
-        Update the NGAS Disks Table according to a new file archived.
+        Control how changes to the disk statistics are written to the
+        ngas_disks table.
 
-        diskId:       Disk ID (string).
+        With an ``interval`` of 0 each new file updates its disk's row
+        immediately. Otherwise the changes are accumulated in memory and
+        written at most ``interval`` seconds later, or as soon as
+        ``maxFiles`` new files have been accounted for. In both cases the
+        counters are updated with relative increments, so no locking is
+        needed between concurrent writers.
 
-        fileSize:     Size of file as stored on disk (integer).
+        interval:    Maximum time changes are held in memory (float).
 
-        Returns:      Reference to object itself.
+        maxFiles:    Maximum number of new files held in memory (integer).
+
+        Returns:     Void.
         """
-        T = TRACE()
+        self.flushDiskStats()
+        self._diskStatsInterval = interval
+        self._diskStatsMaxFiles = maxFiles
+
+
+    def _addDiskStats(self, diskId, numberOfFiles, bytesStored):
 
+        if self._diskStatsInterval <= 0:
+            self._writeDiskStats(diskId, numberOfFiles, bytesStored)
+            return
+
+        with self._diskStatsLock:
+            stats = self._diskStats.setdefault(diskId, [0, 0])
+            stats[0] += numberOfFiles
+            stats[1] += bytesStored
+            self._diskStatsFiles += numberOfFiles
+            flush = self._diskStatsFiles >= self._diskStatsMaxFiles
+            if not flush and self._diskStatsTimer is None:
+                self._diskStatsTimer = threading.Timer(self._diskStatsInterval,
+                                                       self._flushDiskStatsTimer)
+                self._diskStatsTimer.daemon = True
+                self._diskStatsTimer.start()
+
+        if flush:
+            self.flushDiskStats()
+
+
+    def _flushDiskStatsTimer(self):
         try:
-            self.takeGlobalDbSem()
-            sql = ("SELECT number_of_files, available_mb, "
-                    "bytes_stored, mount_point "
-                    "FROM ngas_disks WHERE disk_id={}")
+            self.flushDiskStats()
+        except:
+            logger.exception("Error while writing disk statistics")
+
+
+    def flushDiskStats(self, diskId=None):
+        """
+        Write the accumulated disk statistics to the ngas_disks table.
+
+        This also forgets the mount points looked up for the disks
+        concerned, so it should be called when they are unmounted.
+
+        diskId:     Disk ID of the disk to flush, or None to flush all disks
+                    (string|None).
+
+        Returns:    Void.
+        """
+        with self._diskStatsLock:
+            if diskId is None:
+                pending = self._diskStats
+                self._diskStats = {}
+                self._diskMountPoints = {}
+            else:
+                pending = {}
+                if diskId in self._diskStats:
+                    pending[diskId] = self._diskStats.pop(diskId)
+                self._diskMountPoints.pop(diskId, None)
+            self._diskStatsFiles = sum(v[0] for v in self._diskStats.values())
+            if not self._diskStats and self._diskStatsTimer is not None:
+                self._diskStatsTimer.cancel()
+                self._diskStatsTimer = None
+
+        while pending:
+            diskId, (numberOfFiles, bytesStored) = pending.popitem()
+            try:
+                self._writeDiskStats(diskId, numberOfFiles, bytesStored)
+            except:
+                # Keep what couldn't be written for the next attempt
+                pending[diskId] = [numberOfFiles, bytesStored]
+                with self._diskStatsLock:
+                    for diskId, (numberOfFiles, bytesStored) in pending.items():
+                        stats = self._diskStats.setdefault(diskId, [0, 0])
+                        stats[0] += numberOfFiles
+                        stats[1] += bytesStored
+                        self._diskStatsFiles += numberOfFiles
+                raise
+
+
+    def _writeDiskStats(self, diskId, numberOfFiles, bytesStored):
+
+        mountPoint = self._diskMountPoints.get(diskId)
+        if mountPoint is None:
+            sql = "SELECT mount_point FROM ngas_disks WHERE disk_id={}"
             res = self.query2(sql, args = (diskId,))
             if not res:
                 errMsg = "Cannot find entry for disk with ID: %s." % diskId
                 raise Exception(errMsg)
+            mountPoint = self._diskMountPoints[diskId] = res[0][0]
 
-            numberOfFiles = res[0][0]
-            bytesStored = res[0][2]
-            mountPoint = res[0][3]
-            newNumberOfFiles = numberOfFiles + 1
-            newAvailMb = getDiskSpaceAvail(mountPoint)
-            newBytesStored = bytesStored + fileSize
-
-            sql = ("UPDATE ngas_disks SET number_of_files={}, available_mb={},"
-                   " bytes_stored={} WHERE disk_id={}")
-            vals = [newNumberOfFiles, newAvailMb, newBytesStored, diskId]
-            self.query2(sql, args = vals)
-            self.triggerEvents()
-        finally:
-            self.relGlobalDbSem()
+        sql = ("UPDATE ngas_disks SET number_of_files=(number_of_files + {}), "
+               "available_mb={}, bytes_stored=(bytes_stored + {}) "
+               "WHERE disk_id={}")
+        vals = [numberOfFiles, getDiskSpaceAvail(mountPoint), bytesStored, diskId]
+        self.query2(sql, args = vals)
+        self.triggerEvents()
+
+
+    def close(self):
+        """
+        Write the pending disk statistics and close the DB pool.
+
+        Returns:    Void.
+        """
+        try:
+            self.flushDiskStats()
+        except:
+            logger.exception("Error while writing disk statistics")
+        super(ngamsDbNgasDisks, self).close()
+
+
+    def updateDiskFileStatus(self, diskId, fileSize):
+        """
+        Update the NGAS Disks Table according to a new file archived.
+
+        diskId:       Disk ID (string).
+
+        fileSize:     Size of file as stored on disk (integer).
+
+        Returns:      Reference to object itself.
+        """
+        T = TRACE()
+
+        self._addDiskStats(diskId, 1, fileSize)
 
 
     def diskInDb(self, diskId):
@@ -719,8 +838,4 @@ class ngamsDbNgasDisks(ngamsDbCore.ngamsDbCore):
         Update the row for the volume ``diskId`` hosting the new file of size
         ``fileSize``.
         """
-        sqlQuery = "UPDATE ngas_disks SET " +\
-                   "number_of_files=(number_of_files + 1), " +\
-                   "bytes_stored=(bytes_stored + {0}) WHERE " +\
-                   "disk_id={1}"
-        self.query2(sqlQuery, args=(fileSize, diskId))
+        self._addDiskStats(diskId, 1, fileSize)
@@ -281,6 +281,9 @@ class ngamsDbNgasFiles(ngamsDbCore.ngamsDbCore):
 
         sql = "DELETE FROM ngas_files WHERE disk_id={0} AND file_id={1} AND file_version={2}"
         self.query2(sql, args=(diskId, fileId, fileVersion))
+        if self._use_file_digests:
+            sql = "DELETE FROM ngas_files_digests WHERE disk_id={0} AND file_id={1} AND file_version={2}"
+            self.query2(sql, args=(diskId, fileId, fileVersion))
 
         # Create a File Removal Status Document.
         if (self.getCreateDbSnapshot() and genSnapshot):
@@ -448,6 +451,56 @@ class ngamsDbNgasFiles(ngamsDbCore.ngamsDbCore):
         return None
 
 
+    def writeFileDigests(self, diskId, fileId, fileVersion, digests):
+        """
+        Stores the additional digests calculated for a file, replacing any
+        previously stored ones.
+
+        diskId:         ID of disk hosting the file (string).
+
+        fileId:         ID of the file (string).
+
+        fileVersion:    Version of the file (integer)
+
+        digests:        Dictionary with digest names as keys and their
+                        hexadecimal values as values (dict).
+
+        Returns:        Reference to object itself.
+        """
+        T = TRACE()
+        delete = "DELETE FROM ngas_files_digests WHERE disk_id={0} AND file_id={1} AND file_version={2}"
+        insert = ("INSERT INTO ngas_files_digests (disk_id, file_id, file_version, digest_name, digest) "
+                  "VALUES ({0}, {1}, {2}, {3}, {4})")
+        with self.transaction() as t:
+            t.execute(delete, args=(diskId, fileId, fileVersion))
+            for name, value in sorted(digests.items()):
+                t.execute(insert, args=(diskId, fileId, fileVersion, name, value))
+        return self
+
+
+    def getFileDigests(self, fileId, fileVersion, diskId=None):
+        """
+        Get the additional digests stored for a file.
+
+        fileId:         ID of the file (string).
+
+        fileVersion:    Version of the file (integer)
+
+        diskId:         ID of disk hosting the file. If not given, the digests
+                        of any of the copies of the file are returned (string).
+
+        Returns:        Dictionary with digest names as keys and their
+                        hexadecimal values as values (dict).
+        """
+        T = TRACE()
+        sql = "SELECT digest_name, digest FROM ngas_files_digests WHERE file_id={0} AND file_version={1}"
+        args = [fileId, fileVersion]
+        if diskId:
+            sql += " AND disk_id={2}"
+            args.append(diskId)
+        return dict(self.query2(sql, args=args))
+
+
     def getIngDate(self,
                    diskId,
                    fileId,
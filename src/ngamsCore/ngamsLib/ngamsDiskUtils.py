@@ -758,6 +758,7 @@ def markDiskAsUmountedInDb(hostId,
     Returns:     Void.
     """
     logger.info("Marking disk with ID: %s as unmounted in the NGAS DB", diskId)
+    dbConObj.flushDiskStats(diskId)
     diskInfoObj = ngamsDiskInfo.ngamsDiskInfo()
     diskInfoObj.read(dbConObj, diskId).\
                                setHostId("").setSlotId("").setMounted(0).\
@@ -79,6 +79,7 @@ class ngamsFileInfo:
         self.__ioTime               = -1.
         self.__ingestionRate        = -1.
         self.__containerId          = None
+        self.__digests              = {}
 
         # Specific OS info about file.
         self.__permissions          = ""
@@ -111,30 +112,33 @@ class ngamsFileInfo:
         if self.__accDate is not None:
             acc_date = toiso8601(self.__accDate)
 
-        return [["DiskId", self.getDiskId()],
-                ["FileName", self.getFilename()],
-                ["FileId", self.getFileId()],
-                ["FileVersion", self.getFileVersion()],
-                ["Format", self.getFormat()],
-                ["FileSize", self.getFileSize()],
-                ["UncompressedFileSize", self.getUncompressedFileSize()],
-                ["Compression", self.getCompression()],
-                ["IngestionDate", ing_date],
-                ["Ignore", self.getIgnore()],
-                ["Checksum", self.getChecksum()],
-                ["ChecksumPlugIn",self.getChecksumPlugIn()],
-                ["FileStatus", self.getFileStatus()],
-                ["CreationDate", creation_date],
-                ["Tag", self.getTag()],
-                ["Permissions", self.getPermissions()],
-                ["Owner", self.getOwner()],
-                ["Group", self.getGroup()],
-                ["ModificationDate", mod_date],
-                ["AccessDate", acc_date],
-                ["TotalIoTime", self.getIoTime()],
-                ["IngestionRate", self.getIngestionRate()],
-                ["ContainerId", self.getContainerId()]
-                ]
+        objStat = [["DiskId", self.getDiskId()],
+                   ["FileName", self.getFilename()],
+                   ["FileId", self.getFileId()],
+                   ["FileVersion", self.getFileVersion()],
+                   ["Format", self.getFormat()],
+                   ["FileSize", self.getFileSize()],
+                   ["UncompressedFileSize", self.getUncompressedFileSize()],
+                   ["Compression", self.getCompression()],
+                   ["IngestionDate", ing_date],
+                   ["Ignore", self.getIgnore()],
+                   ["Checksum", self.getChecksum()],
+                   ["ChecksumPlugIn",self.getChecksumPlugIn()],
+                   ["FileStatus", self.getFileStatus()],
+                   ["CreationDate", creation_date],
+                   ["Tag", self.getTag()],
+                   ["Permissions", self.getPermissions()],
+                   ["Owner", self.getOwner()],
+                   ["Group", self.getGroup()],
+                   ["ModificationDate", mod_date],
+                   ["AccessDate", acc_date],
+                   ["TotalIoTime", self.getIoTime()],
+                   ["IngestionRate", self.getIngestionRate()],
+                   ["ContainerId", self.getContainerId()]
+                   ]
+        if self.__digests:
+            objStat.append(["Digests", self.getDigestsStr()])
+        return objStat
 
 
     def setDiskId(self,
@@ -652,6 +656,41 @@ class ngamsFileInfo:
         Returns:   Container ID (string).
         """
         return self.__containerId
+
+
+    def setDigests(self,
+                   digests):
+        """
+        Set the additional digests of the file (e.g., sha256), indexed by
+        digest name.
+
+        digests:     dict
+
+        Returns:     Reference to object itself.
+        """
+        if (not digests): return self
+        self.__digests = dict(digests)
+        return self
+
+
+    def getDigests(self):
+        """
+        Get the additional digests of the file, indexed by digest name.
+
+        Returns:   Digests (dict).
+        """
+        return self.__digests
+
+
+    def getDigestsStr(self):
+        """
+        Get the additional digests of the file as a comma-separated list
+        of name:value pairs.
+
+        Returns:   Digests (string).
+        """
+        return ",".join("%s:%s" % (name, self.__digests[name])
+                        for name in sorted(self.__digests))
     ########################################################################
 
 
@@ -838,6 +877,10 @@ class ngamsFileInfo:
                setIngestionRate(getAttribValue(fileNode, "IngestionRate", 1)).\
                setContainerId(getAttribValue(fileNode,   "ContainerId", 1))
 
+        digests = getAttribValue(fileNode, "Digests", 1)
+        if digests:
+            self.setDigests(dict(d.split(":", 1) for d in digests.split(",")))
+
         creation_date = getAttribValue(fileNode, "CreationDate", 1)
         if creation_date:
             self.setCreationDate(fromiso8601(creation_date))
@@ -928,7 +971,8 @@ class ngamsFileInfo:
                setTag(self.getTag()).\
                setIoTime(self.getIoTime()).\
                setIngestionRate(self.getIngestionRate()).\
-               setContainerId(self.getContainerId())
+               setContainerId(self.getContainerId()).\
+               setDigests(self.getDigests())
 
 
 # EOF
@@ -604,7 +604,7 @@ def pingServer(host, port, timeout):
     startTime = time.time()
     while True:
         try:
-            resp = ngamsHttpUtils.httpGet(host, port, NGAMS_STATUS_CMD)
+            resp = ngamsHttpUtils.httpGet(host, port, NGAMS_STATUS_CMD, timeout=timeout)
             with contextlib.closing(resp):
                 if resp.status in (NGAMS_HTTP_SUCCESS, NGAMS_HTTP_UNAUTH):
                     logger.debug("Successfully pinged NG/AMS Server")
@@ -28,13 +28,18 @@ import errno
 import io
 import logging
 import os
+import select
 import socket
+import threading
 import time
 import sys
 
 from six.moves import http_client as httplib  # @UnresolvedImport
 from six.moves.urllib import parse as urlparse  # @UnresolvedImport
 
+from . import ngamsBufferPool
+
+
 logger = logging.getLogger(__name__)
 
 
@@ -74,6 +79,157 @@ def _connect(conn):
             time.sleep(0.001 * ms)
 
 
+_pool_size = 4
+if 'NGAS_HTTP_POOL_SIZE' in os.environ:
+    _pool_size = int(os.environ['NGAS_HTTP_POOL_SIZE'])
+
+class _connection_pool(object):
+    """
+    Idle HTTP connections, per host and port, that can be reused by
+    subsequent requests. Connections are only kept when servers allow it
+    (i.e., when they support HTTP/1.1 persistent connections).
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, host, port):
+        """Returns an idle connection to host:port, or None if there is none"""
+        with self._lock:
+            conns = self._idle.get((host, port), [])
+            while conns:
+                conn = conns.pop()
+                if self._alive(conn):
+                    return conn
+                conn.close()
+        return None
+
+    def put(self, host, port, conn):
+        """Makes `conn` available for reuse"""
+        if conn.sock is None:
+            return
+        with self._lock:
+            conns = self._idle.setdefault((host, port), [])
+            if len(conns) < self.size:
+                conns.append(conn)
+                return
+        conn.close()
+
+    @staticmethod
+    def _alive(conn):
+        # Idle connections should have nothing to read; if they do it's
+        # because the server closed them (or sent something unexpected)
+        if conn.sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([conn.sock], [], [], 0)
+        except (select.error, ValueError, socket.error):
+            return False
+        return not readable
+
+    def clear(self):
+        """Closes all idle connections"""
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+_pool = _connection_pool(_pool_size)
+
+def reset_connection_pool():
+    """
+    Installs a new, empty connection pool. Forked processes call this so they
+    don't share the idle connections (or the lock) of their parent
+    """
+    global _pool
+    _pool = _connection_pool(_pool.size)
+
+class _pooled_response(object):
+    """
+    An HTTP response whose connection is returned to the connection pool
+    once the response has been fully read and closed
+    """
+
+    def __init__(self, resp, conn, host, port):
+        self._resp = resp
+        self._conn = conn
+        self._host = host
+        self._port = port
+
+    def __getattr__(self, name):
+        return getattr(self._resp, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _release_if_done(self):
+        if self._resp.isclosed():
+            self.close()
+
+    def read(self, *args):
+        data = self._resp.read(*args)
+        self._release_if_done()
+        return data
+
+    def readinto(self, b):
+        n = ngamsBufferPool.readinto(self._resp, b)
+        self._release_if_done()
+        return n
+
+    def readline(self, *args):
+        data = self._resp.readline(*args)
+        self._release_if_done()
+        return data
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        resp = self._resp
+        reusable = (not resp.will_close and
+                    (resp.isclosed() or resp.length == 0))
+        resp.close()
+        if reusable:
+            _pool.put(self._host, self._port, conn)
+        else:
+            conn.close()
+
+def _send_request(conn, method, url, data, hdrs):
+    try:
+        conn.request(method, url, body=data, headers=hdrs)
+        logger.debug("%s request sent to, waiting for a response", method)
+    except socket.error as e:
+
+        # If the server closes the connection while we write data
+        # we still try to read the response, if any
+        #
+        # In OSX >= 10.10 this error can come up as EPROTOTYPE instead of EPIPE
+        # (although the error code is not mentioned in send(2)). The actual
+        # error recognised by the kernel in this situation is slightly different,
+        # but still due to remote end closing the connection. For a full, nice
+        # explanation of this see:
+        #
+        # https://erickt.github.io/blog/2014/11/19/adventures-in-debugging-a-potential-osx-kernel-bug/
+        tolerate = e.errno in (errno.EPROTOTYPE, errno.EPIPE)
+        if not tolerate:
+            try:
+                conn.close()
+            except:
+                pass
+            raise
+
+    start = time.time()
+    response = conn.getresponse()
+    logger.debug("Response to %s request received within %.4f [s]", method, time.time() - start)
+    return response
+
 def _http_response(host, port, method, cmd,
                  data=None, timeout=None,
                  pars=[], hdrs={}):
@@ -115,37 +271,50 @@ def _http_response(host, port, method, cmd,
 
     # Go, go, go!
     logger.info("About to %s to %s:%d/%s", method, host, port, url)
+
+    # Reuse an idle connection if possible. Servers can close these at any
+    # time, in which case we try again once on a new connection, but only if
+    # the body of the request can be sent again
+    conn = _pool.get(host, port) if _pool.size > 0 else None
+    if conn is not None:
+        conn.sock.settimeout(timeout)
+        try:
+            response = _send_request(conn, method, url, data, hdrs)
+            return _pooled_response(response, conn, host, port)
+        except (socket.error, httplib.HTTPException):
+            conn.close()
+            if data is not None and not isinstance(data, bytes):
+                raise
+            logger.debug("Reused connection to %s:%d failed, trying a new one", host, port)
+
     conn = httplib.HTTPConnection(host, port, timeout = timeout)
     _connect(conn)
+    response = _send_request(conn, method, url, data, hdrs)
+    if _pool.size > 0:
+        return _pooled_response(response, conn, host, port)
+    return response
 
-    try:
-        conn.request(method, url, body=data, headers=hdrs)
-        logger.debug("%s request sent to, waiting for a response", method)
-    except socket.error as e:
 
-        # If the server closes the connection while we write data
-        # we still try to read the response, if any
-        #
-        # In OSX >= 10.10 this error can come up as EPROTOTYPE instead of EPIPE
-        # (although the error code is not mentioned in send(2)). The actual
-        # error recognised by the kernel in this situation is slightly different,
-        # but still due to remote end closing the connection. For a full, nice
-        # explanation of this see:
-        #
-        # https://erickt.github.io/blog/2014/11/19/adventures-in-debugging-a-potential-osx-kernel-bug/
-        tolerate = e.errno in (errno.EPROTOTYPE, errno.EPIPE)
-        if not tolerate:
-            try:
-                conn.close()
-            except:
-                pass
-            raise
+def httpPostResponse(host, port, cmd, data, mimeType, pars=[], hdrs={},
+                     timeout=None, contDisp=None, auth=None):
+    """
+    Like `httpPost`, but returns an HTTP response object from which the
+    response can be read instead of reading it whole.
+    It is the callers' responsibility to close the response object,
+    which in turn will close the HTTP connection.
+    """
 
-    start = time.time()
-    response = conn.getresponse()
-    logger.debug("Response to %s request received within %.4f [s]", method, time.time() - start)
+    logger.debug("About to POST to %s:%d/%s", host, port, cmd)
 
-    return response
+    # Prepare all headers that need to be sent
+    hdrs = dict(hdrs)
+    hdrs["Content-Type"] = mimeType
+    if contDisp:
+        hdrs["Content-Disposition"] = contDisp
+    if auth:
+        hdrs["Authorization"] = auth.strip()
+
+    return _http_response(host, port, 'POST', cmd, data, timeout, pars, hdrs)
 
 
 def httpPost(host, port, cmd, data, mimeType, pars=[], hdrs={},
@@ -163,17 +332,9 @@ def httpPost(host, port, cmd, data, mimeType, pars=[], hdrs={},
     Additional headers can be passed as a dictionary via `hdrs`.
     """
 
-    logger.debug("About to POST to %s:%d/%s", host, port, cmd)
-
-    # Prepare all headers that need to be sent
-    hdrs = dict(hdrs)
-    hdrs["Content-Type"] = mimeType
-    if contDisp:
-        hdrs["Content-Disposition"] = contDisp
-    if auth:
-        hdrs["Authorization"] = auth.strip()
-
-    resp = _http_response(host, port, 'POST', cmd, data, timeout, pars, hdrs)
+    resp = httpPostResponse(host, port, cmd, data, mimeType, pars=pars,
+                            hdrs=hdrs, timeout=timeout, contDisp=contDisp,
+                            auth=auth)
     with contextlib.closing(resp):
 
         # Receive + unpack reply.
@@ -220,6 +381,19 @@ def httpPostUrl(url, data, mimeType, hdrs={},
                     contDisp=contDisp, auth=auth)
 
 
+def httpPostUrlResponse(url, data, mimeType, hdrs={},
+                        timeout=None, contDisp=None, auth=None):
+    """
+    Like `httpPostResponse` but specifies a HTTP url instead of a combination
+    of host, port and command.
+    """
+    url = urlparse.urlparse(url)
+    pars = [] if not url.query else urlparse.parse_qsl(url.query)
+    return httpPostResponse(url.hostname, url.port, url.path, data, mimeType,
+                            pars=pars, hdrs=hdrs, timeout=timeout,
+                            contDisp=contDisp, auth=auth)
+
+
 def httpGet(host, port, cmd, pars=[], hdrs={},
             timeout=None, auth=None):
     """
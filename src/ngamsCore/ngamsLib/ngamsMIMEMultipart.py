@@ -36,7 +36,7 @@ import time
 
 import six
 
-from . import ngamsContainer, ngamsFileInfo
+from . import ngamsBufferPool, ngamsContainer, ngamsFileInfo
 from .ngamsCore import checkCreatePath
 
 
@@ -79,7 +79,8 @@ class MIMEMultipartHandler(object):
         Method invoked by the parser to pass down the data contained in
         the part currently being parsed. This method might be called more than
         once, and indicates whether more data should be expected to be passed
-        down by the parser.
+        down by the parser. The data is given as a memoryview over the
+        internal buffer of the parser, and is valid only during this call.
 
         In the particular case that this method cannot handle the full
         contents of the data passed down by the parser, it should return
@@ -174,10 +175,12 @@ class FilesystemWriterHandler(ContainerBuilderHandler):
 
     def handleData(self, buf, moreExpected):
         # Write always in _writeBlockSize blocks
-        while len(buf) > self._writeBlockSize:
-            block = buf[:self._writeBlockSize]
-            buf = buf[self._writeBlockSize:]
-            self.timedWrite(block)
+        blockSize = self._writeBlockSize
+        start = 0
+        while len(buf) - start > blockSize:
+            self.timedWrite(buf[start:start + blockSize])
+            start += blockSize
+        buf = buf[start:]
 
         # If the content of this file has finished
         # arriving write the last piece to the file;
@@ -291,143 +294,165 @@ class MIMEMultipartParser(object):
 
     def _recurse(self):
 
+        # Data is read into a buffer from the shared pool and accumulated
+        # into `buf`, from where it is consumed as parsing goes on. This avoids
+        # allocating new objects for each read and for each concatenation of
+        # the data left over by the previous iteration
+        buf = bytearray()
+        self._state = self._ReadingState.headers
+        self._boundary = None
+        self._boundaries = []
+        self._readingFile = False
+
         rdSize = self._readSize
-        readingFile = False
-        state = self._ReadingState.headers
-        prevBuf = None
-        boundary = None
-        boundaries = []
-
-        # Kick the loop of with bytesRead = 1, but stop
-        # if any reading yields 0 bytes
-        bytesRead = 1
-        while True:
-
-            # Don't try to over-read during the last reading
-            if self._bytesToRead < rdSize:
-                rdSize = self._bytesToRead
-
-            # Read, read, read...
-            t = time.time()
-            buf = self._fd.read(rdSize)
-            self._readingTime += (time.time() - t)
-
-            bytesRead = len(buf)
-            self._bytesToRead -= bytesRead
-            self._bytesRead   += bytesRead
-
-            # Anything coming from a previous iteration gets prefixed
-            if prevBuf:
-                buf = prevBuf + buf
-            prevBuf = None
-
-            # On the first stage we read the MIME multipart headers and parse them
-            # If found, we start reading delimiters; otherwise we keep reading data
-            if state == self._ReadingState.headers:
-                idx = buf.find(CRLF + CRLF)
-                if idx != -1:
-                    logger.debug('Processing headers')
-                    headers  = buf[:idx+4]
-                    buf      = buf[idx+4:]
-                    if six.PY3:
-                        msg = email.parser.BytesHeaderParser().parsebytes(headers, headersonly=True)  # @UndefinedVariable
-                    else:
-                        msg = email.parser.HeaderParser().parsestr(headers, headersonly=True)
-
-                    # It's a new container, recurse
-                    mimeType = msg.get_content_type()
-                    if 'multipart/mixed' == mimeType:
-
-                        # Save the current boundary for later
-                        if boundary:
-                            boundaries.append(boundary)
-
-                        boundary      = six.b(msg.get_param('boundary'))
-                        containerName = msg.get_param('container_name')
-                        logger.debug('MIME multipart boundary: %s', boundary)
-
-                        # Fail if we're missing any of these
-                        if not boundary or not containerName:
-                            msg = 'Either \'boundary\' or \'container_name\' are not specified in the Content-Type header'
-                            raise Exception(msg)
-
-                        self._handler.startContainer(containerName)
-                        state = self._ReadingState.delimiter
-
-                    # It's a file within the container
-                    else:
-                        filename = msg.get_filename()
-                        if not filename:
-                            raise Exception('No filename found in internal multipart part header')
-                        state = self._ReadingState.data
-                        self._handler.startFile(filename)
-                        readingFile = True
-
-                # Read more data until we reach the end of the headers
-                else:
-                    prevBuf = buf
-                    continue
-
-            # We can read delimiters either because we've just started
-            # reading the body of the MIME multipart message or because
-            # we just finished reading a particular part of the multipart
-            if state == self._ReadingState.delimiter:
-
-                # We come from reading a previous multipart part
-                if readingFile:
-                    self._handler.endFile()
-                readingFile = False
-
-                # Look for both delimiter and final delimiter
-                delIdx  = buf.find(CRLF + b'--' + boundary + CRLF)
-                fDelIdx = buf.find(CRLF + b'--' + boundary + b'--')
-                if delIdx != -1:
-                    # We don't actually need the delimiter itself
-                    # delimiter = buf[:delIdx + 4 + len(boundary) + 2]
-                    logger.debug('File delimiter found')
-                    buf       = buf[delIdx + 4 + len(boundary) + 2:]
-                    state     = self._ReadingState.headers
-                    prevBuf = buf
-                    continue
-                elif fDelIdx != -1:
-                    # delimiter = buf[:fDelIdx + 4 + len(boundary) + 2]
-                    logger.debug('Final delimiter found')
-                    # Take out the final delimiter and start
-                    # using the previous boundary
-                    self._handler.endContainer()
-                    state = self._ReadingState.delimiter
-                    if boundaries:
-                        boundary = boundaries.pop()
-                        buf = buf[fDelIdx + 4 + len(boundary) + 2:]
-                        prevBuf = buf
-                        continue;
-                    else:
+        with ngamsBufferPool.get_pool(self._readSize).buffer() as rdbuf:
+            while True:
+
+                # Don't try to over-read during the last reading
+                if self._bytesToRead < rdSize:
+                    rdSize = self._bytesToRead
+
+                # Read, read, read...
+                t = time.time()
+                bytesRead = ngamsBufferPool.readinto(self._fd, rdbuf[:rdSize]) if rdSize else 0
+                self._readingTime += (time.time() - t)
+
+                self._bytesToRead -= bytesRead
+                self._bytesRead   += bytesRead
+                buf += rdbuf[:bytesRead]
+
+                # Parse as much as possible from the accumulated data.
+                # Stop when the final delimiter is found, or when nothing
+                # else can be read and parsed
+                progress = False
+                while True:
+                    step_progress = self._step(buf)
+                    if step_progress is None:
+                        return
+                    if not step_progress:
                         break
-                else:
-                    prevBuf = buf
-                    continue
-
-            # When reading data, look for the next delimiter
-            # When found, finish writing data, and pass the
-            # delimiter to the ReadingState.delimiter state
-            if state == self._ReadingState.data:
-                delIdx  = buf.find(CRLF + b'--' + boundary)
-                if delIdx != -1:
-                    logger.debug('Found end of file %s because we found boundary: %s', filename, boundary)
-                    state = self._ReadingState.delimiter
-                    prevBuf = buf[delIdx:]
-                    buf = buf[:delIdx]
-
-                buf = self._handler.handleData(buf, state == self._ReadingState.data)
-                if buf and len(buf):
-                    if prevBuf:
-                        raise Exception('No data should be returned when delimiter has been found')
-                    prevBuf = buf
-
-            # If nothing was read, and nothing
-            # was left for the next iteration, stop
-            if not prevBuf and not bytesRead:
-                break
+                    progress = True
+
+                if not bytesRead and not progress:
+                    break
+
+    def _step(self, buf):
+        """
+        Performs a single parsing step over `buf`, removing from it the data
+        that has been consumed. Returns None if the final delimiter of the
+        root container has been found, or whether any progress was made
+        otherwise.
+        """
+
+        # On the first stage we read the MIME multipart headers and parse them
+        # If found, we start reading delimiters; otherwise we keep reading data
+        if self._state == self._ReadingState.headers:
+            idx = buf.find(CRLF + CRLF)
+            if idx == -1:
+                return False
+
+            logger.debug('Processing headers')
+            headers = bytes(buf[:idx+4])
+            del buf[:idx+4]
+            if six.PY3:
+                msg = email.parser.BytesHeaderParser().parsebytes(headers, headersonly=True)  # @UndefinedVariable
+            else:
+                msg = email.parser.HeaderParser().parsestr(headers, headersonly=True)
+
+            # It's a new container, recurse
+            mimeType = msg.get_content_type()
+            if 'multipart/mixed' == mimeType:
+
+                # Save the current boundary for later
+                if self._boundary:
+                    self._boundaries.append(self._boundary)
+
+                boundary      = msg.get_param('boundary')
+                containerName = msg.get_param('container_name')
+                logger.debug('MIME multipart boundary: %s', boundary)
+
+                # Fail if we're missing any of these
+                if not boundary or not containerName:
+                    msg = 'Either \'boundary\' or \'container_name\' are not specified in the Content-Type header'
+                    raise Exception(msg)
+
+                self._boundary = six.b(boundary)
+                self._handler.startContainer(containerName)
+                self._state = self._ReadingState.delimiter
+
+            # It's a file within the container
+            else:
+                filename = msg.get_filename()
+                if not filename:
+                    raise Exception('No filename found in internal multipart part header')
+                self._filename = filename
+                self._state = self._ReadingState.data
+                self._handler.startFile(filename)
+                self._readingFile = True
+
+            return True
+
+        delimiter = CRLF + b'--' + self._boundary
+
+        # We can read delimiters either because we've just started
+        # reading the body of the MIME multipart message or because
+        # we just finished reading a particular part of the multipart
+        if self._state == self._ReadingState.delimiter:
+
+            # We come from reading a previous multipart part
+            if self._readingFile:
+                self._handler.endFile()
+            self._readingFile = False
+
+            # Look for both delimiter and final delimiter
+            delIdx  = buf.find(delimiter + CRLF)
+            fDelIdx = buf.find(delimiter + b'--')
+            if delIdx != -1:
+                logger.debug('File delimiter found')
+                del buf[:delIdx + len(delimiter) + 2]
+                self._state = self._ReadingState.headers
+                return True
+            elif fDelIdx != -1:
+                logger.debug('Final delimiter found')
+                # Take out the final delimiter and start
+                # using the previous boundary
+                self._handler.endContainer()
+                del buf[:fDelIdx + len(delimiter) + 2]
+                if not self._boundaries:
+                    return None
+                self._boundary = self._boundaries.pop()
+                return True
+            return False
+
+        # When reading data, look for the next delimiter
+        # When found, finish writing data, and pass the
+        # delimiter to the ReadingState.delimiter state.
+        # If not found we hold back enough data to detect a delimiter
+        # that is split across two reads
+        delIdx = buf.find(delimiter)
+        moreExpected = delIdx == -1
+        if moreExpected:
+            end = max(0, len(buf) - len(delimiter) + 1)
+            if not end:
+                return False
+        else:
+            logger.debug('Found end of file %s because we found boundary: %s', self._filename, self._boundary)
+            end = delIdx
+
+        # The handler gets a view over the data, which is released
+        # before the consumed data is removed from the buffer
+        view = memoryview(buf)
+        data = view[:end]
+        remaining = self._handler.handleData(data, moreExpected)
+        remaining = len(remaining) if remaining else 0
+        del view, data
+        if remaining and not moreExpected:
+            raise Exception('No data should be returned when delimiter has been found')
+
+        del buf[:end - remaining]
+        if not moreExpected:
+            self._state = self._ReadingState.delimiter
+        return end > remaining or not moreExpected
 
 
 class BufferedReader(object):
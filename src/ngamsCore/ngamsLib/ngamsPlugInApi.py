@@ -288,6 +288,9 @@ def genFileInfo(dbConObj,
       [<file version>, <relative path>,
        <relative filename>, <complete filename>]
 
+    The version takes into account the versions of files registered by
+    the same request that are not yet in the DB.
+
     dbConObj:          Instance of NG/AMS DB class (ngamsDb).
 
     ngamsCfgObj:       Instance of NG/AMS Configuration class (ngamsConfig).
@@ -397,10 +400,13 @@ def genFileInfoReg(dbConObj,
         noVersioning = int(reqPropsObj.getHttpPar("no_versioning"))
     else:
         noVersioning = 0
+    pendingVersion = reqPropsObj.getPendingFileVersions().get(fileId, -1)
     if (not noVersioning):
         fileVersion = ngamsHighLevelLib.getNewFileVersion(dbConObj, fileId)
+        fileVersion = max(fileVersion, pendingVersion + 1)
     else:
         fileVersion = dbConObj.getLatestFileVersion(fileId)
+        fileVersion = max(fileVersion, pendingVersion)
     if (fileVersion < 1): fileVersion = 1
 
     relPath = filename[(len(hostDiskInfoObj.getMountPoint()) + 1):
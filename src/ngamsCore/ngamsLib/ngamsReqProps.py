@@ -78,6 +78,7 @@ class ngamsReqProps:
         self.__ioTime          = 0
         self.__targDiskInfoObj = None
         self.__noReplication   = 0
+        self.__pendingFileVersions = {}
 
         # To handle the request status.
         self.__requestId             = None
@@ -606,6 +607,30 @@ class ngamsReqProps:
         return self.__noReplication
 
 
+    def setPendingFileVersions(self,
+                               pendingFileVersions):
+        """
+        Set the latest versions of files that are being registered by the
+        same request, but are not yet in the DB.
+
+        pendingFileVersions: Latest version indexed by File ID (dictionary).
+
+        Returns:             Reference to object itself.
+        """
+        self.__pendingFileVersions = pendingFileVersions
+        return self
+
+
+    def getPendingFileVersions(self):
+        """
+        Get the latest versions of files that are being registered by the
+        same request, but are not yet in the DB.
+
+        Returns:  Latest version indexed by File ID (dictionary).
+        """
+        return self.__pendingFileVersions
+
+
     def clone(self):
         """
         Create a clone (exact copy) of this object.
@@ -622,6 +647,7 @@ class ngamsReqProps:
                 setStagingFilename(self.getStagingFilename()).\
                 setTargDiskInfo(self.getTargDiskInfo()).\
                 setNoReplication(self.getNoReplication()).\
+                setPendingFileVersions(self.getPendingFileVersions()).\
                 setRequestId(self.getRequestId()).\
                 setCompletionPercent(self.getCompletionPercent()).\
                 setExpectedCount(self.getExpectedCount()).\
@@ -0,0 +1,9 @@
+CREATE TABLE ngas_files_digests
+(
+  disk_id      VARCHAR(128)  NOT NULL,
+  file_id      VARCHAR(64)   NOT NULL,
+  file_version INT           NOT NULL,
+  digest_name  VARCHAR(32)   NOT NULL,
+  digest       VARCHAR(128)  NOT NULL,
+  CONSTRAINT file_digest_idx PRIMARY KEY(file_id, file_version, disk_id, digest_name)
+);
@@ -128,6 +128,16 @@ create table ngas_files
 );
 ALTER TABLE ngas_files ADD CONSTRAINT file_container FOREIGN KEY (container_id) REFERENCES ngas_containers(container_id);
 
+create table ngas_files_digests
+(
+	disk_id			varchar(128)	not null,
+	file_id			varchar(64)	not null,
+	file_version		int		not null,
+	digest_name		varchar(32)	not null,
+	digest			varchar(128)	not null,
+	constraint file_digest_idx primary key(file_id,file_version,disk_id,digest_name)
+);
+
 create table ngas_hosts
 (
 	host_id 		varchar(32)	not null,
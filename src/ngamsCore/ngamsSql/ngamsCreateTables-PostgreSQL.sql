@@ -33,6 +33,7 @@ DROP TABLE IF EXISTS ngas_cfg_pars;
 DROP TABLE IF EXISTS ngas_disks;
 DROP TABLE IF EXISTS ngas_disks_hist;
 DROP TABLE IF EXISTS ngas_files;
+DROP TABLE IF EXISTS ngas_files_digests;
 DROP TABLE IF EXISTS ngas_containers;
 DROP TABLE IF EXISTS ngas_hosts;
 DROP TABLE IF EXISTS ngas_subscribers;
@@ -139,6 +140,16 @@ create table ngas_files
     CONSTRAINT file_container FOREIGN KEY (container_id) REFERENCES ngas_containers(container_id)
 );
 
+create table ngas_files_digests
+(
+    disk_id                 varchar(128)    not null,
+    file_id                 varchar(64)     not null,
+    file_version            int             not null,
+    digest_name             varchar(32)     not null,
+    digest                  varchar(128)    not null,
+    CONSTRAINT file_digest_idx PRIMARY KEY(file_id, file_version, disk_id, digest_name)
+);
+
 create table ngas_hosts
 (
     host_id               varchar(32)     not null,
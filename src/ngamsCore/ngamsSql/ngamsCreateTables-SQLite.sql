@@ -124,6 +124,17 @@ create table ngas_files
   constraint file_idx primary key(file_id,file_version,disk_id)
 );
 
+drop table if exists ngas_files_digests;
+create table ngas_files_digests
+(
+  disk_id                varchar(128)   not null,
+  file_id                varchar(64)    not null,
+  file_version           int            not null,
+  digest_name            varchar(32)    not null,
+  digest                 varchar(128)   not null,
+  constraint file_digest_idx primary key(file_id,file_version,disk_id,digest_name)
+);
+
 drop table if exists ngas_containers;
 create table ngas_containers
 (
@@ -39,19 +39,22 @@ can be used to build up Python applications communicating with NG/AMS.
 import argparse
 import base64
 import contextlib
+import json
 import logging
 import os
 import random
 import shutil
 import socket
 import sys
+import threading
 import time
+from multiprocessing.pool import ThreadPool
 from xml.dom import minidom
 
 from ngamsLib import ngamsLib, ngamsFileInfo, ngamsStatus, ngamsMIMEMultipart,\
-    ngamsHttpUtils
+    ngamsHttpUtils, ngamsChecksum
 from ngamsLib.ngamsCore import NGAMS_EXIT_CMD, NGAMS_INIT_CMD,\
-    NGAMS_HTTP_SUCCESS
+    NGAMS_HTTP_SUCCESS, NGAMS_HTTP_PARTIAL
 from ngamsLib.ngamsCore import TRACE, NGAMS_ARCHIVE_CMD, NGAMS_REARCHIVE_CMD, NGAMS_HTTP_PAR_FILENAME, NGAMS_HTTP_HDR_FILE_INFO, NGAMS_HTTP_HDR_CONTENT_TYPE, \
     NGAMS_LABEL_CMD, NGAMS_ONLINE_CMD, NGAMS_OFFLINE_CMD, NGAMS_REMDISK_CMD, \
     NGAMS_REMFILE_CMD, NGAMS_REGISTER_CMD, NGAMS_RETRIEVE_CMD, NGAMS_STATUS_CMD, \
@@ -69,6 +72,99 @@ def is_known_pull_url(s):
            s.startswith('https:') or \
            s.startswith('ftp:')
 
+# pwrite(2) is available in python 3.3+ only, otherwise we seek and write
+# under a lock so concurrent writers don't step on each other
+if hasattr(os, 'pwrite'):
+    _pwrite = os.pwrite
+else:
+    _pwrite_lock = threading.Lock()
+    def _pwrite(fd, data, offset):
+        with _pwrite_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.write(fd, data)
+
+class _retrieval_journal(object):
+    """
+    Records which segments of a file being retrieved have been already
+    written to disk, so an interrupted retrieval can continue later on.
+
+    Completed segments are recorded in batches of `batch_size`: before each
+    batch is written into the journal `fd` is synced, so the journal never
+    claims more than what is actually on disk.
+    """
+
+    def __init__(self, fname, file_info, fd=None, batch_size=1):
+        self.fname = fname
+        self.file_info = file_info
+        self.fd = fd
+        self.batch_size = batch_size
+        self.done = set()
+        self._unflushed = set()
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Loads the segments completed by a previous retrieval of the same file,
+        returning whether there were any
+        """
+        try:
+            with open(self.fname) as f:
+                doc = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+        if doc.get('file') != self.file_info:
+            return False
+        self.done = set(tuple(segment) for segment in doc['done'])
+        return True
+
+    def add(self, segment):
+        """Records `segment` as completed, flushing every `batch_size` segments"""
+        with self._lock:
+            self._unflushed.add(segment)
+            if len(self._unflushed) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        """Records all segments completed so far"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._unflushed:
+            return
+        if self.fd is not None:
+            os.fsync(self.fd)
+        self.done |= self._unflushed
+        self._unflushed.clear()
+        tmp = self.fname + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'file': self.file_info, 'done': sorted(self.done)}, f)
+        os.rename(tmp, self.fname)
+
+    def remove(self):
+        if os.path.exists(self.fname):
+            os.unlink(self.fname)
+
+def _verify_checksum(fname, checksum, variant, nthreads):
+    """
+    Checks that the checksum of `fname` is `checksum`. Returns None if the
+    file cannot be verified, either because there is no stored checksum or
+    because its variant is not supported in this system.
+    """
+    if not checksum or not variant:
+        logger.warning("No checksum available for %s, cannot verify it", fname)
+        return None
+    try:
+        crc_info = ngamsChecksum.get_checksum_info(variant)
+    except Exception as e:
+        logger.warning("Cannot verify checksum of %s: %s", fname, str(e))
+        return None
+    if crc_info is None:
+        logger.warning("File %s was stored without checksum, cannot verify it", fname)
+        return None
+    value = ngamsChecksum.get_checksum_parallel(65536, fname, variant, nthreads)
+    return crc_info.equals(value, checksum)
+
 class ngamsPClient:
     """
     Class providing services for sending and receiving commands to/from
@@ -536,7 +632,8 @@ class ngamsPClient:
 
 
     def retrieve(self, fileId, fileVersion=-1, pars=[], hdrs={},
-                 targetFile=None, processing=None, processingPars=None):
+                 targetFile=None, processing=None, processingPars=None,
+                 streams=1):
         """
         Request file `fileId` from the NG/AMS Server, store it locally
         in `targetFile`, and return the result of the operation as an
@@ -548,8 +645,18 @@ class ngamsPClient:
         If `processing` and `processingPars` are given, they are passed down
         as the processing plug-in name and parameters to be applied to the
         retrieved data *on the server side*, respectively.
+        If `streams` is greater than 1 the file is retrieved in segments,
+        that many at a time (see `retrieve_segmented`).
         """
 
+        if streams > 1:
+            if processing:
+                raise ValueError("Processing is not supported when retrieving in segments")
+            return self.retrieve_segmented(fileId, fileVersion=fileVersion,
+                                           pars=pars, hdrs=hdrs,
+                                           targetFile=targetFile,
+                                           streams=streams)
+
         pars = list(pars)
         pars.append(("file_id", fileId))
         if fileVersion != -1:
@@ -565,7 +672,7 @@ class ngamsPClient:
         host_id = "%s:%d" % (host, port)
         with contextlib.closing(resp):
 
-            if resp.status != NGAMS_HTTP_SUCCESS:
+            if resp.status not in (NGAMS_HTTP_SUCCESS, NGAMS_HTTP_PARTIAL):
                 return ngamsStatus.to_status(resp, host_id, 'RETRIEVE')
 
             # If the target path is a directory, take the filename
@@ -586,6 +693,128 @@ class ngamsPClient:
             return ngamsStatus.dummy_success_stat(host_id)
 
 
+    def retrieve_segmented(self, fileId, fileVersion=-1, pars=[], hdrs={},
+                           targetFile=None, streams=4,
+                           segment_size=64 * 1024 * 1024):
+        """
+        Like `retrieve`, but the file is split into segments of up to
+        `segment_size` bytes that are retrieved using HTTP byte ranges,
+        `streams` of them at a time. Segments are spread across the servers
+        this client knows about, and are written in place into `targetFile`.
+
+        Completed segments are recorded in a journal next to `targetFile`,
+        so that retrying an interrupted retrieval continues where it left off.
+        Once all segments are in place the file is verified against its
+        stored checksum; if they don't match a failure status is returned,
+        and if verification is not possible the returned status says the
+        file is unverified.
+        """
+
+        # Find out the size and checksum of the file,
+        # and stick to its version for all segments
+        stat_pars = [('file_id', fileId)]
+        if fileVersion != -1:
+            stat_pars.append(('file_version', str(fileVersion)))
+        stat = self.get_status(NGAMS_STATUS_CMD, pars=stat_pars)
+        if stat.getStatus() == NGAMS_FAILURE:
+            return stat
+        file_info = stat.getDiskStatusList()[0].getFileObjList()[0]
+        size = file_info.getFileSize()
+        checksum = file_info.getChecksum()
+        variant = file_info.getChecksumPlugIn()
+
+        pars = list(pars)
+        pars.append(("file_id", fileId))
+        pars.append(("file_version", str(file_info.getFileVersion())))
+
+        targetFile = targetFile or '.'
+        if os.path.isdir(targetFile):
+            targetFile = os.path.join(targetFile, os.path.basename(file_info.getFilename()))
+
+        journal = _retrieval_journal(targetFile + '.journal',
+                                     {'file_id': fileId,
+                                      'file_version': file_info.getFileVersion(),
+                                      'size': size, 'checksum': checksum,
+                                      'segment_size': segment_size},
+                                     batch_size=streams)
+        resume = os.path.exists(targetFile) and journal.load()
+        segments = [(first, min(first + segment_size, size) - 1)
+                    for first in range(0, size, segment_size)]
+        pending = [(n, s) for n, s in enumerate(segments) if s not in journal.done]
+        if resume:
+            logger.info("Resuming retrieval of %s, %d/%d segments left",
+                        targetFile, len(pending), len(segments))
+
+        flags = os.O_WRONLY | os.O_CREAT | (0 if resume else os.O_TRUNC)
+        fd = os.open(targetFile, flags, 0o644)
+        journal.fd = fd
+        try:
+            if not resume:
+                os.ftruncate(fd, size)
+            pool = ThreadPool(min(streams, len(pending)) or 1)
+            try:
+                pool.map(lambda x: self._retrieve_segment(x[0], x[1], pars, hdrs, fd, journal),
+                         pending)
+            finally:
+                pool.close()
+                # Record whatever made it to disk, even if a segment failed
+                journal.flush()
+            os.fsync(fd)
+        finally:
+            journal.fd = None
+            os.close(fd)
+
+        # The target file is left in place even if it doesn't verify,
+        # but a later retrieval of the same file will start from scratch
+        verified = _verify_checksum(targetFile, checksum, variant, streams)
+        journal.remove()
+        host_id = ','.join('%s:%d' % hp for hp in self.servers)
+        if verified is False:
+            stat = ngamsStatus.dummy_failure_stat(host_id, NGAMS_RETRIEVE_CMD)
+            stat.setMessage("Checksum of retrieved file %s doesn't match the stored one" % targetFile)
+            return stat
+
+        stat = ngamsStatus.dummy_success_stat(host_id)
+        if verified is None:
+            stat.setMessage("Successfully handled request, but the checksum of %s could not be verified" % targetFile)
+        return stat
+
+    def _retrieve_segment(self, n, segment, pars, hdrs, fd, journal):
+        """
+        Retrieves the n-th `segment` of a file into `fd`, trying each
+        server in turn if necessary
+        """
+
+        first, last = segment
+        hdrs = dict(hdrs)
+        hdrs['Range'] = 'bytes=%d-%d' % (first, last)
+
+        servers = list(self.servers)
+        for attempt in range(len(servers) + 1):
+            host, port = servers[(n + attempt) % len(servers)]
+            try:
+                resp = self._do_get(host, port, 'RETRIEVE', pars, hdrs)
+                resp, host, port = self._follow_redirects(resp, host, port, 'RETRIEVE', pars, hdrs)
+                with contextlib.closing(resp):
+                    if resp.status != NGAMS_HTTP_PARTIAL:
+                        raise Exception("Unexpected response from %s:%d: %d %s" %
+                                        (host, port, resp.status, resp.reason))
+                    offset = first
+                    while offset <= last:
+                        data = resp.read(min(65536, last - offset + 1))
+                        if not data:
+                            raise Exception("Connection to %s:%d closed before end of segment" % (host, port))
+                        _pwrite(fd, data, offset)
+                        offset += len(data)
+                break
+            except Exception:
+                if attempt == len(servers):
+                    raise
+                logger.warning("Failed to retrieve bytes %d-%d from %s:%d, retrying",
+                               first, last, host, port, exc_info=True)
+
+        journal.add(segment)
+
     def status(self, pars=[], output=None):
         """
         Request a general status from the NG/AMS Server
@@ -674,7 +903,8 @@ class ngamsPClient:
         host_id = "%s:%d" % (host, port)
 
         # If the reply is a ngamsStatus document read it and return it
-        return ngamsStatus.to_status(resp, host_id, cmd)
+        with contextlib.closing(resp):
+            return ngamsStatus.to_status(resp, host_id, cmd)
 
     def _get(self, cmd, pars=[], hdrs=[]):
         """
@@ -704,6 +934,14 @@ class ngamsPClient:
                 logger.info("Failed to contact server %s:%d, trying next one", host, port)
                 pass
 
+        return self._follow_redirects(resp, host, port, cmd, pars, hdrs)
+
+    def _follow_redirects(self, resp, host, port, cmd, pars=[], hdrs=[]):
+        """
+        Follows the redirections starting at `resp`, which was obtained
+        from `host`:`port`, returning the final response and its origin.
+        """
+
         # Handle redirects, with a maximum of 5
         redirects = 0
         while redirects < 5:
@@ -715,6 +953,7 @@ class ngamsPClient:
             # Get the host + port of the alternative URL, and send
             # the same query again.
             location = resp.getheader('Location')
+            resp.close()
             host, port = location.split("/")[2].split(":")
             port = int(port)
             logger.info("Redirecting to NG/AMS running on %s:%d", host, port)
@@ -839,6 +1078,7 @@ def main():
     parser.add_argument(      '--host-id',       help='The Host ID')
     parser.add_argument(      '--p-plugin',      help='Processing plug-in to apply before retrieving data')
     parser.add_argument(      '--p-plugin-pars', help='Parameters for the processing plug-in, can be specified more than once', action='append')
+    parser.add_argument(      '--streams',       help='Retrieve files in segments, using this many concurrent streams', type=int, default=1)
 
     sparser = parser.add_argument_group('Subscription options')
     sparser.add_argument('-u', '--url',           help='URL to subscribe/unsubscribe')
@@ -930,7 +1170,8 @@ def main():
     elif (cmd == NGAMS_RETRIEVE_CMD):
         stat = client.retrieve(opts.file_id, opts.file_version, pars=pars,
                                targetFile=opts.output, processing=opts.p_plugin,
-                               processingPars=opts.p_plugin_pars)
+                               processingPars=opts.p_plugin_pars,
+                               streams=opts.streams)
     elif (cmd == NGAMS_STATUS_CMD):
         stat = client.status(pars, opts.output)
     elif (cmd == NGAMS_SUBSCRIBE_CMD):
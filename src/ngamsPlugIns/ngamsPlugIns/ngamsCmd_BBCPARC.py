@@ -161,7 +161,7 @@ def bbcp_transfer(request, out_fname, crc_name, skip_crc):
     # Artificially split the total time between read and write (+ 0 crc),
     # we don't actually know how much was spent on what
     half = totaltime / 2
-    return ngamsArchiveUtils.archiving_results(size, half, half, 0, totaltime, crc_name, checksum)
+    return ngamsArchiveUtils.archiving_results(size, half, half, 0, totaltime, crc_name, checksum, {})
 
 
 def handleCmd(srvObj, reqPropsObj, httpRef):
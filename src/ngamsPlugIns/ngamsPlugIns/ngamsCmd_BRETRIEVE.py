@@ -0,0 +1,326 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Function + code to handle the BRETRIEVE Command, which sends back many files
+in a single tar or (uncompressed) zip stream.
+"""
+
+import collections
+import contextlib
+import logging
+import os
+import struct
+import tarfile
+import time
+import zlib
+from multiprocessing.pool import ThreadPool
+from xml.dom import minidom
+
+from ngamsLib.ngamsCore import genLog, getFileSize
+from ngamsLib.ngamsCore import NGAMS_HOST_LOCAL, NGAMS_HTTP_SUCCESS
+from ngamsLib.ngamsCore import NGAMS_RETRIEVE_CMD, NGAMS_ONLINE_STATE, NGAMS_IDLE_SUBSTATE, NGAMS_BUSY_SUBSTATE
+from ngamsLib import ngamsBufferPool, ngamsHttpUtils, io_hints
+from ngamsServer import ngamsSrvUtils, ngamsFileUtils, pysendfile
+
+
+logger = logging.getLogger(__name__)
+
+# A file to be sent back. Local files have a `path`, while files stored in
+# other servers are fetched from `remote`, a (host, port) tuple
+member = collections.namedtuple('member', 'name file_id file_version size mtime path remote')
+
+_TAR_BLOCK = 512
+_ZIP_MAX = 0xFFFFFFFF
+_ZIP_FLAGS = 0x08 | 0x800 # sizes and crc after data, utf-8 names
+
+def _file_ids(srvObj, reqPropsObj, httpRef):
+    """
+    Returns the IDs of the files requested either via the file_id parameter
+    (which can contain wildcards) or via an XML document in the request body
+    """
+
+    if reqPropsObj.is_POST():
+        fileList = minidom.parseString(httpRef.rfile.read(reqPropsObj.getSize()))
+        patterns = [el.getAttribute('FileId') for el in fileList.getElementsByTagName('File')]
+    elif 'file_id' in reqPropsObj and reqPropsObj['file_id'].strip():
+        patterns = [reqPropsObj['file_id'].strip()]
+    else:
+        raise Exception(genLog("NGAMS_ER_RETRIEVE_CMD"))
+
+    file_ids = []
+    seen = set()
+    for pattern in patterns:
+        if '*' not in pattern:
+            ids = [pattern]
+        else:
+            ids = sorted(set(r[2] for r in srvObj.getDb().getFileInfoList('', pattern, ignore=0)))
+        for file_id in ids:
+            if file_id not in seen:
+                seen.add(file_id)
+                file_ids.append(file_id)
+    return file_ids
+
+def _member(srvObj, reqPropsObj, fileId, fileVersion):
+
+    location, _, ipAddress, port, mountPoint, filename, fileId,\
+              fileVersion, _ =\
+              ngamsFileUtils.locateArchiveFile(srvObj, fileId,
+                                               fileVersion=fileVersion,
+                                               reqPropsObj=reqPropsObj)
+
+    name = os.path.basename(filename)
+    if location == NGAMS_HOST_LOCAL:
+        path = os.path.normpath(os.path.join(mountPoint, filename))
+        return member(name, fileId, fileVersion, getFileSize(path),
+                      int(os.path.getmtime(path)), path, None)
+
+    size = srvObj.getDb().getFileSize(fileId, fileVersion)
+    return member(name, fileId, fileVersion, size, int(time.time()),
+                  None, (ipAddress, port))
+
+def _tar_header(m):
+    info = tarfile.TarInfo(m.name)
+    info.size = m.size
+    info.mtime = m.mtime
+    info.mode = 0o644
+    return info.tobuf(tarfile.PAX_FORMAT)
+
+def _tar_padding(size):
+    return b'\0' * (-size % _TAR_BLOCK)
+
+def _dos_datetime(mtime):
+    t = time.localtime(mtime)
+    dostime = t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2
+    dosdate = (max(t.tm_year, 1980) - 1980) << 9 | t.tm_mon << 5 | t.tm_mday
+    return dostime, dosdate
+
+def _zip_local_header(m):
+    name = m.name.encode('utf-8')
+    dostime, dosdate = _dos_datetime(m.mtime)
+    return struct.pack('<4s5H3L2H', b'PK\x03\x04', 20, _ZIP_FLAGS, 0,
+                       dostime, dosdate, 0, 0, 0, len(name), 0) + name
+
+def _zip_data_descriptor(m, crc):
+    return struct.pack('<4s3L', b'PK\x07\x08', crc, m.size, m.size)
+
+def _zip_central_directory(members, crcs, offsets, cdir_offset):
+    entries = []
+    for m, crc, offset in zip(members, crcs, offsets):
+        name = m.name.encode('utf-8')
+        dostime, dosdate = _dos_datetime(m.mtime)
+        entries.append(struct.pack('<4s6H3L5H2L', b'PK\x01\x02', 20, 20,
+                                   _ZIP_FLAGS, 0, dostime, dosdate, crc,
+                                   m.size, m.size, len(name), 0, 0, 0, 0,
+                                   0o100644 << 16, offset) + name)
+    cdir = b''.join(entries)
+    eocd = struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, len(members),
+                       len(members), len(cdir), cdir_offset, 0)
+    return cdir + eocd
+
+def _zip_length(members):
+    local = sum(len(_zip_local_header(m)) + m.size + 16 for m in members)
+    cdir = sum(46 + len(m.name.encode('utf-8')) for m in members)
+    return local, local + cdir + 22
+
+class _remote_fetcher(object):
+    """
+    Opens RETRIEVE requests for the remote members of the batch ahead of time,
+    keeping at most `concurrency` of them open at any given time.
+    """
+
+    def __init__(self, srvObj, members, concurrency):
+        self.srvObj = srvObj
+        self.remote = collections.deque(m for m in members if m.remote)
+        self.pending = collections.deque()
+        self.concurrency = concurrency
+        self.pool = ThreadPool(concurrency) if self.remote else None
+        self._fill()
+
+    def _open(self, m):
+        host, port = m.remote
+        pars = [('file_id', m.file_id), ('file_version', m.file_version)]
+        authHdr = ngamsSrvUtils.genIntAuthHdr(self.srvObj)
+        return ngamsHttpUtils.httpGet(host, port, NGAMS_RETRIEVE_CMD, pars=pars,
+                                      timeout=30, auth=authHdr)
+
+    def _fill(self):
+        while self.remote and len(self.pending) < self.concurrency:
+            m = self.remote.popleft()
+            self.pending.append((m, self.pool.apply_async(self._open, (m,))))
+
+    def next(self, m):
+        """Returns the response carrying the contents of remote member `m`"""
+        pending_m, result = self.pending.popleft()
+        assert pending_m is m
+        self._fill()
+        resp = result.get()
+        if resp.status != NGAMS_HTTP_SUCCESS:
+            resp.close()
+            raise Exception("Error retrieving %s from %s:%d, status: %d" % (m.file_id, m.remote[0], m.remote[1], resp.status))
+        return resp
+
+    def close(self):
+        if not self.pool:
+            return
+        for _, result in self.pending:
+            try:
+                result.get().close()
+            except:
+                pass
+        self.pool.close()
+
+def _send_member(httpRef, fetcher, m, buf, crc=None):
+    """
+    Sends the contents of `m`. Local files are sent with sendfile(2) unless
+    their crc needs to be calculated. The crc is returned when requested.
+    """
+
+    # Hints apply only to local files
+    cfg = httpRef.ngasServer.cfg
+    def hints(f):
+        return io_hints.sequential_read(f, 0, m.size,
+                                        enabled=m.path and cfg.getIoHints(),
+                                        drop=cfg.getDropCacheAfterRetrieve())
+
+    if m.path and crc is None:
+        with open(m.path, 'rb') as f, hints(f):
+            sent = pysendfile.sendfile(httpRef.connection, f, 0, m.size)
+    else:
+        if m.path:
+            f = open(m.path, 'rb')
+        else:
+            f = fetcher.next(m)
+        sent = 0
+        with contextlib.closing(f), hints(f):
+            while True:
+                n = ngamsBufferPool.readinto(f, buf)
+                if not n:
+                    break
+                if crc is not None:
+                    crc = zlib.crc32(buf[:n], crc)
+                httpRef.connection.sendall(buf[:n])
+                sent += n
+    if sent != m.size:
+        raise Exception("Sent %d bytes for %s but expected %d" % (sent, m.file_id, m.size))
+    return crc & 0xFFFFFFFF if crc is not None else None
+
+def _handleCmdBRetrieve(srvObj, reqPropsObj, httpRef):
+
+    if (not srvObj.getCfg().getAllowRetrieveReq()):
+        errMsg = genLog("NGAMS_ER_ILL_REQ", ["Retrieve"])
+        raise Exception(errMsg)
+
+    fmt = reqPropsObj['format'] if 'format' in reqPropsObj else 'tar'
+    if fmt not in ('tar', 'zip'):
+        raise Exception("Unsupported format: %s, use tar or zip" % fmt)
+
+    fileVersion = -1
+    if 'file_version' in reqPropsObj:
+        fileVersion = int(reqPropsObj['file_version'])
+
+    # All files are located before sending anything, so we can tell the
+    # client beforehand how much data will be sent
+    file_ids = _file_ids(srvObj, reqPropsObj, httpRef)
+    if not file_ids:
+        raise Exception("No files found matching the request")
+    members = [_member(srvObj, reqPropsObj, file_id, fileVersion)
+               for file_id in file_ids]
+
+    if fmt == 'tar':
+        size = sum(len(_tar_header(m)) + m.size + len(_tar_padding(m.size))
+                   for m in members) + 2 * _TAR_BLOCK
+        mime_type = 'application/x-tar'
+    else:
+        cdir_offset, size = _zip_length(members)
+        if cdir_offset > _ZIP_MAX or len(members) > 0xFFFF:
+            raise Exception("Too much data for a zip stream, use the tar format instead")
+        mime_type = 'application/zip'
+
+    logger.info("Sending %d files (%d bytes) as a %s stream", len(members), size, fmt)
+    hdrs = {'Content-Type': mime_type, 'Content-Length': str(size),
+            'Content-Disposition': 'attachment; filename="files.%s"' % fmt}
+    httpRef.send_response(NGAMS_HTTP_SUCCESS, hdrs=hdrs)
+    httpRef.end_headers()
+    httpRef.wfile.flush()
+
+    concurrency = max(1, srvObj.getCfg().getBatchRetrieveConcurrency())
+    fetcher = _remote_fetcher(srvObj, members, concurrency)
+    pool = ngamsBufferPool.get_pool(srvObj.getCfg().getBlockSize())
+    try:
+        with pool.buffer() as buf:
+            st = time.time()
+            crcs, offsets, offset = [], [], 0
+            for m in members:
+                if fmt == 'tar':
+                    httpRef.connection.sendall(_tar_header(m))
+                    _send_member(httpRef, fetcher, m, buf)
+                    httpRef.connection.sendall(_tar_padding(m.size))
+                else:
+                    header = _zip_local_header(m)
+                    httpRef.connection.sendall(header)
+                    crc = _send_member(httpRef, fetcher, m, buf, crc=0)
+                    httpRef.connection.sendall(_zip_data_descriptor(m, crc))
+                    crcs.append(crc)
+                    offsets.append(offset)
+                    offset += len(header) + m.size + 16
+            if fmt == 'tar':
+                httpRef.connection.sendall(b'\0' * 2 * _TAR_BLOCK)
+            else:
+                httpRef.connection.sendall(_zip_central_directory(members, crcs, offsets, offset))
+            howlong = time.time() - st
+        logger.info("Sent %d files at %.3f [MB/s]", len(members),
+                    size / 1024. / 1024. / max(howlong, 1e-6))
+    except:
+        # The client cannot make sense of what follows
+        httpRef.close_connection = True
+        raise
+    finally:
+        fetcher.close()
+
+
+def handleCmd(srvObj, reqPropsObj, httpRef):
+    """
+    Handle a BRETRIEVE command.
+
+    srvObj:         Reference to NG/AMS server class object (ngamsServer).
+
+    reqPropsObj:    Request Property object to keep track of
+                    actions done during the request handling
+                    (ngamsReqProps).
+
+    httpRef:        Reference to the HTTP request handler
+                    object (ngamsHttpRequestHandler).
+
+    Returns:        Void.
+    """
+
+    srvObj.checkSetState("Command BRETRIEVE", [NGAMS_ONLINE_STATE],
+                         [NGAMS_IDLE_SUBSTATE, NGAMS_BUSY_SUBSTATE],
+                         "", NGAMS_BUSY_SUBSTATE)
+
+    try:
+        _handleCmdBRetrieve(srvObj, reqPropsObj, httpRef)
+    finally:
+        srvObj.setSubState(NGAMS_IDLE_SUBSTATE)
+
+
+# EOF
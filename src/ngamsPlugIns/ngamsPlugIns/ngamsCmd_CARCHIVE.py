@@ -247,6 +247,7 @@ def handleCmd(srvObj,
     logger.debug("Generate file information")
     dateDir = toiso8601(fmt=FMT_DATE_ONLY)
     resDapiList = []
+    fileInfoList = []
 
     containerSizes = {}
 
@@ -305,8 +306,7 @@ def handleCmd(srvObj,
         if reqPropsObj.getFileUri().count("file_version"):
             file_version = int((reqPropsObj.getFileUri().split("file_version=")[1]).split("&")[0])
 
-        # Check/generate remaining file info + update in DB.
-        logger.debug("Creating db entry")
+        # Check/generate remaining file info.
         creDate = getFileCreationTime(resDapi.getCompleteFilename())
         fileInfo = ngamsFileInfo.ngamsFileInfo().\
                    setDiskId(resDapi.getDiskId()).\
@@ -322,14 +322,7 @@ def handleCmd(srvObj,
                    setFileStatus(NGAMS_FILE_STATUS_OK).\
                    setCreationDate(creDate).\
                    setIoTime(reqPropsObj.getIoTime())
-        fileInfo.write(srvObj.getHostId(), srvObj.getDb())
-
-        # Add the file to the container
-        srvObj.getDb().addFileToContainer(containerId, resDapi.getFileId(), True)
-
-        # Update the container sizes
-        for contSizeInfo in containerSizes.items():
-            srvObj.getDb().setContainerSize(contSizeInfo[0], contSizeInfo[1])
+        fileInfoList.append((fileInfo, containerId))
 
         # Inform the caching service about the new file.
         logger.debug("Inform the caching service about the new file.")
@@ -341,12 +334,20 @@ def handleCmd(srvObj,
             ngamsCacheControlThread.addEntryNewFilesDbm(srvObj, diskId, fileId,
                                                        fileVersion, filename)
 
-        # Update disk info in NGAS Disks.
-        logger.debug("Update disk info in NGAS Disks.")
-        srvObj.getDb().updateDiskInfo(resDapi.getFileSize(), resDapi.getDiskId())
-
         resDapiList.append(resDapi)
 
+    # Write all file entries and update the disk info in NGAS Disks at once,
+    # then add the files to their containers and update the container sizes.
+    logger.debug("Creating db entries")
+    srvObj.getDb().writeFileEntries(srvObj.getHostId(),
+                                    [f for f, _ in fileInfoList],
+                                    updateDiskInfo=1)
+    for fileInfo, containerId in fileInfoList:
+        srvObj.getDb().addFileToContainer(containerId, fileInfo.getFileId(), True)
+        srvObj.location_cache.invalidate(fileInfo.getFileId())
+    for contSizeInfo in containerSizes.items():
+        srvObj.getDb().setContainerSize(contSizeInfo[0], contSizeInfo[1])
+
     # Check if the disk is completed.
     # We use an approximate extimate for the remaning disk space to avoid
     # to read the DB.
@@ -101,7 +101,7 @@ def saveToFile(srvObj,
         'file_version': file_version,
         'file_id': file_id
     }
-    hdrs = {'Range': str(startByte) + '-'}
+    hdrs = {'Range': 'bytes=%d-' % startByte}
 
     rx_timeout = 30 * 60
     if srvObj.getCfg().getVal("Mirroring[1].rx_timeout"):
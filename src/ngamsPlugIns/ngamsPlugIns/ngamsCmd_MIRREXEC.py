@@ -140,11 +140,8 @@ def get_cluster_name(srvObj):
     RETURNS:
         cluster_name    string, name of the cluster corresponding to the input host_id
     """
-    # Execute query
-    query = "select cluster_name from ngas_hosts where host_id={0}"
-    logger.debug("Executing SQL query to get local cluster name: %s", query)
-    cluster_name = srvObj.getDb().query2(query, args=(srvObj.getHostId(),))
-    cluster_name = str(cluster_name[0][0])
+    cluster_name = srvObj.host_topology.get(srvObj.getHostId()).getClusterName()
+    cluster_name = str(cluster_name)
     logger.debug("Local cluster name: %s", cluster_name)
 
     # Return cluster_name
@@ -0,0 +1,158 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Classes implementing the durability policies applied to archived files
+before they are registered in the database
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+_datasync = getattr(os, 'fdatasync', os.fsync)
+
+def _load_libc_function(name):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        return getattr(libc, name)
+    except (OSError, AttributeError):
+        return None
+
+# syncfs(2) is Linux-specific and not exposed by the os module;
+# elsewhere we flush all volumes, which is coarser but still correct
+_syncfs = _load_libc_function('syncfs')
+_syncall = getattr(os, 'sync', None) or _load_libc_function('sync')
+
+def _sync(path, syncfunc):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        syncfunc(fd)
+    finally:
+        os.close(fd)
+
+def _do_syncfs(fd):
+    if _syncfs(fd) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+def sync_file(filename):
+    """Flushes the data of `filename` to disk"""
+    _sync(filename, _datasync)
+
+def sync_dir(dirname):
+    """Flushes the entries of directory `dirname` to disk"""
+    _sync(dirname, os.fsync)
+
+def sync_volume(path):
+    """Flushes all the data of the volume containing `path` to disk"""
+    if _syncfs is not None:
+        _sync(path, _do_syncfs)
+    else:
+        _syncall()
+
+
+class NoSync(object):
+    """A policy that doesn't flush files, only checks they are accessible"""
+
+    def sync(self, filename):
+        os.stat(filename)
+
+class FileSync(object):
+    """A policy that flushes each file (and its directory) individually"""
+
+    def sync(self, filename):
+        sync_file(filename)
+        sync_dir(os.path.dirname(filename))
+
+class _commit_batch(object):
+    """A group of files waiting to be flushed together"""
+
+    def __init__(self):
+        self.filenames = []
+        self.errors = {}
+        self.done = threading.Event()
+
+class GroupCommitSync(object):
+    """
+    A policy that flushes files in groups. The first file to be synced on a
+    given volume waits `window` seconds for other files on the same volume to
+    be synced, then flushes the whole volume once (and the directories of the
+    files, once each) and wakes up their callers.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def sync(self, filename):
+
+        dev = os.stat(filename).st_dev
+        with self._lock:
+            batch = self._batches.get(dev)
+            leader = batch is None
+            if leader:
+                batch = self._batches[dev] = _commit_batch()
+            batch.filenames.append(filename)
+
+        if not leader:
+            batch.done.wait()
+        else:
+            time.sleep(self.window)
+            with self._lock:
+                del self._batches[dev]
+            try:
+                self._commit(batch)
+            finally:
+                batch.done.set()
+
+        if filename in batch.errors:
+            raise batch.errors[filename]
+
+    def _commit(self, batch):
+
+        start = time.time()
+        try:
+            sync_volume(batch.filenames[0])
+        except Exception as e:
+            for filename in batch.filenames:
+                batch.errors[filename] = e
+            return
+
+        dirs = {}
+        for filename in batch.filenames:
+            dirs.setdefault(os.path.dirname(filename), []).append(filename)
+        for dirname, filenames in dirs.items():
+            try:
+                sync_dir(dirname)
+            except Exception as e:
+                for filename in filenames:
+                    batch.errors.setdefault(filename, e)
+
+        logger.debug("Flushed volume with %d files in %d directories in %.3f [s]",
+                     len(batch.filenames), len(dirs), time.time() - start)
@@ -0,0 +1,159 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+A cache of the hosts registered in the ngas_hosts table, sparing the database
+from the same lookups every time files are located in the system
+"""
+
+import threading
+import time
+
+from ngamsLib import ngamsHighLevelLib, ngamsHostInfo
+from .location_cache import NegativeCache
+from ngamsLib.ngamsCore import genLog, NGAMS_HOST_LOCAL, NGAMS_HOST_CLUSTER, \
+    NGAMS_HOST_DOMAIN, NGAMS_HOST_REMOTE
+
+
+class HostTopology(object):
+    """
+    The hosts of the ngas_hosts table, together with their location relative
+    to host `local_host_id` and the address that must be contacted to reach
+    them. The table is reloaded every `refresh_period` seconds, or after
+    `invalidate` is called. Hosts that are not found in the table don't cause
+    it to be reloaded again during the following `miss_ttl` seconds. A
+    `refresh_period` of 0 disables the cache, and the database is queried
+    every time.
+    """
+
+    def __init__(self, db, local_host_id, refresh_period, miss_ttl=10):
+        self.db = db
+        self.local_host_id = local_host_id
+        self.refresh_period = refresh_period
+        self._hosts = None
+        self._resolved = None
+        self._loaded_at = 0
+        self._misses = NegativeCache(miss_ttl)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.refresh_period > 0
+
+    def _load(self):
+        hosts = {}
+        for sql_info in self.db.getAllHostInfo():
+            hi = ngamsHostInfo.ngamsHostInfo().unpackFromSqlQuery(sql_info)
+            hosts[hi.getHostId()] = hi
+        resolved = {}
+        for host_id, hi in hosts.items():
+            try:
+                resolved[host_id] = self._resolve(hi, hosts)
+            except Exception as e:
+                resolved[host_id] = e
+        self._hosts = hosts
+        self._resolved = resolved
+        self._loaded_at = time.time()
+
+    def _resolve(self, hi, hosts):
+        # Same rules as ngamsHighLevelLib.resolveHostAddress
+        if self.local_host_id not in hosts:
+            raise Exception(genLog("NGAMS_AL_MIS_HOST", [self.local_host_id]))
+        local = hosts[self.local_host_id]
+        hi = hi.clone()
+        if hi.getHostId() == self.local_host_id:
+            return hi.setHostType(NGAMS_HOST_LOCAL)
+        elif hi.getClusterName() == local.getClusterName():
+            return hi.setHostType(NGAMS_HOST_CLUSTER)
+
+        cluster_name = hi.getClusterName()
+        if hi.getDomain() == local.getDomain():
+            host_type = NGAMS_HOST_DOMAIN
+            if cluster_name is None or cluster_name.strip() == "":
+                raise Exception("No Cluster Name specified in NGAS DB for " +\
+                                "host: " + hi.getHostId())
+        else:
+            host_type = NGAMS_HOST_REMOTE
+        if cluster_name not in hosts:
+            raise Exception(genLog("NGAMS_AL_MIS_HOST", [cluster_name]))
+        master = hosts[cluster_name]
+        return hi.setHostType(host_type).\
+                  setHostId(master.getHostId()).\
+                  setIpAddress(master.getIpAddress())
+
+    def _lookup(self, table_name, host_ids):
+        # Returns the requested table, reloading it if it is too old or
+        # doesn't know about some of the hosts (unless they were recently
+        # found to be missing already)
+        with self._lock:
+            expired = time.time() - self._loaded_at > self.refresh_period
+            if self._hosts is None or expired:
+                self._load()
+            elif any(h not in self._hosts and h not in self._misses for h in host_ids):
+                self._load()
+            for h in host_ids:
+                if h not in self._hosts:
+                    self._misses.add(h)
+            return getattr(self, table_name)
+
+    def invalidate(self):
+        """Forces the hosts to be reloaded the next time they are needed"""
+        with self._lock:
+            self._hosts = self._resolved = None
+            self._misses.clear()
+
+    def get(self, host_id):
+        """
+        Returns the ngamsHostInfo object for host `host_id` as found in
+        ngas_hosts
+        """
+        if not self.enabled:
+            res = self.db.getHostInfoFromHostIds([host_id])
+            if not res:
+                raise Exception(genLog("NGAMS_AL_MIS_HOST", [host_id]))
+            return ngamsHostInfo.ngamsHostInfo().unpackFromSqlQuery(res[0])
+
+        hosts = self._lookup('_hosts', [host_id])
+        if host_id not in hosts:
+            raise Exception(genLog("NGAMS_AL_MIS_HOST", [host_id]))
+        return hosts[host_id].clone()
+
+    def resolve(self, host_ids):
+        """
+        Like ngamsHighLevelLib.resolveHostAddress, returns a dictionary with
+        an ngamsHostInfo object for each of the given hosts, indicating its
+        location and the address that should be contacted to reach it.
+        """
+        if not self.enabled:
+            return ngamsHighLevelLib.resolveHostAddress(self.local_host_id,
+                                                        self.db, None, host_ids)
+
+        host_ids = list(host_ids)
+        resolved = self._lookup('_resolved', host_ids)
+        host_dic = {}
+        for host_id in host_ids:
+            hi = resolved.get(host_id)
+            if hi is None:
+                raise Exception(genLog("NGAMS_AL_MIS_HOST", [host_id]))
+            elif isinstance(hi, Exception):
+                raise hi
+            host_dic[host_id] = hi.clone()
+        return host_dic
@@ -0,0 +1,131 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Caches of file locations, sparing the database (and possibly other servers)
+from the same lookups when files are requested repeatedly
+"""
+
+import collections
+import threading
+import time
+
+
+class LocationCache(object):
+    """
+    A least-recently-used cache holding up to `size` file locations during
+    `ttl` seconds. Entries are keyed by tuples whose first element is the
+    ID of the file they refer to. A `size` of 0 disables the cache.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._keys_by_file_id = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the location cached under `key`, or None if there is none"""
+        if not self.size:
+            return None
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                if entry is not None:
+                    self._unindex(key)
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            return list(entry[1])
+
+    def put(self, key, location):
+        """Caches `location` under `key`"""
+        if not self.size:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time(), list(location))
+            self._keys_by_file_id.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.size:
+                self._unindex(self._entries.popitem(last=False)[0])
+
+    def invalidate(self, file_id):
+        """Forgets all locations of file `file_id`"""
+        with self._lock:
+            for key in self._keys_by_file_id.pop(file_id, ()):
+                del self._entries[key]
+
+    def clear(self):
+        """Forgets all locations"""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_file_id.clear()
+
+    def _unindex(self, key):
+        keys = self._keys_by_file_id.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_file_id[key[0]]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class NegativeCache(object):
+    """
+    A set of keys (e.g., hosts that couldn't be reached) that are forgotten
+    after `ttl` seconds. A `ttl` of 0 disables the cache.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def add(self, key):
+        """Remembers `key` for the next `ttl` seconds"""
+        if not self.ttl:
+            return
+        with self._lock:
+            self._entries[key] = time.time() + self.ttl
+
+    def __contains__(self, key):
+        with self._lock:
+            expires_at = self._entries.get(key)
+            if expires_at is None:
+                return False
+            if time.time() > expires_at:
+                del self._entries[key]
+                return False
+            return True
+
+    def clear(self):
+        """Forgets all keys"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -33,15 +33,23 @@ the file archiving.
 """
 import collections
 import contextlib
+import errno
+import fcntl
 import glob
 import logging
 import os
 import random
+import select
+import socket
+import sys
+import threading
 import time
 
+import six
 from six.moves.urllib import parse as urlparse # @UnresolvedImport
 from six.moves.urllib import request as urlrequest # @UnresolvedImport
 from six.moves import cPickle # @UnresolvedImport
+from six.moves import queue as Queue # @UnresolvedImport
 
 from ngamsLib.ngamsCore import NGAMS_FAILURE, getFileCreationTime,\
     NGAMS_FILE_STATUS_OK, TRACE, NGAMS_NOTIF_DISK_SPACE,\
@@ -55,6 +63,7 @@ from ngamsLib.ngamsCore import NGAMS_FAILURE, getFileCreationTime,\
 from ngamsLib import ngamsHighLevelLib, ngamsNotification, ngamsPlugInApi, ngamsLib,\
     ngamsHttpUtils
 from ngamsLib import ngamsReqProps, ngamsFileInfo, ngamsDiskInfo, ngamsStatus, ngamsDiskUtils
+from ngamsLib import ngamsBufferPool
 from . import ngamsFileUtils
 from . import ngamsCacheControlThread
 
@@ -67,6 +76,10 @@ _diskSpaceWarningDic = {}
 VOLUME_STRATEGY_RANDOM = 0
 VOLUME_STRATEGY_STREAMS = 1
 
+# Number of files whose entries are written together by commands handling
+# many files at once (e.g., REGISTER, CLONE)
+FILE_ENTRIES_BATCH_SIZE = 1000
+
 class PluginNotFoundError(Exception):
     """Raised when a configured plug-in cannot be loaded"""
     pass
@@ -106,14 +119,55 @@ class too_much_data(Exception):
     pass
 
 archiving_results = collections.namedtuple('archiving_results',
-                                           'size rtime wtime crctime totaltime crcname crc')
+                                           'size rtime wtime crctime totaltime crcname crc digests')
+
+class _digests(object):
+    """Calculates a number of digests over the same data"""
+
+    def __init__(self, names):
+        self.names = [ngamsFileUtils.get_checksum_name(name) for name in names]
+        self.infos = ngamsFileUtils.get_checksum_info(self.names)
+        self.values = [info.init for info in self.infos]
+
+    def __bool__(self):
+        return bool(self.names)
+    __nonzero__ = __bool__
 
-def archive_contents(out_fname, fin, fsize, block_size, crc_name, skip_crc=False):
+    def update(self, data):
+        for idx, info in enumerate(self.infos):
+            self.values[idx] = info.method(data, self.values[idx])
+
+    def final(self):
+        return {name: info.final(value)
+                for name, info, value in zip(self.names, self.infos, self.values)}
+
+def preallocate(fout, fsize):
+    """
+    Preallocates `fsize` bytes of disk space for the file object `fout` so the
+    file is laid out contiguously on disk, failing if there is not enough space
+    for it. Platforms or filesystems that don't support preallocation are
+    silently ignored.
+    """
+    if not fsize or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(fout.fileno(), 0, fsize)  # @UndefinedVariable
+    except OSError as e:
+        if e.errno in (errno.ENOSPC, errno.EFBIG):
+            raise Exception(genLog("NGAMS_ER_NO_DISK_SPACE", [fout.name, fsize]))
+        elif e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+            raise
+        logger.debug("Preallocation not supported for %s: %s", fout.name, str(e))
+
+def archive_contents(out_fname, fin, fsize, block_size, crc_name, skip_crc=False,
+                     prealloc=False, digests=()):
     """
     Archives the contents read from `fin` (a file-like object with .read()
     support) and writes it to file `out_fname`, which is opened in write mode
     and truncated. While reading the data its checksum is calculated using the
-    checksum method indicated by `crc_variant`.
+    checksum method indicated by `crc_variant`, together with the additional
+    `digests` (e.g., sha256), if any. If `prealloc` is given, the disk space
+    for the file is preallocated before reading any data.
 
     This method returns an archiving_results tuple populated with all the
     corresponding fields.
@@ -128,6 +182,7 @@ def archive_contents(out_fname, fin, fsize, block_size, crc_name, skip_crc=False
         if crc_info:
             crc_m = crc_info.method
             crc = crc_info.init
+    digests = _digests(digests)
 
     crctime = 0
     rtime = 0
@@ -136,21 +191,27 @@ def archive_contents(out_fname, fin, fsize, block_size, crc_name, skip_crc=False
 
     logger.debug("Saving data in file: %s", out_fname)
 
+    # Data is read into a buffer from the shared pool, so no new memory
+    # is allocated for each block
     start = time.time()
-    with open(out_fname, 'wb') as fout:
+    with open(out_fname, 'wb') as fout, \
+         ngamsBufferPool.get_pool(block_size).buffer() as buf:
+        if prealloc:
+            preallocate(fout, fsize)
         while readin < fsize:
 
             left = fsize - readin
 
             # Read
             rstart = time.time()
-            buff = fin.read(block_size if left >= block_size else left)
+            n = ngamsBufferPool.readinto(fin, buf[:block_size if left >= block_size else left])
             rtime += time.time() - rstart
-            readin += len(buff)
+            readin += n
 
-            if not buff:
+            if not n:
                 raise eof_found("Only read %d out of %d bytes (%d bytes missing)"
                                 % (readin, fsize, fsize - readin))
+            buff = buf[:n]
 
             # Write
             wstart = time.time()
@@ -163,6 +224,12 @@ def archive_contents(out_fname, fin, fsize, block_size, crc_name, skip_crc=False
                 crc = crc_m(buff, crc)
                 crctime += time.time() - crcstart
 
+            # Additional digests
+            if digests:
+                crcstart = time.time()
+                digests.update(buff)
+                crctime += time.time() - crcstart
+
     if crc_info:
         crc = crc_info.final(crc)
 
@@ -202,7 +269,297 @@ def archive_contents(out_fname, fin, fsize, block_size, crc_name, skip_crc=False
     if total_time == 0.0:
         total_time = 0.000001
 
-    return archiving_results(readin, rtime, wtime, crctime, total_time, crc_name, crc)
+    return archiving_results(readin, rtime, wtime, crctime, total_time, crc_name,
+                             crc, digests.final())
+
+
+class _pipeline_stage(threading.Thread):
+    """
+    A stage of the archiving pipeline. It consumes (buffer index, size) tuples
+    from its queue, applies `work` over them and hands the buffer back via
+    `release`, accumulating the time spent on `work`. A None item finishes the
+    stage. After an error the stage keeps releasing buffers without doing any
+    work, so the reader is never left waiting for a free buffer.
+    """
+
+    def __init__(self, name, work, release):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self.queue = Queue.Queue()
+        self.work = work
+        self.release = release
+        self.time = 0
+        self.exc_info = None
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            idx, n = item
+            if self.exc_info is None:
+                try:
+                    start = time.time()
+                    self.work(idx, n)
+                    self.time += time.time() - start
+                except:
+                    self.exc_info = sys.exc_info()
+            self.release(idx)
+
+def archive_contents_pipelined(out_fname, fin, fsize, block_size, crc_name,
+                               skip_crc=False, nbuffers=4, prealloc=False,
+                               digests=()):
+    """
+    Like archive_contents, but reading from `fin`, writing into `out_fname`
+    and calculating the checksum and `digests` are overlapped: the calling
+    thread reads data into a bounded ring of `nbuffers` buffers of
+    `block_size` bytes taken from the shared buffer pool, while each of the
+    other stages (writing, plus checksumming and calculating digests when
+    requested) runs on its own thread over the filled buffers. The ingestion
+    rate is therefore limited by the slowest stage instead of by the sum of
+    all of them.
+
+    The rtime, wtime and crctime fields of the returned archiving_results
+    contain the time spent on each individual stage (crctime being the
+    maximum of the checksum and digests stages).
+    """
+
+    crc_info = None
+    if not skip_crc:
+        crc_info = ngamsFileUtils.get_checksum_info(crc_name)
+    digests = _digests(digests)
+
+    pool = ngamsBufferPool.get_pool(block_size)
+    buffers = [pool.acquire() for _ in range(nbuffers)]
+    free = Queue.Queue()
+    for idx in range(nbuffers):
+        free.put(idx)
+
+    # Each buffer goes back into the free queue only after all stages
+    # are done with it
+    pending = [0] * nbuffers
+    pending_lock = threading.Lock()
+    def release(idx):
+        with pending_lock:
+            pending[idx] -= 1
+            if pending[idx]:
+                return
+        free.put(idx)
+
+    logger.debug("Saving data in file: %s using %d pipelined buffers", out_fname, nbuffers)
+
+    start = time.time()
+    rtime = 0
+    readin = 0
+    with open(out_fname, 'wb') as fout:
+        if prealloc:
+            preallocate(fout, fsize)
+
+        stages = [_pipeline_stage('%s-W' % threading.current_thread().name,
+                                  lambda idx, n: fout.write(buffers[idx][:n]),
+                                  release)]
+        crc = [None]
+        if crc_info:
+            crc[0] = crc_info.init
+            crc_m = crc_info.method
+            def do_crc(idx, n):
+                crc[0] = crc_m(buffers[idx][:n], crc[0])
+            stages.append(_pipeline_stage('%s-C' % threading.current_thread().name,
+                                          do_crc, release))
+        if digests:
+            stages.append(_pipeline_stage('%s-D' % threading.current_thread().name,
+                                          lambda idx, n: digests.update(buffers[idx][:n]),
+                                          release))
+
+        for stage in stages:
+            stage.start()
+        try:
+            while readin < fsize:
+
+                # Stop early if any stage has failed already
+                if any(stage.exc_info for stage in stages):
+                    break
+
+                left = fsize - readin
+                idx = free.get()
+
+                rstart = time.time()
+                n = ngamsBufferPool.readinto(fin, buffers[idx][:block_size if left >= block_size else left])
+                rtime += time.time() - rstart
+
+                if not n:
+                    free.put(idx)
+                    raise eof_found("Only read %d out of %d bytes (%d bytes missing)"
+                                    % (readin, fsize, fsize - readin))
+                readin += n
+
+                pending[idx] = len(stages)
+                for stage in stages:
+                    stage.queue.put((idx, n))
+        finally:
+            for stage in stages:
+                stage.queue.put(None)
+            for stage in stages:
+                stage.join()
+
+            for buf in buffers:
+                pool.release(buf)
+
+        for stage in stages:
+            if stage.exc_info:
+                six.reraise(*stage.exc_info)
+
+    wtime = stages[0].time
+    crctime = max([0] + [stage.time for stage in stages[1:]])
+    crc = crc[0]
+    if crc_info:
+        crc = crc_info.final(crc)
+
+    total_time = time.time() - start
+    if total_time == 0.0:
+        total_time = 0.000001
+
+    return archiving_results(readin, rtime, wtime, crctime, total_time, crc_name,
+                             crc, digests.final())
+
+
+def _splice_once(fd_in, fd_out, n, timeout):
+    """
+    Performs a single splice of up to `n` bytes from `fd_in` into `fd_out`,
+    waiting at most `timeout` seconds for `fd_in` to become readable if it is
+    non-blocking. Returns the number of bytes spliced, which might be less
+    than `n` (callers loop as needed), or 0 if the end of the data was found.
+    """
+    while True:
+        try:
+            return os.splice(fd_in, fd_out, n, flags=os.SPLICE_F_MOVE)  # @UndefinedVariable
+        except (BlockingIOError, InterruptedError):  # @UndefinedVariable
+            if not select.select([fd_in], [], [], timeout)[0]:
+                raise socket.timeout("Timed out waiting for data to splice")
+
+def can_splice(fin):
+    """
+    Whether the contents of `fin` can be moved to a file using splice(2);
+    i.e., whether the platform supports it, and `fin` is a buffered reader
+    with an underlying file descriptor.
+    """
+    return hasattr(os, 'splice') and hasattr(fin, 'peek') and hasattr(fin, 'fileno')
+
+def archive_contents_splice(out_fname, fin, fsize, block_size, timeout=None,
+                            prealloc=False):
+    """
+    Moves `fsize` bytes from `fin` (see can_splice) into `out_fname` using
+    splice(2) through an intermediate pipe, so the data is never copied into
+    user space. Any data already buffered by `fin` is written normally first.
+    No checksum is calculated over the data.
+
+    This method returns an archiving_results tuple populated with all the
+    corresponding fields.
+    """
+
+    rtime = 0
+    wtime = 0
+    readin = 0
+
+    logger.debug("Splicing data into file: %s", out_fname)
+
+    start = time.time()
+    with open(out_fname, 'wb') as fout:
+        if prealloc:
+            preallocate(fout, fsize)
+
+        # peek() returns what's already buffered, reading only if empty
+        rstart = time.time()
+        buff = fin.read(min(len(fin.peek(1)), fsize)) if fsize else b''
+        rtime += time.time() - rstart
+        readin += len(buff)
+        wstart = time.time()
+        fout.write(buff)
+        fout.flush()
+        wtime += time.time() - wstart
+
+        src = fin.fileno()
+        dst = fout.fileno()
+        pipe_r, pipe_w = os.pipe()
+        try:
+            # Make the pipe as big as a block, if possible
+            try:
+                fcntl.fcntl(pipe_w, getattr(fcntl, 'F_SETPIPE_SZ', 1031), block_size)
+            except (IOError, OSError):
+                pass
+
+            while readin < fsize:
+
+                left = fsize - readin
+
+                # socket -> pipe
+                rstart = time.time()
+                n = _splice_once(src, pipe_w, block_size if left >= block_size else left, timeout)
+                rtime += time.time() - rstart
+                readin += n
+
+                if not n:
+                    raise eof_found("Only read %d out of %d bytes (%d bytes missing)"
+                                    % (readin, fsize, fsize - readin))
+
+                # pipe -> file
+                wstart = time.time()
+                while n:
+                    n -= _splice_once(pipe_r, dst, n, timeout)
+                wtime += time.time() - wstart
+        finally:
+            os.close(pipe_r)
+            os.close(pipe_w)
+
+    total_time = time.time() - start
+    if total_time == 0.0:
+        total_time = 0.000001
+
+    return archiving_results(readin, rtime, wtime, 0, total_time, None, None, {})
+
+
+def http_transfer(cfg, rfile):
+    """
+    Returns the default transfer function used by archive_contents_from_request,
+    which reads the incoming data from `rfile`.
+    """
+
+    def transfer(req, out_fname, crc_name, skip_crc):
+        block_size = cfg.getBlockSize()
+        size = req.getSize()
+        nbuffers = cfg.getArchivePipelineBuffers()
+        prealloc = cfg.getPreallocateStagingFiles()
+        digests = () if skip_crc else cfg.getArchiveDigests()
+        if nbuffers > 1:
+            return archive_contents_pipelined(out_fname, rfile, size, block_size,
+                                              crc_name, skip_crc, nbuffers=nbuffers,
+                                              prealloc=prealloc, digests=digests)
+        return archive_contents(out_fname, rfile, size, block_size, crc_name,
+                                skip_crc, prealloc=prealloc, digests=digests)
+
+    return transfer
+
+def splice_transfer(cfg, rfile):
+    """
+    Returns a transfer function for archive_contents_from_request that moves
+    the incoming data from `rfile` into the staging file using splice(2).
+    Because data doesn't go through user space no checksum can be calculated,
+    so requests that need one (or any digest) at reception time, or for which
+    `rfile` cannot be spliced, fall back to the default transfer.
+    """
+
+    default_transfer = http_transfer(cfg, rfile)
+    def transfer(req, out_fname, crc_name, skip_crc):
+        needs_checksum = crc_name is not None or cfg.getArchiveDigests()
+        if (needs_checksum and not skip_crc) or not can_splice(rfile):
+            return default_transfer(req, out_fname, crc_name, skip_crc)
+        result = archive_contents_splice(out_fname, rfile, req.getSize(),
+                                         cfg.getBlockSize(),
+                                         timeout=cfg.getTimeOut() or 60,
+                                         prealloc=cfg.getPreallocateStagingFiles())
+        return result._replace(crcname=crc_name)
+
+    return transfer
 
 
 def archive_contents_from_request(out_fname, cfg, req, rfile, skip_crc=False, transfer=None):
@@ -221,12 +578,7 @@ def archive_contents_from_request(out_fname, cfg, req, rfile, skip_crc=False, tr
         variant = cfg.getCRCVariant()
     crc_name = ngamsFileUtils.get_checksum_name(variant)
 
-    def http_transfer(req, out_fname, crc_name, skip_crc):
-        block_size = cfg.getBlockSize()
-        size = req.getSize()
-        return archive_contents(out_fname, rfile, size, block_size, crc_name, skip_crc)
-
-    transfer = transfer or http_transfer
+    transfer = transfer or http_transfer(cfg, rfile)
     result = transfer(req, out_fname, crc_name, skip_crc=skip_crc)
 
     req.incIoTime(result.rtime + result.wtime)
@@ -253,7 +605,8 @@ def archive_contents_from_request(out_fname, cfg, req, rfile, skip_crc=False, tr
 def updateFileInfoDb(srvObj,
                      piStat,
                      checksum,
-                     checksumPlugIn, sync_disk=True, ingestion_rate=None):
+                     checksumPlugIn, sync_disk=True, ingestion_rate=None,
+                     digests=None, batch=None):
     """
     Update the information for the file in the NGAS DB.
 
@@ -266,16 +619,27 @@ def updateFileInfoDb(srvObj,
 
     checksumPlugIn:   Checksum Plug-In (string).
 
-    Returns:          Void.
+    digests:          Additional digests of the file, indexed by name (dict).
+
+    batch:            If given, the File Info Object is appended to this list
+                      to be written later with writeFileEntries (together with
+                      its digests), unless the file needs to be added to a
+                      container (list).
+
+    Returns:          File Info Object (ngamsFileInfo).
     """
     logger.debug("Updating file info in NGAS DB for file with ID: %s", piStat.getFileId())
 
     # Check that the file is really contained in the final location as
-    # indicated by the information in the File Info Object.
-    if sync_disk:
+    # indicated by the information in the File Info Object, making sure it
+    # is flushed to disk according to the durability policy, if any.
+    if srvObj.durability is not None or sync_disk:
         try:
-            ngamsFileUtils.syncCachesCheckFiles(srvObj,
-                                                [piStat.getCompleteFilename()])
+            if srvObj.durability is not None:
+                srvObj.durability.sync(piStat.getCompleteFilename())
+            else:
+                ngamsFileUtils.syncCachesCheckFiles(srvObj,
+                                                    [piStat.getCompleteFilename()])
         except Exception as e:
             errMsg = "Severe error occurred! Cannot update information in " +\
                      "NGAS DB (ngas_files table) about file with File ID: " +\
@@ -318,8 +682,18 @@ def updateFileInfoDb(srvObj,
                setIgnore(0)
     if ingestion_rate is not None:
         fileInfo.setIngestionRate(ingestion_rate)
+    if digests:
+        fileInfo.setDigests(digests)
+
+    if batch is not None and not containerId:
+        batch.append(fileInfo)
+        return fileInfo
 
     fileInfo.write(srvObj.getHostId(), srvObj.getDb())
+    if digests:
+        srvObj.getDb().writeFileDigests(piStat.getDiskId(), piStat.getFileId(),
+                                        piStat.getFileVersion(), digests)
+    srvObj.location_cache.invalidate(piStat.getFileId())
     logger.debug("Updated file info in NGAS DB for file with ID: %s", piStat.getFileId())
 
     # Update the container size with the new size
@@ -330,6 +704,51 @@ def updateFileInfoDb(srvObj,
 
     return fileInfo
 
+def writeFileEntries(srvObj, fileInfoList):
+    """
+    Write the entries of many new files in the NGAS DB in one go, updating
+    the statistics of the disks hosting them. If this fails, the entries are
+    written one at a time, so that errors affect only the files concerned.
+    The additional digests of the files are written once their entries are,
+    and the cached locations of the files are invalidated.
+
+    srvObj:          Server object (ngamsServer).
+
+    fileInfoList:    File Info Objects of the files; the list is emptied
+                     (list/ngamsFileInfo).
+
+    Returns:         Tuples with the File Info Object and the error of the
+                     files that couldn't be written (list).
+    """
+    fileInfos = list(fileInfoList)
+    del fileInfoList[:]
+    hostId, db = srvObj.getHostId(), srvObj.getDb()
+    failed = []
+    try:
+        db.writeFileEntries(hostId, fileInfos, updateDiskInfo=1)
+    except Exception:
+        logger.exception("Error while writing the entries of %d files, "
+                         "writing them one at a time", len(fileInfos))
+        for fileInfo in fileInfos:
+            try:
+                db.writeFileEntries(hostId, [fileInfo], updateDiskInfo=1)
+            except Exception as e:
+                failed.append((fileInfo, e))
+
+    failedIds = set(id(fileInfo) for fileInfo, _ in failed)
+    for fileInfo in fileInfos:
+        if id(fileInfo) in failedIds or not fileInfo.getDigests():
+            continue
+        try:
+            db.writeFileDigests(fileInfo.getDiskId(), fileInfo.getFileId(),
+                                fileInfo.getFileVersion(), fileInfo.getDigests())
+        except Exception:
+            logger.exception("Error while writing the digests of file %s/%d",
+                             fileInfo.getFileId(), fileInfo.getFileVersion())
+    for fileId in set(fileInfo.getFileId() for fileInfo in fileInfos):
+        srvObj.location_cache.invalidate(fileId)
+    return failed
+
 def replicateFile(dbConObj,
                   ngamsCfgObj,
                   diskDic,
@@ -577,7 +996,7 @@ def postFileRecepHandling(srvObj,
                           resultPlugIn,
                           tgtDiskInfo,
                           cksum=None, sync_disk=True, ingestion_rate=None,
-                          do_replication=True):
+                          do_replication=True, digests=None):
     """
     The function carries out the action needed after a file has been received
     for archiving. This consists of updating the information about the
@@ -592,6 +1011,8 @@ def postFileRecepHandling(srvObj,
 
     cksum:          Tuple containing checksum string value and algorithm
 
+    digests:        Additional digests of the file, indexed by name (dict).
+
     Returns:        Disk info object containing the information about
                     the Main File (ngasDiskInfo).
     """
@@ -617,7 +1038,8 @@ def postFileRecepHandling(srvObj,
 
     # Update information for File in DB.
     fileInfo = updateFileInfoDb(srvObj, resultPlugIn, checksum, checksumPlugIn,
-                     sync_disk=sync_disk, ingestion_rate=ingestion_rate)
+                     sync_disk=sync_disk, ingestion_rate=ingestion_rate,
+                     digests=digests)
     ngamsLib.makeFileReadOnly(resultPlugIn.getCompleteFilename())
 
     # Update information about main disk
@@ -663,7 +1085,7 @@ def postFileRecepHandling(srvObj,
                                    srvObj.getDiskDic(), resultPlugIn)
             srvObj.test_BeforeDbUpdateRepFile()
             updateFileInfoDb(srvObj, resRep, checksum, checksumPlugIn,
-                             sync_disk=sync_disk)
+                             sync_disk=sync_disk, digests=digests)
             ngamsDiskUtils.updateDiskStatusDb(srvObj.getDb(), resRep)
 
         # Inform the caching service about the new file.
@@ -1041,6 +1463,10 @@ def _dataHandler(srvObj, reqPropsObj, httpRef, find_target_disk,
         logger.info("Handling archive push request")
         rfile = httpRef.rfile
 
+        # Push requests can be spliced directly into the staging file
+        if transfer is None and cfg.getSpliceTransfer():
+            transfer = splice_transfer(cfg, rfile)
+
     logger.info(genLog("NGAMS_INFO_ARCHIVING_FILE", [reqPropsObj.getFileUri()]), extra={'to_syslog': True})
 
     if reqPropsObj.getSize() <= 0:
@@ -1203,11 +1629,19 @@ def _dataHandler(srvObj, reqPropsObj, httpRef, find_target_disk,
     elif crc_name is None:
         cksum = (None, None)
 
+    # Additional digests are of the incoming data, so they are dropped if the
+    # DAPI modified it (e.g., by compressing it)
+    digests = archive_result.digests
+    if digests and plugin_result.getFileSize() != archive_result.size:
+        logger.info("Data modified by DAPI, not storing its digests")
+        digests = None
+
     intestion_rate = archive_result.totaltime / reqPropsObj.getSize()
     diskInfo = postFileRecepHandling(srvObj, reqPropsObj, plugin_result,
                                      reqPropsObj.getTargDiskInfo(), cksum=cksum,
                                      sync_disk=sync_disk, ingestion_rate=intestion_rate,
-                                     do_replication=do_replication)
+                                     do_replication=do_replication,
+                                     digests=digests)
     msg = genLog("NGAMS_INFO_FILE_ARCHIVED", [reqPropsObj.getSafeFileUri()])
     msg = msg + ". Time: %.3fs" % (time.time() - archiving_start)
     logger.info(msg, extra={'to_syslog': True})
@@ -1223,6 +1657,9 @@ def _dataHandler(srvObj, reqPropsObj, httpRef, find_target_disk,
     msg = msg % ('Pull' if reqPropsObj.is_GET() else 'Push', reqPropsObj.getSafeFileUri())
     logger.info(msg)
 
+    # A new version changes which is the latest one, which clients
+    # might ask for as soon as they get the reply
+    srvObj.location_cache.invalidate(plugin_result.getFileId())
     httpRef.send_ingest_status(msg, diskInfo)
 
     # After a successful archiving we notify the archive event subscribers
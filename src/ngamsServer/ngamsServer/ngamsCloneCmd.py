@@ -325,6 +325,24 @@ def _checkFile(srvObj,
             logger.debug("No Checksum or Checksum Plug-In specified for file")
 
 
+def _writePendingFiles(srvObj, pendingFiles, pendingPaths):
+    """
+    Write the entries of the files cloned since the last call,
+    returning how many of them failed. Cloned files whose entries couldn't
+    be written are removed, using their complete names in `pendingPaths`.
+    """
+    failed = ngamsArchiveUtils.writeFileEntries(srvObj, pendingFiles)
+    for fileInfo, e in failed:
+        logger.warning(genLog("NGAMS_ER_FILE_CLONE_FAILED",
+                              [fileInfo.getFileId(), fileInfo.getFileVersion(),
+                               fileInfo.getDiskId(), srvObj.getHostId(), str(e)]))
+        key = (fileInfo.getDiskId(), fileInfo.getFileId(),
+               fileInfo.getFileVersion())
+        rmFile(pendingPaths[key])
+    pendingPaths.clear()
+    return len(failed)
+
+
 def _cloneExec(srvObj,
                cloneListDbmName,
                tmpFilePat,
@@ -357,10 +375,7 @@ def _cloneExec(srvObj,
         key, fileInfo = cloneListDbm.getNext()
         if (not key): break
         hostInfoDic[fileInfo[1]] = -1
-    hostInfoDic = ngamsHighLevelLib.resolveHostAddress(srvObj.getHostId(),
-                                                       srvObj.getDb(),
-                                                       srvObj.getCfg(),
-                                                       hostInfoDic.keys())
+    hostInfoDic = srvObj.host_topology.resolve(hostInfoDic.keys())
 
     # The cloning loop. Loop over the list of files to clone and generate
     # a report with the result.
@@ -373,6 +388,8 @@ def _cloneExec(srvObj,
     failedCloneCount  = 0
     abortCloneLoop    = 0
     timeAccu          = 0.0
+    pendingFiles      = []
+    pendingPaths      = {}
     key = 0
     while (1):
 
@@ -422,7 +439,9 @@ def _cloneExec(srvObj,
                     # stored on the selected Target Disk.
                     if (srvObj.getDb().fileInDb(trgDiskInfo.getDiskId(),
                                                 fio.getFileId(),
-                                                fio.getFileVersion())):
+                                                fio.getFileVersion()) or
+                        (trgDiskInfo.getDiskId(), fio.getFileId(),
+                         fio.getFileVersion()) in pendingPaths):
                         # This file is already stored on the given disk.
                         # Add to the exempt list.
                         diskExemptList.append(trgDiskInfo.getDiskId())
@@ -515,25 +534,16 @@ def _cloneExec(srvObj,
                                              "/" + targPathName)
             checkCreatePath(complTargPath)
             complFilename = os.path.normpath(complTargPath + "/"+targFilename)
-            mvTime = mvFile(stagingFilename, complFilename)
+            mvFile(stagingFilename, complFilename)
             ngamsLib.makeFileReadOnly(complFilename)
 
-            # Update status for new file in the DB.
+            # The status of new files and of their Target Disks is updated in
+            # the DB in batches. Check if the disk is completed.
             newFileInfo = fio.clone().setDiskId(trgDiskInfo.getDiskId()).\
                           setCreationDate(getFileCreationTime(complFilename))
-            fileExists = srvObj.getDb().fileInDb(trgDiskInfo.getDiskId(),
-                                                 fio.getFileId(),
-                                                 fio.getFileVersion())
-            newFileInfo.write(srvObj.getHostId(), srvObj.getDb())
-
-            # Update status for the Target Disk in DB + check if the disk is
-            # completed.
-            if (fileExists): mvTime = 0
-            dummyDapiStatObj = ngamsDapiStatus.ngamsDapiStatus().\
-                               setDiskId(trgDiskInfo.getDiskId()).\
-                               setFileExists(fileExists).\
-                               setFileSize(fio.getFileSize()).setIoTime(mvTime)
-            ngamsDiskUtils.updateDiskStatusDb(srvObj.getDb(), dummyDapiStatObj)
+            pendingFiles.append(newFileInfo)
+            pendingPaths[(newFileInfo.getDiskId(), newFileInfo.getFileId(),
+                          newFileInfo.getFileVersion())] = complFilename
             ngamsArchiveUtils.checkDiskSpace(srvObj, trgDiskInfo.getDiskId())
 
             # Update the clone file status list.
@@ -572,6 +582,13 @@ def _cloneExec(srvObj,
                              fio.getDiskId(), hostId, str(e)])
             if (abortCloneLoop):
                 logger.error(errMsg, extra={'to_syslog': True})
+                failCount = _writePendingFiles(srvObj, pendingFiles,
+                                               pendingPaths)
+                successCloneCount -= failCount
+                failedCloneCount += failCount + 1
+                logger.error("Cloning aborted. Number of cloned files: %d. "
+                             "Number of failed files: %d",
+                             successCloneCount, failedCloneCount)
                 return
             else:
                 logger.warning(errMsg)
@@ -585,11 +602,20 @@ def _cloneExec(srvObj,
             if ((stagingFilename != "") and (os.path.exists(stagingFilename))):
                 rmFile(stagingFilename)
 
+        if len(pendingFiles) >= ngamsArchiveUtils.FILE_ENTRIES_BATCH_SIZE:
+            failCount = _writePendingFiles(srvObj, pendingFiles, pendingPaths)
+            successCloneCount -= failCount
+            failedCloneCount += failCount
+
         # Calculate time statistics.
         if (reqPropsObj):
             ngamsHighLevelLib.stdReqTimeStatUpdate(srvObj, reqPropsObj.\
                                                    incActualCount(1), timeAccu)
 
+    failCount = _writePendingFiles(srvObj, pendingFiles, pendingPaths)
+    successCloneCount -= failCount
+    failedCloneCount += failCount
+
     # Final update of the Request Status.
     if (reqPropsObj):
         complPercent = (100.0 * (float(reqPropsObj.getActualCount()) /
@@ -862,6 +888,7 @@ def _cloneExplicit(srvObj,
         fileExists = srvObj.getDb().fileInDb(trgDiskInfo.getDiskId(),
                                              fileId, fileVersion)
         newFileInfo.write(srvObj.getHostId(), srvObj.getDb())
+        srvObj.location_cache.invalidate(fileId)
 
         # Update status for the Target Disk in DB + check if the disk is
         # completed.
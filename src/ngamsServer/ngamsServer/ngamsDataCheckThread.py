@@ -438,9 +438,11 @@ def _schedNextFile(srvObj,
 
 checksum_allow_evt = None
 checksum_stop_evt = None
-def do_checksum(blocksize, filename, checksum_variant):
-    return ngamsFileUtils.get_checksum_interruptible(blocksize, filename, checksum_variant,
-                                                     checksum_allow_evt, checksum_stop_evt)
+def do_checksum(blocksize, filename, checksum_variant, nthreads=1,
+                hints=False, drop_cache=False):
+    return ngamsFileUtils.get_checksum_parallel(blocksize, filename, checksum_variant, nthreads,
+                                                checksum_allow_evt, checksum_stop_evt,
+                                                hints=hints, drop_cache=drop_cache)
 
 def _dataCheckSubThread(srvObj,
                         threadId,
@@ -465,7 +467,17 @@ def _dataCheckSubThread(srvObj,
 
     # The globals are set at process creation time,
     # in ngamsServer#handleStartUp
+    cfg = srvObj.getCfg()
+    # ChecksumThreads is shared among the worker processes checking files
+    # simultaneously, so they don't use more threads altogether
+    nprocs = cfg.getDataCheckMaxProcs() or 1
+    nthreads = max(1, cfg.getChecksumThreads() // nprocs)
+    hints = cfg.getIoHints()
+    drop_cache = cfg.getDropCacheAfterBackgroundReads()
     def external_process_executor(*args, **kwargs):
+        kwargs['nthreads'] = nthreads
+        kwargs['hints'] = hints
+        kwargs['drop_cache'] = drop_cache
         return srvObj.workers_pool.apply(do_checksum, args, kwargs)
 
     while (1):
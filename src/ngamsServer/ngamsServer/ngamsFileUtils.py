@@ -32,45 +32,128 @@ Contains various utility functions used by the command handling callback
 functions, to deal with archive files.
 """
 
-import binascii
-import collections
 import contextlib
 import functools
 import logging
+import multiprocessing
 import os
 import re
-import struct
 import time
 
-import six
-
 from ngamsLib import ngamsDbCore, ngamsDiskInfo, ngamsStatus, \
     ngamsHttpUtils, ngamsFileInfo
-from ngamsLib import ngamsHighLevelLib
 from ngamsLib.ngamsCore import TRACE, NGAMS_HOST_LOCAL, NGAMS_HOST_CLUSTER, \
     NGAMS_HOST_DOMAIN, rmFile, NGAMS_HOST_REMOTE, NGAMS_RETRIEVE_CMD, genLog, \
     NGAMS_STATUS_CMD, NGAMS_CACHE_DIR, \
-    NGAMS_DATA_CHECK_THR, getFileSize, loadPlugInEntryPoint
+    NGAMS_DATA_CHECK_THR, getFileSize, loadPlugInEntryPoint, fromiso8601
+# The checksum functions now live in ngamsLib (so clients can use them too),
+# but are still used through this module by many plug-ins
+from ngamsLib.ngamsChecksum import checksum_info, get_checksum_info, \
+    get_checksum_name, get_checksum, get_checksum_interruptible, \
+    get_checksum_parallel, crc_combine, is_digest, CHECKSUM_NULL, \
+    CHECKSUM_CRC32_INCONSISTENT, CHECKSUM_CRC32C, CHECKSUM_CRC32Z
 from . import ngamsSrvUtils
 
-_crc32c_available = True
-try:
-    import crc32c
-except ImportError:
-    _crc32c_available = False
-
 logger = logging.getLogger(__name__)
 
-# The checksum_info fields are:
-#  * init: the initial value of the checksum before running over the data
-#  * method: the accumulative checksum method invoked for each piece of data
-#  * final: Converts the final checksum to get the final value
-#  * from_bytes: converts a sequence of bytes into a checksum value
-#
-# In NGAS checksum values are treated as integers (and then stored as their
-# string representation in the database), which is why the `final` and
-# `from_bytes` functions need to be aligned.
-checksum_info = collections.namedtuple('crc_info', 'init method final from_bytes equals')
+def _host_suspended(srvObj, host, hostInfo):
+    # Servers suspend themselves, so cached host information
+    # can't be trusted for this.
+    if srvObj.host_topology.enabled:
+        return srvObj.getDb().getSrvSuspended(host, host) == 1
+    return hostInfo.getSrvSuspended() == 1
+
+
+def _probe_file_access(srvObj, host, hostInfo, fileInfoObj, timeout=None):
+    """
+    Asks the server at `host` whether it can access the given file,
+    waking it up first if it is suspended.
+    """
+
+    port = hostInfo.getSrvPort()
+
+    # If a server hosting a file is suspended, it is woken up
+    # to be able to check if the file is really accessible.
+    if _host_suspended(srvObj, host, hostInfo):
+        logger.debug("Server hosting requested file (%s/%s) is suspended " + \
+                     "- waking up server ...",
+                     host, str(port))
+        try:
+            ngamsSrvUtils.wakeUpHost(srvObj, host)
+            logger.debug("Suspended server hosting requested file (%s/%s) " +\
+                         "has been woken up",
+                         host, str(port))
+        except Exception:
+            logger.exception("Error waking up server hosting selected " +\
+                    "file")
+            return False
+
+    # The file is hosted on a host, which is not suspended or
+    # which was successfully woken up.
+    pars = [["file_access", fileInfoObj.getFileId()]]
+    if (fileInfoObj.getFileVersion() != -1):
+        pars.append(["file_version", fileInfoObj.getFileVersion()])
+    ipAddress = hostInfo.getIpAddress()
+    authHdr = ngamsSrvUtils.genIntAuthHdr(srvObj)
+    resp = ngamsHttpUtils.httpGet(ipAddress, port, NGAMS_STATUS_CMD,
+                                  pars=pars, auth=authHdr, timeout=timeout)
+    with contextlib.closing(resp):
+        data = resp.read()
+    statusObj = ngamsStatus.ngamsStatus().unpackXmlDoc(data, 1)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Result of File Access Query: %s",
+                     re.sub("\n", "", str(statusObj.genXml().toprettyxml('  ', '\n'))))
+    return statusObj.getMessage().find("NGAMS_INFO_FILE_AVAIL") != -1
+
+
+def _probe_reachable_file_access(srvObj, host, hostInfo, fileInfoObj, timeout=None):
+    """
+    Like _probe_file_access, but hosts that fail to answer are remembered for
+    a while, and not probed again during that time.
+    """
+    unreachable = srvObj.unreachable_hosts
+    if host in unreachable:
+        logger.debug("Skipping recently unreachable host %s", host)
+        return False
+    try:
+        return _probe_file_access(srvObj, host, hostInfo, fileInfoObj,
+                                  timeout=timeout)
+    except Exception as e:
+        logger.warning("Error probing file access on host %s: %s", host, str(e))
+        unreachable.add(host)
+        return False
+
+
+def _start_file_access_probes(srvObj, hostDic, candidates, timeout):
+    """
+    Concurrently probes the remote candidates in `candidates`, a dictionary
+    of candidate files indexed by their priority, using the server's pool of
+    probe threads. Returns a dictionary with the asynchronous results, using
+    the same indexes. Suspended hosts are not probed (nor woken up), and their
+    result is None.
+    """
+
+    def probe(fileInfo):
+        _, fileInfoObj, host = fileInfo
+        if _host_suspended(srvObj, host, hostDic[host]):
+            return None
+        return _probe_reachable_file_access(srvObj, host, hostDic[host],
+                                            fileInfoObj, timeout=timeout)
+
+    return {idx: srvObj.probe_pool.apply_async(probe, (fileInfo,))
+            for idx, fileInfo in candidates.items()}
+
+
+def _wait_file_access_probe(probe, host, timeout):
+    """Waits at most `timeout` seconds for the result of `probe`"""
+    try:
+        return probe.get(timeout)
+    except multiprocessing.TimeoutError:
+        logger.warning("Host %s didn't answer file access probe within %.3f [s]",
+                       host, timeout)
+        return False
+
 
 def _locateArchiveFile(srvObj,
                        fileId,
@@ -78,7 +161,8 @@ def _locateArchiveFile(srvObj,
                        diskId,
                        hostId,
                        reqPropsObj,
-                       files):
+                       files,
+                       validators=False):
     """
     See description of ngamsFileUtils.locateArchiveFile(). This function is
     used simply to encapsulate the complete processing to be able to clean up.
@@ -114,10 +198,7 @@ def _locateArchiveFile(srvObj,
     domainFileList    = []
     remoteFileList    = []
     all_hosts         = set([x[1] for x in files])
-    hostDic = ngamsHighLevelLib.resolveHostAddress(srvObj.getHostId(),
-                                                   srvObj.getDb(),
-                                                   srvObj.getCfg(),
-                                                   all_hosts)
+    hostDic = srvObj.host_topology.resolve(all_hosts)
 
     # Loop over the candidate files and sort them.
     fileCount = idx = 0
@@ -198,87 +279,82 @@ def _locateArchiveFile(srvObj,
     # 'responsible' for the file, allows for Retrieve Requests (only done
     # in connection with a Retrieve Request).
     logger.debug("Checking which of the candidate files should be selected ...")
+    candidates = [fileInfo for fileVer in fileVerList
+                  for fileInfo in candFileDic[fileVer]]
+    probeTimeout = srvObj.getCfg().getFileAccessProbeTimeout()
+    probes = None
     foundFile   = 0
-    for fileVer in fileVerList:
-        if (foundFile): break
-
-        for fileInfo in candFileDic[fileVer]:
-            location    = fileInfo[0]
-            fileInfoObj = fileInfo[1]
-            host        = fileInfo[2]
-            diskInfoObj = diskInfoDic[fileInfoObj.getDiskId()]
-            port        = hostDic[host].getSrvPort()
-
-            logger.debug("Checking candidate file with ID: %s on host/port: %s/%s. " + \
-                         "Location: %s",
-                         fileInfoObj.getFileId(), host, str(port), location)
-
-            # If the file is stored locally we check if it is accessible,
-            # otherwise we send a STATUS/file_access request to the
-            # host in question.
-            if (location == NGAMS_HOST_LOCAL):
-                # Check first if the local system supports retrieve requests.
-                # (if relevant).
-                if (reqPropsObj):
-                    if (reqPropsObj.getCmd() == NGAMS_RETRIEVE_CMD):
-                        if (not srvObj.getCfg().getAllowRetrieveReq()):
-                            continue
-
-                # Check if the file is accessible.
-                filename = os.path.normpath(diskInfoObj.getMountPoint()+"/" +\
-                                            fileInfoObj.getFilename())
-                logger.debug("Checking if local file with name: %s is available", filename)
-                if (not os.path.exists(filename)):
-                    logger.debug(genLog("NGAMS_INFO_FILE_NOT_AVAIL", [fileId, host]))
-                else:
-                    logger.debug(genLog("NGAMS_INFO_FILE_AVAIL", [fileId, host]))
-                    foundFile = 1
-                    break
-            else:
-                logger.debug("Checking if file with ID/Version: %s/%s " +\
-                             "is available on host/port: %s/%s",
-                             fileInfoObj.getFileId(), str(fileInfoObj.getFileVersion()),
-                             host, str(port))
-
-                # If a server hosting a file is suspended, it is woken up
-                # to be able to check if the file is really accessible.
-                if (hostDic[host].getSrvSuspended() == 1):
-                    logger.debug("Server hosting requested file (%s/%s) is suspended " + \
-                                 "- waking up server ...",
-                                 host, str(port))
-                    try:
-                        ngamsSrvUtils.wakeUpHost(srvObj, host)
-                        logger.debug("Suspended server hosting requested file (%s/%s) " +\
-                                     "has been woken up",
-                                     host, str(port))
-                    except Exception:
-                        logger.exception("Error waking up server hosting selected " +\
-                                "file")
+    for idx, fileInfo in enumerate(candidates):
+        location    = fileInfo[0]
+        fileInfoObj = fileInfo[1]
+        host        = fileInfo[2]
+        diskInfoObj = diskInfoDic[fileInfoObj.getDiskId()]
+        port        = hostDic[host].getSrvPort()
+
+        logger.debug("Checking candidate file with ID: %s on host/port: %s/%s. " + \
+                     "Location: %s",
+                     fileInfoObj.getFileId(), host, str(port), location)
+
+        # If the file is stored locally we check if it is accessible,
+        # otherwise we send a STATUS/file_access request to the
+        # host in question.
+        if (location == NGAMS_HOST_LOCAL):
+            # Check first if the local system supports retrieve requests.
+            # (if relevant).
+            if (reqPropsObj):
+                if (reqPropsObj.getCmd() == NGAMS_RETRIEVE_CMD):
+                    if (not srvObj.getCfg().getAllowRetrieveReq()):
                         continue
 
-                # The file is hosted on a host, which is not suspended or
-                # which was successfully woken up.
-                pars = [["file_access", fileInfoObj.getFileId()]]
-                if (fileInfoObj.getFileVersion() != -1):
-                    pars.append(["file_version", fileInfoObj.getFileVersion()])
-                ipAddress = hostDic[host].getIpAddress()
-                authHdr = ngamsSrvUtils.genIntAuthHdr(srvObj)
-                resp = ngamsHttpUtils.httpGet(ipAddress, port, NGAMS_STATUS_CMD,
-                                        pars=pars, auth=authHdr)
-                with contextlib.closing(resp):
-                    data = resp.read()
-                statusObj = ngamsStatus.ngamsStatus().unpackXmlDoc(data, 1)
-
-                if logger.isEnabledFor(logging.DEBUG):
-                    logger.debug("Result of File Access Query: %s",
-                                 re.sub("\n", "", str(statusObj.genXml().toprettyxml('  ', '\n'))))
-                if ((statusObj.getMessage().\
-                     find("NGAMS_INFO_FILE_AVAIL") == -1)):
-                    logger.debug(genLog("NGAMS_INFO_FILE_NOT_AVAIL", [fileId, host]))
-                else:
-                    logger.debug(genLog("NGAMS_INFO_FILE_AVAIL", [fileId, host]))
-                    foundFile = 1
-                    break
+            # Check if the file is accessible.
+            filename = os.path.normpath(diskInfoObj.getMountPoint()+"/" +\
+                                        fileInfoObj.getFilename())
+            logger.debug("Checking if local file with name: %s is available", filename)
+            if (not os.path.exists(filename)):
+                logger.debug(genLog("NGAMS_INFO_FILE_NOT_AVAIL", [fileId, host]))
+            else:
+                logger.debug(genLog("NGAMS_INFO_FILE_AVAIL", [fileId, host]))
+                foundFile = 1
+                break
+        else:
+            logger.debug("Checking if file with ID/Version: %s/%s " +\
+                         "is available on host/port: %s/%s",
+                         fileInfoObj.getFileId(), str(fileInfoObj.getFileVersion()),
+                         host, str(port))
+
+            # Remote candidates are either probed one after the other,
+            # or all at once the first time one of them is reached.
+            # In the latter case we still honour the candidates' priority,
+            # and suspended hosts are woken up only when they are reached
+            # (i.e., when all candidates with higher priority failed).
+            # Probes still running when a file is found finish on their own
+            if probeTimeout <= 0 or srvObj.probe_pool is None:
+                available = _probe_reachable_file_access(srvObj, host,
+                                                         hostDic[host],
+                                                         fileInfoObj)
+            else:
+                if probes is None:
+                    remote = {i: c for i, c in enumerate(candidates)
+                              if i >= idx and c[0] != NGAMS_HOST_LOCAL}
+                    probes = _start_file_access_probes(srvObj, hostDic,
+                                                       remote, probeTimeout)
+                available = _wait_file_access_probe(probes[idx], host,
+                                                    probeTimeout)
+                if available is None:
+                    probe = srvObj.probe_pool.apply_async(
+                        _probe_reachable_file_access,
+                        (srvObj, host, hostDic[host], fileInfoObj),
+                        {'timeout': probeTimeout})
+                    wakeUpTimeout = srvObj.getCfg().getWakeUpCallTimeOut() or 0
+                    available = _wait_file_access_probe(probe, host,
+                                                        wakeUpTimeout + probeTimeout)
+
+            if not available:
+                logger.debug(genLog("NGAMS_INFO_FILE_NOT_AVAIL", [fileId, host]))
+            else:
+                logger.debug(genLog("NGAMS_INFO_FILE_AVAIL", [fileId, host]))
+                foundFile = 1
+                break
 
     # If no file was found we raise an exception.
     if (not foundFile):
@@ -291,6 +367,8 @@ def _locateArchiveFile(srvObj,
                    diskInfoObj.getMountPoint(),
                    fileInfoObj.getFilename(), fileInfoObj.getFileId(),
                    fileInfoObj.getFileVersion(), fileInfoObj.getFormat()]
+    if validators:
+        srcFileInfo += [fileInfoObj.getChecksum(), fileInfoObj.getIngestionDate()]
     msg = "Located suitable file for request - File ID: %s. " +\
           "Info for file found - Location: %s - Host ID/IP: %s/%s - " +\
           "Port Number: %s - File Version: %d - Filename: %s - " +\
@@ -301,18 +379,26 @@ def _locateArchiveFile(srvObj,
     return srcFileInfo
 
 
+def _use_location_cache(reqPropsObj):
+    # Only RETRIEVE requests, which are frequent and don't change files,
+    # make use of the location cache
+    return reqPropsObj is not None and reqPropsObj.getCmd() == NGAMS_RETRIEVE_CMD
+
+
 def locateArchiveFile(srvObj,
                       fileId,
                       fileVersion = -1,
                       diskId = "",
                       hostId = "",
-                      reqPropsObj = None):
+                      reqPropsObj = None,
+                      validators = False):
     """
     Locate the file indicated by the File ID. Returns a list containing
     the necessary information for retrieving the file:
 
       [<Location>, <File Host>, <IP Address>, <Port No>, <Mount Point>,
-      <Filename>, <File ID>, <File Version>, <Mime-Type>]
+      <Filename>, <File ID>, <File Version>, <Mime-Type>[, <Checksum>,
+      <Ingestion Date>]]
 
     - whereby:
 
@@ -343,10 +429,19 @@ def locateArchiveFile(srvObj,
     reqPropsObj:  Request Property object to keep track of actions done during
                   the request handling (ngamsReqProps|None).
 
+    validators:   Include also the checksum and ingestion date of the file,
+                  which identify its contents (boolean).
+
     Returns:      List with information about file location (list).
     """
     T = TRACE()
 
+    cache_key = (fileId, 'full', fileVersion, diskId, hostId, validators)
+    if _use_location_cache(reqPropsObj):
+        location = srvObj.location_cache.get(cache_key)
+        if location:
+            return location
+
     # Get a list with the candidate files matching the query conditions.
     res = srvObj.getDb().getFileInfoFromFileId(fileId, fileVersion, diskId,
                                                  ignore=0, dbCursor=False)
@@ -357,8 +452,11 @@ def locateArchiveFile(srvObj,
         file_info = ngamsFileInfo.ngamsFileInfo().unpackSqlResult(r)
         all_info.append((file_info, r[-2], r[-1]))
 
-    return _locateArchiveFile(srvObj, fileId, fileVersion, diskId, hostId,
-                              reqPropsObj, all_info)
+    location = _locateArchiveFile(srvObj, fileId, fileVersion, diskId, hostId,
+                                  reqPropsObj, all_info, validators=validators)
+    if _use_location_cache(reqPropsObj):
+        srvObj.location_cache.put(cache_key, location)
+    return location
 
 
 def quickFileLocate(srvObj,
@@ -367,7 +465,8 @@ def quickFileLocate(srvObj,
                     hostId = None,
                     domain = None,
                     diskId = None,
-                    fileVersion = -1):
+                    fileVersion = -1,
+                    validators = False):
     """
     Return one file matching the given criteria. A quick version of
     locateArchiveFile().
@@ -382,23 +481,38 @@ def quickFileLocate(srvObj,
 
     fileVersion:       Version of file to retrieve (integer).
 
+    validators:        Include also the checksum and ingestion date of the
+                       file, which identify its contents (boolean).
+
     Returns:           Tuple with the information:
 
                          (<Location>, <Host ID>, <Ip Address>, <Port>,
                           <Mountpoint>, <Filename>, <File Version>,
-                          <format>) (tuple).
+                          <format>[, <Checksum>, <Ingestion Date>]) (tuple).
     """
+    cache_key = (fileId, 'quick', fileVersion, diskId, hostId, domain, validators)
+    if _use_location_cache(reqPropsObj):
+        location = srvObj.location_cache.get(cache_key)
+        if location:
+            return location
+
     res = srvObj.getDb().getFileSummary3(fileId, hostId, domain, diskId,
-                                         fileVersion, cursor=False)
+                                         fileVersion, cursor=False,
+                                         validators=validators)
     if res:
         host_id = res[0][0]
         if host_id == srvObj.getHostId():
             location = NGAMS_HOST_LOCAL
         else:
             location = NGAMS_HOST_REMOTE
-        return [location] + list(res[0])
+        location = [location] + list(res[0])
+        if validators and location[-1]:
+            location[-1] = fromiso8601(location[-1], local=True)
+        if _use_location_cache(reqPropsObj):
+            srvObj.location_cache.put(cache_key, location)
+        return location
 
-    return 8 * (None,)
+    return (10 if validators else 8) * (None,)
 
 
 def checkFile(srvObj,
@@ -411,10 +525,11 @@ def checkFile(srvObj,
     If `stop_evt` and `allowed_evt` are given, then `get_checksum_interruptible`
     is used internally by this method; otherwise `get_checksum` is used.
     If `executor` is given, then it is used to carry out the execution of the
-    checksum calculation; otherwise `get_checksum` is used.
+    checksum calculation; otherwise `get_checksum_parallel` is used.
     """
 
-    executor = executor or get_checksum
+    executor = executor or functools.partial(get_checksum_parallel,
+                                             nthreads=srvObj.getCfg().getChecksumThreads())
 
     foundProblem  = 0
     fileInfo      = sum1FileInfo
@@ -575,157 +690,6 @@ def syncCachesCheckFiles(srvObj,
         raise Exception(errMsg)
 
 
-CHECKSUM_NULL = -1
-CHECKSUM_CRC32_INCONSISTENT = 0
-CHECKSUM_CRC32C = 1
-CHECKSUM_CRC32Z = 2
-
-def _normalize_variant(variant_or_name):
-
-    variant = variant_or_name
-
-    if variant is None:
-        variant = CHECKSUM_NULL
-
-    # A plug-in name or variant name
-    elif isinstance(variant, six.string_types):
-        # In NGAS versions <= 8 the CRC was calculated as a separate step after
-        # archiving a file, and therefore was loaded as a plugin that received a
-        # filename when invoked.
-        # These two are the names stored at the database of those plugins, although
-        # the second one is simply a dummy name
-        if variant in ('ngamsGenCrc32', 'StreamCrc32', 'crc32'):
-            variant = CHECKSUM_CRC32_INCONSISTENT
-        elif variant == 'crc32c':
-            variant = CHECKSUM_CRC32C
-        elif variant == 'crc32z':
-            variant = CHECKSUM_CRC32Z
-        else:
-            variant = int(variant)
-
-    return variant
-
-def _filter_none(cond):
-    def wrapped(x, y):
-        if x is None:
-            return y is None
-        elif y is None:
-            return x is None
-        return cond(x, y)
-    return wrapped
-
-def get_checksum_info(variant_or_name):
-    """
-    Given a CRC variant, this method returns the method that should be
-    continuously called to calculate the CRC of a given byte stream.
-
-    The variant_or_name argument can be a number, where 0 is python's binascii
-    crc32 implementation and 1 is Intel's SSE 4.2 CRC32c implementation, or a
-    name indicating one of the old NGAMS plug-in names for performing CRC.
-    The special value -1 means that no checksum is performed, and thus this
-    method returns None
-    """
-    variant = _normalize_variant(variant_or_name)
-    if variant == CHECKSUM_NULL:
-        return None
-    if variant == CHECKSUM_CRC32_INCONSISTENT:
-        # This version of the crc is inconsistent because depending on the
-        # python version binascii.crc32 returns signed or unsigned values.
-        # python version <2.6 returned signed/unsigned depending on the platform,
-        # 2.6+ returns always signed, 3+ returns always unsigned).
-        fmt = '!i' if six.PY2 else '!I'
-        return checksum_info(0, binascii.crc32, lambda x: x, lambda x: struct.unpack(fmt, x)[0], _filter_none(lambda x, y: (int(x) & 0xffffffff) == (int(y) & 0xffffffff)))
-    elif variant == CHECKSUM_CRC32C:
-        if not _crc32c_available:
-            raise Exception('Intel SSE 4.2 CRC32c instruction is not available')
-        return checksum_info(0, crc32c.crc32, lambda x: x & 0xffffffff, lambda x: struct.unpack('!I', x)[0], _filter_none(lambda x, y: int(x) == int(y)))
-    elif variant == CHECKSUM_CRC32Z:
-        # A consistent way of using binascii.crc32.
-        return checksum_info(0, binascii.crc32, lambda x: x & 0xffffffff, lambda x: struct.unpack('!I', x)[0], _filter_none(lambda x, y: int(x) == int(y)))
-    raise Exception('Unknown CRC variant: %r' % (variant_or_name,))
-
-def get_checksum_name(variant_or_name):
-    """
-    Given a CRC variant, this method returns the name used to denote that
-    variant.
-
-    The variant_or_name argument can be a number, where 0 is python's binascii
-    crc32 implementation and 1 is Intel's SSE 4.2 CRC32c implementation, or a
-    name indicating one of the old NGAMS plug-in names for performing CRC.
-    The special value -1 means that no checksum is performed, and thus this
-    method returns 'nocrc'
-    """
-    variant = _normalize_variant(variant_or_name)
-    if variant == CHECKSUM_NULL:
-        return None
-    if variant == CHECKSUM_CRC32_INCONSISTENT:
-        return 'crc32'
-    elif variant == CHECKSUM_CRC32C:
-        return 'crc32c'
-    elif variant == CHECKSUM_CRC32Z:
-        return 'crc32z'
-    raise Exception('Unknown CRC variant: %d' % (variant_or_name,))
-
-def get_checksum(blocksize, fin, checksum_variant):
-    """
-    Returns the checksum of a file (or file object) using the given checksum type.
-    """
-    crc_info = get_checksum_info(checksum_variant)
-    if crc_info is None:
-        return None
-
-    crc_m = crc_info.method
-
-    # fin can be a filename, in which case we open (and then close) it
-    my_fileobj = None
-    fileobj = fin
-    if isinstance(fin, six.string_types):
-        my_fileobj = fileobj = open(fin, 'rb')
-
-    # Read and checksum, thank you very much
-    read = fileobj.read
-    crc = crc_info.init
-    try:
-        while True:
-            block = read(blocksize)
-            if not block:
-                break
-            crc = crc_m(block, crc)
-    finally:
-        # We opened it, we close it
-        if my_fileobj:
-            try:
-                my_fileobj.close()
-            except:
-                pass
-
-    crc = crc_info.final(crc)
-    return crc
-
-def get_checksum_interruptible(blocksize, filename, checksum_variant,
-                               checksum_allow_evt, checksum_stop_evt):
-    """
-    Like get_checksum, but the inner loop's execution is conditioned by two
-    events to signal a full stop, and whether the execution of the inner loop
-    should continue or not.
-
-    When the caller sets the `stop_evt`, the `allowed_evt` should also be set;
-    otherwise the execution will hang indefinitely.
-    """
-    crc_info = get_checksum_info(checksum_variant)
-    if crc_info is None:
-        return None
-    crc_m = crc_info.method
-    crc = crc_info.init
-    with open(filename, 'rb') as f:
-        for block in iter(functools.partial(f.read, blocksize), b''):
-            checksum_allow_evt.wait()
-            if checksum_stop_evt.is_set():
-                return
-            crc = crc_m(block, crc)
-    crc = crc_info.final(crc)
-    return crc
-
 def check_checksum(srvObj, fio, filename):
     """
     Check the checksum of a file by applying the given checksum method and
@@ -752,7 +716,8 @@ def check_checksum(srvObj, fio, filename):
         blockSize = srvObj.getCfg().getBlockSize()
         if blockSize == -1:
             blockSize = 4096
-        current_checksum = str(get_checksum(blockSize, filename, crc_variant))
+        nthreads = srvObj.getCfg().getChecksumThreads()
+        current_checksum = str(get_checksum_parallel(blockSize, filename, crc_variant, nthreads))
         if not checksum_info.equals(current_checksum, stored_checksum):
             msg = "Illegal checksum (found: %s, expected %s) on file %s/%s/%s" % \
                   (current_checksum, stored_checksum, fio.getDiskId(), fio.getFileId(), fio.getFileVersion())
@@ -929,7 +929,7 @@ def checkSourceArchives(srvObj):
     T = TRACE()
 
     # Dump the information for all files managed by this cluster.
-    clusterName = srvObj.getDb().getClusterNameFromHostId(srvObj.getHostId())
+    clusterName = srvObj.host_topology.get(srvObj.getHostId()).getClusterName()
     clusterFilesDbmName = "%s/%s_%s" %\
                           (ngamsHighLevelLib.\
                            getNgasChacheDir(srvObj.getCfg()),
@@ -52,6 +52,42 @@ from . import ngamsArchiveUtils, ngamsCacheControlThread
 
 logger = logging.getLogger(__name__)
 
+def _writePendingFiles(srvObj, pendingFiles, pendingMoves, pendingVersions,
+                       regDbm=None):
+    """
+    Write the entries of the files registered since the last call,
+    returning how many of them failed. Files whose entries couldn't be
+    written are moved back to their original location, as found in
+    `pendingMoves`, together with the confirmation log message and the
+    entry for the registration report of each file.
+    """
+    failed = ngamsArchiveUtils.writeFileEntries(srvObj, pendingFiles)
+    failedKeys = set()
+    for fileInfo, e in failed:
+        key = (fileInfo.getDiskId(), fileInfo.getFileId(),
+               fileInfo.getFileVersion())
+        failedKeys.add(key)
+        filename, complFilename, mode, _, notifFileObj = pendingMoves[key]
+        errMsg = genLog("NGAMS_ER_FILE_REG_FAILED", [filename, str(e)])
+        logger.error(errMsg)
+        if notifFileObj is not None:
+            notifFileObj.setTag(errMsg)
+        try:
+            os.chmod(complFilename, mode)
+            mvFile(complFilename, filename)
+        except Exception:
+            logger.exception("Error moving file %s back to %s",
+                             complFilename, filename)
+
+    for key, (_, _, _, msg, notifFileObj) in pendingMoves.items():
+        if key not in failedKeys:
+            logger.info(msg, extra={'to_syslog': 1})
+        if regDbm is not None:
+            regDbm.addIncKey(notifFileObj)
+    pendingMoves.clear()
+    pendingVersions.clear()
+    return len(failed)
+
 def _registerExec(srvObj,
                   fileListDbmName,
                   tmpFilePat,
@@ -167,6 +203,11 @@ def _registerExec(srvObj,
     fileRejectCount = 0
     regTimeAccu     = 0.0
     fileCount       = 0
+    pendingFiles    = []
+    pendingMoves    = {}
+    pendingVersions = {}
+    if not emailNotif:
+        regDbm = None
     fo = open(sortFileList)
     run = 1
     while (run):
@@ -193,14 +234,34 @@ def _registerExec(srvObj,
                          setCmd(NGAMS_REGISTER_CMD).\
                          setSize(os.path.getsize(filename)).\
                          setFileUri(filename).\
-                         setNoReplication(1)
+                         setNoReplication(1).\
+                         setPendingFileVersions(pendingVersions)
 
         tmpFileObj = ngamsFileInfo.ngamsFileInfo()
+        notifPending = False
         try:
             # Invoke Registration Plug-In.
             piName = regPi.name
             plugInMethod = loadPlugInEntryPoint(piName)
             piRes = plugInMethod(srvObj, tmpReqPropsObj, params)
+
+            # The previous version of the file must be in the DB before this
+            # one is written. Plug-ins not taking into account the versions
+            # still pending might also give the same version to two files,
+            # in which case it is recalculated once the pending ones are in
+            # the DB
+            pendingVersion = pendingVersions.get(piRes.getFileId())
+            if pendingVersion is not None:
+                failCount = _writePendingFiles(srvObj, pendingFiles,
+                                               pendingMoves, pendingVersions,
+                                               regDbm)
+                fileRegCount -= failCount
+                fileFailCount += failCount
+                if piRes.getFileVersion() <= pendingVersion:
+                    newVersion = ngamsHighLevelLib.\
+                                 getNewFileVersion(srvObj.getDb(),
+                                                   piRes.getFileId())
+                    piRes.setFileVersion(newVersion)
             del tmpReqPropsObj
 
             # Check if this file is already registered on this disk. In case
@@ -249,10 +310,10 @@ def _registerExec(srvObj,
                 checksum = ""
 
             # Move file and update information about file in the NGAS DB.
+            # The entries of new files are written in batches, and the files
+            # are moved back if that fails.
+            mode = os.stat(filename).st_mode & 0o7777
             mvFile(filename, piRes.getCompleteFilename())
-            ngamsArchiveUtils.updateFileInfoDb(srvObj, piRes, checksum,
-                                               checksumPlugIn)
-            ngamsDiskUtils.updateDiskStatusDb(srvObj.getDb(), piRes)
             ngamsLib.makeFileReadOnly(piRes.getCompleteFilename())
 
             if (emailNotif):
@@ -275,6 +336,32 @@ def _registerExec(srvObj,
                              setFileStatus(NGAMS_FILE_STATUS_OK).\
                              setCreationDate(creDateSecs).\
                              setTag("REGISTERED")
+
+            # The confirmation log entry (and the registration report entry)
+            # of batched files is generated once their entries are written.
+            msg = genLog("NGAMS_INFO_FILE_REGISTERED",
+                         [filename, piRes.getFileId(), piRes.getFileVersion(),
+                          piRes.getFormat()])
+            regTime = time.time() - reg_start
+            msg = msg + ". Time: %.3fs." % (regTime)
+
+            nPending = len(pendingFiles)
+            ngamsArchiveUtils.updateFileInfoDb(srvObj, piRes, checksum,
+                                               checksumPlugIn,
+                                               batch=pendingFiles)
+            if len(pendingFiles) > nPending:
+                key = (piRes.getDiskId(), piRes.getFileId(),
+                       piRes.getFileVersion())
+                pendingMoves[key] = (filename, piRes.getCompleteFilename(),
+                                     mode, msg,
+                                     tmpFileObj if emailNotif else None)
+                pendingVersions[piRes.getFileId()] = \
+                    max(piRes.getFileVersion(),
+                        pendingVersions.get(piRes.getFileId(), -1))
+                notifPending = True
+            else:
+                ngamsDiskUtils.updateDiskStatusDb(srvObj.getDb(), piRes)
+                logger.info(msg, extra={'to_syslog': 1})
             fileRegCount += 1
 
             # If running as a cache archive, update the Cache New Files DBM
@@ -284,15 +371,6 @@ def _registerExec(srvObj,
                 ngamsCacheControlThread.addEntryNewFilesDbm(srvObj, diskId,
                                                             piRes.getFileId(),
                                                             fileVer, filename)
-
-            # Generate a confirmation log entry.
-            msg = genLog("NGAMS_INFO_FILE_REGISTERED",
-                         [filename, piRes.getFileId(), piRes.getFileVersion(),
-                          piRes.getFormat()])
-            time.sleep(0.005)
-            regTime = time.time() - reg_start
-            msg = msg + ". Time: %.3fs." % (regTime)
-            logger.info(msg, extra={'to_syslog': 1})
         except Exception as e:
             errMsg = genLog("NGAMS_ER_FILE_REG_FAILED", [filename, str(e)])
             logger.error(errMsg)
@@ -307,7 +385,13 @@ def _registerExec(srvObj,
             #      client-side
 
         # Add the file information in the registration report.
-        if (emailNotif): regDbm.addIncKey(tmpFileObj)
+        if (emailNotif and not notifPending): regDbm.addIncKey(tmpFileObj)
+
+        if len(pendingFiles) >= ngamsArchiveUtils.FILE_ENTRIES_BATCH_SIZE:
+            failCount = _writePendingFiles(srvObj, pendingFiles, pendingMoves,
+                                           pendingVersions, regDbm)
+            fileRegCount -= failCount
+            fileFailCount += failCount
 
         # Update request status time information.
         regTimeAccu += regTime
@@ -317,6 +401,10 @@ def _registerExec(srvObj,
                                                    regTimeAccu)
         fileCount += 1
     fo.close()
+    failCount = _writePendingFiles(srvObj, pendingFiles, pendingMoves,
+                                   pendingVersions, regDbm)
+    fileRegCount -= failCount
+    fileFailCount += failCount
     rmFile(sortFileList)
     if (emailNotif): regDbm.sync()
     del fileListDbm
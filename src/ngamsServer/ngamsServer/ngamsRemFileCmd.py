@@ -144,6 +144,7 @@ def _remFile(srvObj,
                 # for the number of available copies.
                 try:
                     srvObj.getDb().deleteFileInfo(srvObj.getHostId(), diskId, fileId, fileVer)
+                    srvObj.location_cache.invalidate(fileId)
                     infoMsg = genLog("NGAMS_INFO_DEL_FILE",
                                      [diskId, fileId, fileVer])
                     logger.debug(infoMsg)
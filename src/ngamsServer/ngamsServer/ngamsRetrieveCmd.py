@@ -31,6 +31,9 @@
 Function + code to handle the RETRIEVE Command.
 """
 
+import base64
+import binascii
+import email.utils
 import logging
 import os
 import shutil
@@ -39,7 +42,7 @@ import time
 
 from ngamsLib import ngamsDppiStatus
 from ngamsLib.ngamsCore import NGAMS_TEXT_MT, getFileSize, \
-    TRACE, genLog, NGAMS_PROC_FILE, \
+    TRACE, genLog, NGAMS_PROC_FILE, NGAMS_HTTP_NOT_MODIFIED, \
     NGAMS_HOST_LOCAL, \
     NGAMS_HOST_CLUSTER, NGAMS_HOST_REMOTE, \
     NGAMS_ONLINE_STATE, NGAMS_IDLE_SUBSTATE, \
@@ -166,10 +169,92 @@ def cleanUpAfterProc(statusObjList):
                 shutil.rmtree(resObj.getProcDir())
 
 
+# RFC 3230/5843 names of the digests we know about
+_rfc3230_names = {'md5': 'MD5', 'sha1': 'SHA', 'sha256': 'SHA-256',
+                  'sha512': 'SHA-512'}
+
+def _digest_header(digests):
+    """Formats `digests` as the value of an RFC 3230 Digest header"""
+    return ','.join('%s=%s' % (_rfc3230_names.get(name, name),
+                               base64.b64encode(binascii.unhexlify(value)).decode('ascii'))
+                    for name, value in sorted(digests.items()))
+
+def parse_range_header(value):
+    """
+    Parses the value of an HTTP Range header (RFC 7233) into a list of
+    (first, last) byte positions. `last` is None for open ranges
+    (``bytes=first-``), while `first` is None for suffix ranges
+    (``bytes=-length``), in which case `last` is the suffix length.
+    """
+    unit, _, spec = value.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec.strip():
+        raise ValueError("Invalid Range header, must have the form 'bytes=range[,range...]'")
+
+    ranges = []
+    for r in spec.split(','):
+        first, sep, last = r.strip().partition('-')
+        if (not sep or not (first or last) or
+            not all(x.isdigit() for x in (first, last) if x)):
+            raise ValueError("Invalid Range header, invalid range: %s" % r.strip())
+        first = int(first) if first else None
+        last = int(last) if last else None
+        if first is not None and last is not None and last < first:
+            raise ValueError("Invalid Range header, invalid range: %s" % r.strip())
+        ranges.append((first, last))
+    return ranges
+
+def _validators(fileVersion, checksum, ing_date):
+    """
+    Returns the ETag and Last-Modified headers for the given file version,
+    based on its checksum and ingestion date.
+    """
+    hdrs = {}
+    if checksum:
+        hdrs['ETag'] = '"%d-%s"' % (fileVersion, checksum)
+    if ing_date is not None:
+        hdrs['Last-Modified'] = email.utils.formatdate(ing_date, usegmt=True)
+    return hdrs
+
+def _wanted_digests(srvObj, reqPropsObj, fileId, fileVersion):
+    """
+    Returns the additional digests of the given file that the client asked
+    for in its Want-Digest header (RFC 3230), if any.
+    """
+    want_digest = reqPropsObj.getHttpHdr('want-digest')
+    if not want_digest or not srvObj.getCfg().getArchiveDigests():
+        return None
+    wanted = set(w.split(';')[0].strip().lower() for w in want_digest.split(','))
+    digests = srvObj.getDb().getFileDigests(fileId, fileVersion)
+    return {name: value for name, value in digests.items()
+            if '*' in wanted or _rfc3230_names.get(name, name).lower() in wanted}
+
+def _not_modified(reqPropsObj, validators, ing_date):
+    """
+    Whether the client already holds the file according to its If-None-Match
+    or If-Modified-Since headers (RFC 7232).
+    """
+    if_none_match = reqPropsObj.getHttpHdr('if-none-match')
+    if if_none_match is not None:
+        if 'ETag' not in validators:
+            return False
+        tags = [t.strip() for t in if_none_match.split(',')]
+        tags = [t[2:] if t.startswith('W/') else t for t in tags]
+        return '*' in tags or validators['ETag'] in tags
+
+    if_modified_since = reqPropsObj.getHttpHdr('if-modified-since')
+    if if_modified_since is None or ing_date is None:
+        return False
+    since = email.utils.parsedate_tz(if_modified_since)
+    if since is None:
+        return False
+    return int(ing_date) <= email.utils.mktime_tz(since)
+
 def genReplyRetrieve(srvObj,
                      reqPropsObj,
                      httpRef,
-                     statusObjList):
+                     statusObjList,
+                     digests=None,
+                     validators=None):
     """
     Function to send back a reply with the result queried with the
     RETRIEVE command. After having send back the result, the
@@ -188,6 +273,12 @@ def genReplyRetrieve(srvObj,
                      ngamsCmdHandling.performProcessing()
                      (list/ngamsDppiStatus objects).
 
+    digests:         Additional digests of the file being sent, reported
+                     to the client in a Digest header (dict).
+
+    validators:      ETag and Last-Modified headers of the file being sent
+                     (dict).
+
     Returns:         Void.
     """
 
@@ -197,14 +288,14 @@ def genReplyRetrieve(srvObj,
         resObj = statusObjList[0].getResultObject(0)
 
         if resObj.getObjDataType() == NGAMS_PROC_FILE:
-            # See if client requested partial content
-            # This applies (currently) to files only
-            start_byte = 0
-            if reqPropsObj.retrieve_offset > 0:
-                start_byte = reqPropsObj.retrieve_offset
+            # Partial content applies (currently) to files only
+            hdrs = dict(validators or {})
+            if digests:
+                hdrs['Digest'] = _digest_header(digests)
 
             httpRef.send_file(resObj.getDataRef(), resObj.getMimeType(),
-                              start_byte=start_byte, fname=resObj.getRefFilename())
+                              fname=resObj.getRefFilename(), hdrs=hdrs,
+                              ranges=reqPropsObj.retrieve_ranges)
         else:
             httpRef.send_data(resObj.getDataRef(), resObj.getMimeType(), fname=resObj.getRefFilename())
 
@@ -271,18 +362,19 @@ def _handleCmdRetrieve(srvObj,
     ipAddress = None
     if (quickLocation):
         location, host, ipAddress, port, mountPoint, filename,\
-                  fileVersion, mimeType =\
+                  fileVersion, mimeType, checksum, ing_date =\
                   ngamsFileUtils.quickFileLocate(srvObj, reqPropsObj, fileId,
                                                  hostId, domain, diskId,
-                                                 fileVer)
+                                                 fileVer, validators=True)
 
     # If not located the quick way try the normal way.
     if (not ipAddress):
         # Locate the file best suiting the query and send it back if possible.
         location, host, ipAddress, port, mountPoint, filename, fileId,\
-                  fileVersion, mimeType =\
+                  fileVersion, mimeType, checksum, ing_date =\
                   ngamsFileUtils.locateArchiveFile(srvObj, fileId, fileVer,
-                                                   diskId, hostId, reqPropsObj)
+                                                   diskId, hostId, reqPropsObj,
+                                                   validators=True)
 
     # If still not located, try to contact associated NGAS sites to query
     # if the file is available there.
@@ -291,6 +383,17 @@ def _handleCmdRetrieve(srvObj,
         pass
 
     if (location == NGAMS_HOST_LOCAL):
+        # Clients already holding the file don't need it again.
+        # This applies only to the original contents of the file
+        validators = None
+        if 'processing' not in reqPropsObj:
+            validators = _validators(fileVersion, checksum, ing_date)
+            if _not_modified(reqPropsObj, validators, ing_date):
+                logger.info("Client already holds %s/%d, not sending it", fileId, fileVersion)
+                httpRef.send_response(NGAMS_HTTP_NOT_MODIFIED, hdrs=validators)
+                httpRef.end_headers()
+                return
+
         # Get the file and send back the contents from this NGAS host.
         srcFilename = os.path.normpath("{0}/{1}".format(mountPoint, filename))
 
@@ -299,6 +402,11 @@ def _handleCmdRetrieve(srvObj,
 
         # Perform the possible processing requested.
         procResult = performProcessing(srvObj,reqPropsObj,srcFilename,mimeType)
+
+        # Additional digests apply only to the original contents of the file
+        digests = None
+        if 'processing' not in reqPropsObj:
+            digests = _wanted_digests(srvObj, reqPropsObj, fileId, fileVersion)
     elif location in (NGAMS_HOST_CLUSTER, NGAMS_HOST_REMOTE) and \
          srvObj.getCfg().getProxyMode():
 
@@ -319,7 +427,8 @@ def _handleCmdRetrieve(srvObj,
         return
 
     # Send back reply with the result(s) queried and possibly processed.
-    genReplyRetrieve(srvObj, reqPropsObj, httpRef, procResult)
+    genReplyRetrieve(srvObj, reqPropsObj, httpRef, procResult, digests=digests,
+                     validators=validators)
 
 
 def handleCmd(srvObj,
@@ -352,17 +461,9 @@ def handleCmd(srvObj,
         srvObj.setSubState(NGAMS_IDLE_SUBSTATE)
         raise Exception(errMsg)
 
-    # See if client requested partial content and remember the starting offset
-    retrieve_offset = 0
+    # See if client requested partial content and remember the ranges
     range_hdr = reqPropsObj.getHttpHdr('range')
-    if range_hdr:
-        try:
-            retrieve_offset = int(range_hdr[6:-1])
-            if retrieve_offset < 0:
-                raise
-        except:
-            raise ValueError("Invalid Range header, must have the form 'bytes=start-' (start offset only)")
-    reqPropsObj.retrieve_offset = retrieve_offset
+    reqPropsObj.retrieve_ranges = parse_range_header(range_hdr) if range_hdr else None
 
     _handleCmdRetrieve(srvObj, reqPropsObj, httpRef)
     srvObj.setSubState(NGAMS_IDLE_SUBSTATE)
@@ -48,6 +48,7 @@ import threading
 import time
 import traceback
 import uuid
+from multiprocessing.pool import ThreadPool
 
 import six
 from six.moves import reduce # @UnresolvedImport
@@ -61,12 +62,14 @@ from ngamsLib.ngamsCore import genLog, TRACE, getNgamsVersion, \
     getFileSize, getDiskSpaceAvail, checkCreatePath,\
     getHostName, ngamsCopyrightString, getNgamsLicense,\
     NGAMS_HTTP_REDIRECT, NGAMS_HTTP_INT_AUTH_USER, \
+    NGAMS_HTTP_PARTIAL, NGAMS_HTTP_BAD_RANGE, NGAMS_HTTP_NOT_MODIFIED, \
     NGAMS_SUCCESS, NGAMS_FAILURE, NGAMS_OFFLINE_STATE,\
     NGAMS_IDLE_SUBSTATE, NGAMS_BUSY_SUBSTATE, NGAMS_NOTIF_ERROR,\
     NGAMS_NOT_SET, NGAMS_XML_MT, loadPlugInEntryPoint, isoTime2Secs,\
     toiso8601
 from ngamsLib import ngamsHighLevelLib, ngamsLib, ngamsEvent, ngamsHttpUtils
-from ngamsLib import ngamsDb, ngamsConfig, ngamsReqProps
+from ngamsLib import ngamsBufferPool, io_hints
+from ngamsLib import ngamsDb, ngamsDbCore, ngamsConfig, ngamsReqProps
 from ngamsLib import ngamsStatus, ngamsHostInfo, ngamsNotification
 from . import ngamsAuthUtils, ngamsCmdHandling, ngamsSrvUtils
 from . import ngamsJanitorThread
@@ -75,7 +78,12 @@ from . import ngamsUserServiceThread
 from . import ngamsMirroringControlThread
 from . import ngamsCacheControlThread
 from . import request_db
+from . import durability
+from . import host_topology
+from . import location_cache
+from . import worker_pool
 from . import pysendfile
+from . import request_processes
 
 
 logger = logging.getLogger(__name__)
@@ -97,6 +105,12 @@ class ngamsHttpServer(socketserver.ThreadingMixIn,
     allow_reuse_address = 1
     daemon_threads = False
 
+    # Set when the server is being replaced, connections are not kept alive
+    draining = False
+
+    # Whether connections can be kept alive between requests
+    keep_alive = True
+
     def __init__(self, ngamsServer, server_address):
         self._ngamsServer = ngamsServer
 
@@ -114,13 +128,82 @@ class ngamsHttpServer(socketserver.ThreadingMixIn,
 
         if self._ngamsServer.serving_count >= self._ngamsServer.getCfg().getMaxSimReqs():
             logger.error("Maximum number of serving threads reached, rejecting request")
-            wfile = request.makefile('wb')
-            wfile.write(b'HTTP/1.0 503 Service Unavailable\r\n\r\n')
+            _reject_request(request)
             return
 
         socketserver.ThreadingMixIn.process_request(self, request, client_address)
 
 
+def _reject_request(request):
+    wfile = request.makefile('wb')
+    wfile.write(b'HTTP/1.0 503 Service Unavailable\r\n\r\n')
+
+
+class ngamsPooledHttpServer(BaseHTTPServer.HTTPServer):
+    """
+    HTTP server serving requests with pre-started worker threads. Requests for
+    the configured quick commands are served by their own group of threads,
+    so they are not held back by long-running requests (e.g., archiving).
+    Requests that cannot be queued, or that wait too long in the queue, are
+    rejected with a 503 HTTP code.
+    """
+    allow_reuse_address = 1
+    draining = False
+
+    # Connections are dispatched to a group of threads based on their first
+    # request, so idle connections would hold a worker thread while waiting
+    # for requests that might belong to another group
+    keep_alive = False
+
+    def __init__(self, ngamsServer, server_address):
+        self._ngamsServer = ngamsServer
+        cfg = ngamsServer.cfg
+        if cfg.getKeepAliveTimeout() > 0:
+            logger.warning("Connections are not kept alive when using worker threads")
+
+        self.request_queue_size = cfg.getMaxSimReqs()
+        BaseHTTPServer.HTTPServer.__init__(self, server_address, ngamsHttpRequestHandler)
+
+        queue_size = cfg.getRequestQueueSize()
+        queue_timeout = cfg.getRequestQueueTimeout()
+        self._pools = [worker_pool.WorkerPool('W', cfg.getWorkerThreads(),
+                                              queue_size, queue_timeout)]
+        pools_by_cmd = {}
+        if cfg.getQuickWorkerThreads() > 0 and cfg.getQuickCommands():
+            quick = worker_pool.WorkerPool('Q', cfg.getQuickWorkerThreads(),
+                                           queue_size, queue_timeout)
+            self._pools.append(quick)
+            pools_by_cmd = {cmd: quick for cmd in cfg.getQuickCommands()}
+        self._dispatcher = worker_pool.Dispatcher(self._pools[0], pools_by_cmd,
+                                                  cfg.getTimeOut() or 60)
+
+    def process_request(self, request, client_address):
+        self._dispatcher.dispatch(request, self._serve, self._reject,
+                                  request, client_address)
+
+    def _serve(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def _reject(self, request, client_address):
+        try:
+            _reject_request(request)
+        except socket.error:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+    def shutdown(self):
+        BaseHTTPServer.HTTPServer.shutdown(self)
+        self._dispatcher.stop()
+        for pool in self._pools:
+            pool.stop()
+
+
 class _atomic_counter(object):
     """A simple atomic counter"""
 
@@ -134,6 +217,64 @@ class _atomic_counter(object):
             self.val += 1
             return val
 
+class _counting_reader(object):
+    """
+    Wraps the file object from which requests are read, counting how many
+    bytes have been read from it since the last reset
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self.count = 0
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def read(self, *args):
+        data = self._f.read(*args)
+        self.count += len(data)
+        return data
+
+    def read1(self, *args):
+        data = self._f.read1(*args)
+        self.count += len(data)
+        return data
+
+    def readline(self, *args):
+        data = self._f.readline(*args)
+        self.count += len(data)
+        return data
+
+    def readinto(self, b):
+        n = ngamsBufferPool.readinto(self._f, b)
+        self.count += n
+        return n
+
+def resolve_byte_ranges(ranges, size):
+    """
+    Resolves the (first, last) byte `ranges` requested by a client (where
+    `last` is None for open ranges, and `first` is None for suffix ranges)
+    into the actual extents of a file of `size` bytes. Unsatisfiable ranges
+    are left out, so an empty list means no range can be satisfied.
+    """
+    extents = []
+    for first, last in ranges:
+        if first is None:
+            if last == 0:
+                continue
+            first, last = max(size - last, 0), size - 1
+        elif last is None or last >= size:
+            last = size - 1
+        if first >= size:
+            continue
+        extents.append((first, last))
+    return extents
+
+# Headers that describe a single connection instead of the response itself
+_HOP_BY_HOP_HDRS = ('connection', 'keep-alive', 'proxy-authenticate',
+                    'proxy-authorization', 'te', 'trailers', 'transfer-encoding',
+                    'upgrade')
+
 class ngamsHttpRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
     """
     Class used to handle an HTTP request.
@@ -142,6 +283,9 @@ class ngamsHttpRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
     server_version = "NGAMS/" + getNgamsVersion()
     req_count = _atomic_counter(0)
 
+    # Called right before the reply is sent
+    before_reply = None
+
     def setup(self):
 
         self.ngasServer = self.server._ngamsServer
@@ -152,13 +296,58 @@ class ngamsHttpRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         cfg = self.ngasServer.getCfg()
         self.timeout = cfg.getTimeOut() or 60
 
+        # With a keep-alive timeout we speak HTTP/1.1, and serve
+        # more than one request per connection
+        self.keep_alive_timeout = 0
+        if self.server.keep_alive:
+            self.keep_alive_timeout = cfg.getKeepAliveTimeout()
+        self.keep_alive_max_requests = cfg.getKeepAliveMaxRequests()
+        if self.keep_alive_timeout > 0:
+            self.protocol_version = 'HTTP/1.1'
+        self.requests_served = 0
+
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        if self.keep_alive_timeout > 0:
+            self.rfile = _counting_reader(self.rfile)
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            # Wait for the next request only up to the keep-alive timeout,
+            # the normal timeout is restored once it starts arriving
+            self.connection.settimeout(self.keep_alive_timeout)
+            self.handle_one_request()
+
+    def parse_request(self):
+
         # Make the name of the current thread more unique
         # This is important because we currently use the thread name to uniquely
         # map log statements to individual requests. Log statements use
         req_num = self.req_count.inc()
         threading.current_thread().setName('R-%d' % req_num)
 
-        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.connection.settimeout(self.timeout)
+        if not BaseHTTPServer.BaseHTTPRequestHandler.parse_request(self):
+            return False
+
+        self.requests_served += 1
+        if self.requests_served >= self.keep_alive_max_requests:
+            self.close_connection = True
+        if isinstance(self.rfile, _counting_reader):
+            self.rfile.count = 0
+        return True
+
+    def _body_consumed(self):
+        """Whether the body of the current request has been read completely"""
+        if not isinstance(self.rfile, _counting_reader):
+            return False
+        size = self.headers.get('content-length')
+        try:
+            size = int(size) if size else 0
+        except ValueError:
+            return False
+        return self.rfile.count >= size and 'transfer-encoding' not in self.headers
 
     def version_string(self):
         return self.server_version
@@ -191,7 +380,12 @@ class ngamsHttpRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         try:
             self.ngasServer.reqCallBack(self, self.client_address, self.command,
                                         path, self.headers)
+
+            # Unread data would be taken as the next request
+            if not self._body_consumed():
+                self.close_connection = True
         except socket.error:
+            self.close_connection = True
             # BaseHTTPRequestHandler.handle does wfile.flush() after this method
             # returns. If there is a problem with the connection to the client
             # there would be further exceptions because of this, which are
@@ -220,7 +414,24 @@ class ngamsHttpRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
             raise Exception("Tried to send two responses :(")
         self.reply_sent = True
 
+        if self.before_reply:
+            self.before_reply()
+
         BaseHTTPServer.BaseHTTPRequestHandler.send_response(self, code, message=message)
+
+        # Without a Content-Length the client can only know where the response
+        # ends if we close the connection (unless it has no body at all), and
+        # the same happens if there's request data left unread
+        has_length = (code == NGAMS_HTTP_NOT_MODIFIED or
+                      any(k.lower() == 'content-length' for k in hdrs))
+        if not has_length or not self._body_consumed() or self.server.draining:
+            self.close_connection = True
+        if self.protocol_version == 'HTTP/1.1':
+            if self.close_connection and self.request_version == 'HTTP/1.1':
+                self.send_header('Connection', 'close')
+            elif not self.close_connection and self.request_version == 'HTTP/1.0':
+                self.send_header('Connection', 'keep-alive')
+
         for k, v in hdrs.items():
             self.send_header(k, v)
 
@@ -233,39 +444,88 @@ class ngamsHttpRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         location = 'http://%s:%d%s' % (host, port, path)
 
         logger.info("Redirecting client to %s", location)
-        self.send_response(NGAMS_HTTP_REDIRECT, hdrs={'Location': location})
+        self.send_response(NGAMS_HTTP_REDIRECT, hdrs={'Location': location,
+                                                      'Content-Length': '0'})
         self.end_headers()
 
-    def send_file(self, f, mime_type, start_byte=0, fname=None):
+    def send_file(self, f, mime_type, start_byte=0, fname=None, hdrs={}, ranges=None):
         """
         Sends file `f` of type `mime_type` to the client. Optionally a different
-        starting byte to start the transmission from, and a different name for
-        the file to present the data to the user can be given.
+        starting byte to start the transmission from, a list of byte `ranges`
+        as given by the client (see `resolve_byte_ranges`), a different name
+        for the file to present the data to the user, and additional headers
+        can be given.
         """
 
         fname = fname or os.path.basename(f)
         size = getFileSize(f)
-
-        # Headers we want to send
-        hdrs = {'Content-Type': mime_type,
-                'Content-Disposition': 'attachment; filename="%s"' % fname,
-                'Content-Length': str(size - start_byte)}
         if start_byte:
-            hdrs['Accept-Ranges'] = 'bytes'
-            hdrs["Content-Range"] = "bytes %d-%d/%d" % (start_byte, size - 1, size)
+            ranges = [(start_byte, None)]
 
-        self.send_response(200, hdrs=hdrs)
+        # Headers we want to send
+        hdrs = dict(hdrs)
+        hdrs['Accept-Ranges'] = 'bytes'
+        hdrs['Content-Disposition'] = 'attachment; filename="%s"' % fname
+
+        extents = [(0, size - 1)]
+        code = 200
+        if ranges:
+            extents = resolve_byte_ranges(ranges, size)
+            if not extents:
+                msg = "None of the requested ranges can be satisfied, file is %d bytes long" % size
+                self.send_status(msg, status=NGAMS_FAILURE, code=NGAMS_HTTP_BAD_RANGE,
+                                 hdrs={'Content-Range': 'bytes */%d' % size})
+                return
+            code = NGAMS_HTTP_PARTIAL
+
+        # A single extent is sent as the body, several of them as the parts of
+        # a multipart/byteranges body; in both cases we know the exact length
+        parts = []
+        if len(extents) == 1:
+            first, last = extents[0]
+            hdrs['Content-Type'] = mime_type
+            hdrs['Content-Length'] = str(last - first + 1)
+            if code == NGAMS_HTTP_PARTIAL:
+                hdrs['Content-Range'] = 'bytes %d-%d/%d' % (first, last, size)
+            parts.append((b'', first, last))
+            trailer = b''
+        else:
+            boundary = uuid.uuid4().hex
+            for first, last in extents:
+                part_hdrs = ('\r\n--%s\r\nContent-Type: %s\r\n'
+                             'Content-Range: bytes %d-%d/%d\r\n\r\n')
+                part_hdrs = part_hdrs % (boundary, mime_type, first, last, size)
+                parts.append((six.b(part_hdrs), first, last))
+            trailer = six.b('\r\n--%s--\r\n' % boundary)
+            hdrs['Content-Type'] = 'multipart/byteranges; boundary=%s' % boundary
+            hdrs['Content-Length'] = str(sum(len(h) + last - first + 1 for h, first, last in parts) + len(trailer))
+
+        self.send_response(code, hdrs=hdrs)
         self.end_headers()
         self.wfile.flush()
 
         # Now send the file itself, hopefully using sendfile(2)
-        logger.info("Sending %s (%d bytes) to client, starting at byte %d", f, size, start_byte)
-        with open(f, 'rb') as fin:
+        logger.info("Sending %s (%d bytes) to client, extents: %r", f, size, extents)
+        cfg = self.ngasServer.cfg
+        span_first = min(first for first, _ in extents)
+        span_last = max(last for _, last in extents)
+        with open(f, 'rb') as fin, \
+             io_hints.sequential_read(fin, span_first, max(span_last - span_first + 1, 0),
+                                      enabled=cfg.getIoHints(),
+                                      drop=cfg.getDropCacheAfterRetrieve()):
             st = time.time()
-            pysendfile.sendfile(self.connection, fin, start_byte)
+            sent = 0
+            for part_hdrs, first, last in parts:
+                if part_hdrs:
+                    self.connection.sendall(part_hdrs)
+                if last >= first:
+                    fin.seek(first)
+                    sent += pysendfile.sendfile(self.connection, fin, first, int(last - first + 1))
+            if trailer:
+                self.connection.sendall(trailer)
             howlong = time.time() - st
-            size_mb = size / 1024. / 1024.
-        logger.info("Sent %s at %.3f [MB/s]", f, size_mb / howlong)
+            size_mb = sent / 1024. / 1024.
+        logger.info("Sent %s at %.3f [MB/s]", f, size_mb / howlong if howlong else 0)
 
     def send_data(self, data, mime_type, code=200, message=None, fname=None, hdrs={}):
         """
@@ -342,16 +602,13 @@ class ngamsHttpRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
         # (including "Host", we are not a *realy* proxy)
         _STD_HDRS = ('host', 'content-type', 'content-length', 'content-disposition',
                      'accept-encoding', 'transfer-encoding', 'authorization')
-        hdrs = {k: v for k, v in self.headers.items() if k.lower() not in _STD_HDRS}
+        hdrs = {k: v for k, v in self.headers.items()
+                if k.lower() not in _STD_HDRS and k.lower() not in _HOP_BY_HOP_HDRS}
 
-        # Forward GET or POST request, get back code/msg/hdrs/data
+        # Forward GET or POST request, and stream the response back
         if self.command == 'GET':
             resp = ngamsHttpUtils.httpGetUrl(url, hdrs=hdrs, timeout=timeout,
                                              auth=authHttpHdrVal)
-            with contextlib.closing(resp):
-                code, data = resp.status, resp.read()
-            hdrs = {h[0]: h[1] for h in resp.getheaders()}
-
         else:
             # During HTTP post we need to pass down a EOF-aware,
             # read()-able object
@@ -361,31 +618,46 @@ class ngamsHttpRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
             if 'content-type' in self.headers:
                 mime_type = self.headers['content-type']
 
-            code, _, hdrs, data = ngamsHttpUtils.httpPostUrl(url, data, mime_type,
-                                                             hdrs=hdrs,
-                                                             timeout=timeout,
-                                                             auth=authHttpHdrVal)
-
-        # Our code calculates the content length already, let's not send it twice
-        # Similarly, let's avoid Content-Type rewriting
-        # Here "hdrs" is not a one of the nice email.message.Message objects
-        # which allows for case-insensitive lookup, but simply a dictionary,
-        # so we are forced to perform a case-sensitive lookup
-        logger.info("Received response from %s:%d, sending to client", host, port)
+            resp = ngamsHttpUtils.httpPostUrlResponse(url, data, mime_type,
+                                                      hdrs=hdrs,
+                                                      timeout=timeout,
+                                                      auth=authHttpHdrVal)
+
+        with contextlib.closing(resp):
+            logger.info("Received response from %s:%d, sending to client", host, port)
+            self.relay_response(resp)
+
+    def relay_response(self, resp):
+        """
+        Sends the HTTP response `resp` obtained from another server back to the
+        client. Its body is relayed in blocks of at most Server.BlockSize bytes
+        as it arrives, so memory usage is bounded regardless of its size, and
+        slow clients naturally slow down the reading from the other server.
+        """
+
+        # The body is relayed as decoded by httplib, so the hop-by-hop headers
+        # describing how it was transferred don't apply anymore
+        hdrs = {k: v for k, v in resp.getheaders()
+                if k.lower() not in _HOP_BY_HOP_HDRS}
         logger.info("Headers from response: %r", hdrs)
-        if 'content-length' in hdrs:
-            del hdrs['content-length']
-        if 'Content-Length' in hdrs:
-            del hdrs['Content-Length']
-        mime_type = ''
-        if 'content-type' in hdrs:
-            mime_type = hdrs['content-type']
-            del hdrs['content-type']
-        if 'Content-Type' in hdrs:
-            mime_type = hdrs['Content-Type']
-            del hdrs['Content-Type']
 
-        self.send_data(data, mime_type, code=code, hdrs=hdrs)
+        self.send_response(resp.status, message=resp.reason, hdrs=hdrs)
+        self.end_headers()
+        self.wfile.flush()
+
+        pool = ngamsBufferPool.get_pool(self.ngasServer.cfg.getBlockSize())
+        size = 0
+        st = time.time()
+        with pool.buffer() as buf:
+            while True:
+                n = ngamsBufferPool.readinto(resp, buf)
+                if not n:
+                    break
+                self.connection.sendall(buf[:n])
+                size += n
+        howlong = time.time() - st
+        logger.info("Relayed %d bytes to client at %.3f [MB/s]", size,
+                    size / 1024. / 1024. / max(howlong, 1e-6))
 
 
 
@@ -623,6 +895,9 @@ class ngamsServer(object):
         # configuration
         self.request_db = None
 
+        # The durability policy for archived files
+        self.durability = None
+
         # Handling of a Cache Archive.
         self._cacheControlThread        = None
         self._cacheControlThreadStopEvt = threading.Event()
@@ -657,6 +932,22 @@ class ngamsServer(object):
         # takes place
         self.archive_event_subscribers = []
 
+        # Cached file locations and unreachable hosts, disabled until the
+        # configuration is loaded
+        self.location_cache = location_cache.LocationCache(0, 0)
+        self.unreachable_hosts = location_cache.NegativeCache(0)
+
+        # Cached ngas_hosts contents, created once the DB is connected
+        self.host_topology = None
+
+        # Threads probing other servers for file access
+        self.probe_pool = None
+
+        # Processes serving requests on behalf of this one, and the link to
+        # this coordinator process when this is one of them
+        self.request_processes = None
+        self.coordinator = None
+
     def load_archive_event_subscribers(self):
 
         # Built-in event subscriber that triggers the subscription thread
@@ -673,6 +964,12 @@ class ngamsServer(object):
 
     def fire_archive_event(self, file_id, file_version):
         """Passes down the archive event to each of the archive event subscriber"""
+
+        # Subscribers live in the coordinator process
+        if self.coordinator:
+            self.coordinator.send('archive-event', (file_id, file_version))
+            return
+
         evt = archive_event(file_id, file_version)
         for s in self.archive_event_subscribers:
             try:
@@ -1301,6 +1598,9 @@ class ngamsServer(object):
 
         Returns:   Reference to object itself.
         """
+        if self.coordinator:
+            self.coordinator.send('trigger-subscription')
+            return self
         logger.info("SubscriptionThread received trigger")
         self._subscriptionRunSync.set()
         return self
@@ -1343,6 +1643,10 @@ class ngamsServer(object):
         """
         T = TRACE()
 
+        if self.coordinator:
+            self.coordinator.send('subscription-info', (fileRefs, subscrObjs))
+            return self
+
         try:
             self._subscriptionSem.acquire()
             if (fileRefs != []):
@@ -1653,6 +1957,8 @@ class ngamsServer(object):
                                 setSrvState(state)
         if (updateDb):
             ngamsHighLevelLib.updateSrvHostInfo(self.getDb(), self.getHostInfoObj())
+            if self.host_topology:
+                self.host_topology.invalidate()
         return self
 
     def get_remote_server_endpoint(self, hostId):
@@ -1662,14 +1968,15 @@ class ngamsServer(object):
         """
 
         local_name = getHostName()
-        listening_ip = self.getDb().getIpFromHostId(hostId)
+        host_info = self.host_topology.get(hostId)
+        listening_ip = host_info.getIpAddress()
 
         if ':' in hostId:
             remote_name, remote_port = hostId.split(':')
             remote_port = int(remote_port)
         else:
             remote_name = hostId
-            remote_port = self.getDb().getPortNoFromHostId(hostId)
+            remote_port = host_info.getSrvPort()
 
         # remote server is not our same machine
         if remote_name != local_name:
@@ -1861,7 +2168,20 @@ class ngamsServer(object):
             httpRef.send_status(msg, status=NGAMS_FAILURE, code=403)
             return
 
-        ngamsCmdHandling.cmdHandler(self, reqPropsObj, httpRef)
+        # Request processes let the coordinator handle commands changing its
+        # state, which they inherit when restarted by it
+        cmd = reqPropsObj.getCmd()
+        if self.coordinator and cmd in request_processes.COORDINATOR_CMDS:
+            httpRef.proxy_request(self.getHostId(), '127.0.0.1', self.coordinator.port)
+            return
+
+        # Clients see the outcome of these commands only once served
+        # by request processes with the new state
+        if self.request_processes and cmd in request_processes.RESTART_CMDS:
+            httpRef.before_reply = self.request_processes.restart
+
+        with ngamsDbCore.query_context(cmd):
+            ngamsCmdHandling.cmdHandler(self, reqPropsObj, httpRef)
 
         msg = "Total time for handling request: (%s, %s ,%s, %s): %.3f [s]"
         args = [reqPropsObj.getHttpMethod(), reqPropsObj.getCmd(),
@@ -2004,6 +2324,11 @@ class ngamsServer(object):
         self.db = ngamsDb.from_config(self.cfg)
         ngasTmpDir = ngamsHighLevelLib.getNgasTmpDir(self.cfg)
         self.db.setDbTmpDir(ngasTmpDir)
+        self.db.setDiskStatsFlush(self.cfg.getDiskStatsFlushInterval(),
+                                  self.cfg.getDiskStatsFlushFiles())
+        self.db.setSlowQueryTime(self.cfg.getDbSlowQueryMs() / 1000.)
+        if self.host_topology:
+            self.host_topology.db = self.db
 
     def close_db(self):
         """Close the connections to the database"""
@@ -2015,6 +2340,37 @@ class ngamsServer(object):
         self.close_db()
         self.connect_to_db()
 
+    def init_request_state(self):
+        """
+        Creates the durability policy, caches and other objects used by the
+        threads serving requests. Request processes call this again after
+        being forked so they don't share any of them (or their locks) with
+        the coordinator.
+        """
+        cfg = self.getCfg()
+
+        # Initialize the durability policy for archived files
+        durability_policy = cfg.getArchiveDurability()
+        if durability_policy == 'none':
+            self.durability = durability.NoSync()
+        elif durability_policy == 'file':
+            self.durability = durability.FileSync()
+        elif durability_policy == 'group':
+            window = cfg.getGroupCommitWindow() / 1000.
+            self.durability = durability.GroupCommitSync(window)
+
+        self.serving_count = 0
+        self.serving_count_lock = threading.Lock()
+        self.location_cache = location_cache.LocationCache(
+            cfg.getLocationCacheSize(), cfg.getLocationCacheTtl())
+        self.unreachable_hosts = location_cache.NegativeCache(
+            cfg.getUnreachableHostTtl())
+        self.host_topology = host_topology.HostTopology(
+            self.getDb(), self.getHostId(), cfg.getHostTopologyRefresh())
+        self.probe_pool = None
+        if cfg.getFileAccessProbeTimeout() > 0:
+            self.probe_pool = ThreadPool(cfg.getFileAccessProbeThreads())
+
     def handleStartUp(self):
         """
         Initialize the NG/AMS Server. This implies loading the NG/AMS
@@ -2042,6 +2398,15 @@ class ngamsServer(object):
                 sys.path.insert(0, p)
                 logger.info("Added %s to the system path", p)
 
+        # Request processes don't share everything a single process does
+        if self.getCfg().getRequestProcesses() > 0:
+            if request_processes.SO_REUSEPORT is None:
+                raise Exception("RequestProcesses needs SO_REUSEPORT, which is not available")
+            if self.getCachingActive():
+                raise Exception("RequestProcesses cannot be used in cache mode")
+            if self.getCfg().getRequestDbBackend() == 'bsddb':
+                raise Exception("RequestProcesses cannot be used with the bsddb RequestDbBackend")
+
         # Exactly what the name implies
         self.connect_to_db()
 
@@ -2220,6 +2585,8 @@ class ngamsServer(object):
         else:
             raise Exception("Unsupported backend: %s" % request_db_backend)
 
+        self.init_request_state()
+
         msg = genLog("NGAMS_INFO_STARTING_SRV",
                      [getNgamsVersion(), self.getHostId(),
                      self.getCfg().getPortNo()])
@@ -2299,7 +2666,21 @@ class ngamsServer(object):
         hostName = getHostName()
         logger.info("Setting up NG/AMS HTTP Server (Host: %s - IP: %s - Port: %d)",
                     hostName, self.ipAddress, self.portNo)
-        self.__httpDaemon = ngamsHttpServer(self, (self.ipAddress, self.portNo))
+        server_class = ngamsHttpServer
+        if self.cfg.getWorkerThreads() > 0:
+            server_class = ngamsPooledHttpServer
+
+        # Request processes serve our port, and we serve only the commands
+        # they forward to us on a private one
+        n_procs = self.cfg.getRequestProcesses()
+        if n_procs > 0:
+            self.__httpDaemon = server_class(self, ('127.0.0.1', 0))
+            self.request_processes = request_processes.RequestProcesses(
+                self, n_procs, (self.ipAddress, self.portNo), server_class,
+                self.__httpDaemon)
+            self.request_processes.start()
+        else:
+            self.__httpDaemon = server_class(self, (self.ipAddress, self.portNo))
         logger.info("NG/AMS HTTP Server ready")
 
         self.__httpDaemon.serve_forever()
@@ -2362,10 +2743,14 @@ class ngamsServer(object):
         # after we stop the server
         show_threads()
         self.stopServer()
+        if self.request_processes:
+            self.request_processes.stop()
         ngamsSrvUtils.ngamsBaseExitHandler(self)
         if self.workers_pool:
             self.workers_pool.close()
             self.workers_pool.join()
+        if self.probe_pool:
+            self.probe_pool.terminate()
         show_threads()
 
         # Close all connections to the database, please
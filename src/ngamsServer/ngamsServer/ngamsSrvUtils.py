@@ -441,6 +441,7 @@ def handleOffline(srvObj,
 
     # Dump disk info on all disks, invoke the Offline Plug-In to prepare the
     # disks for offline, and mark the disks as unmounted in the DB.
+    srvObj.getDb().flushDiskStats()
     ngamsDiskUtils.dumpDiskInfoAllDisks(srvObj.getHostId(),
                                         srvObj.getDb(), srvObj.getCfg())
     plugIn = srvObj.getCfg().getOfflinePlugIn()
@@ -398,6 +398,19 @@ def _handleFileListReply(srvObj,
         rmFile(fileListXmlDoc)
 
 
+def _dbStats(srvObj, maxElements):
+    """
+    Report the latency statistics of the DB queries executed by the server,
+    separated by semicolons, starting with those where most time was spent.
+    """
+    lines = ["DB query statistics: count, total, p50, p95, p99, max [s], query"]
+    for query, stats in srvObj.getDb().getQueryStats()[:maxElements]:
+        lines.append("%d, %.6f, %.6f, %.6f, %.6f, %.6f, %s" % (
+            stats.count, stats.total, stats.percentile(50),
+            stats.percentile(95), stats.percentile(99), stats.max, query))
+    return "; ".join(lines)
+
+
 def handleCmd(srvObj,
                     reqPropsObj,
                     httpRef):
@@ -436,6 +449,9 @@ def handleCmd(srvObj,
     requestId         = ""
     dbTime            = ""
     dbTimeReset       = ""
+    locationCache     = ""
+    sqlCache          = ""
+    dbStats           = ""
     fileList          = ""
     fileListId        = ""
     maxElements       = 100000
@@ -465,6 +481,12 @@ def handleCmd(srvObj,
         dbTime = True
     if (reqPropsObj.hasHttpPar("db_time_reset")):
         dbTimeReset = True
+    if (reqPropsObj.hasHttpPar("location_cache")):
+        locationCache = True
+    if (reqPropsObj.hasHttpPar("sql_cache")):
+        sqlCache = True
+    if (reqPropsObj.hasHttpPar("db_stats")):
+        dbStats = True
 
     if (reqPropsObj.hasHttpPar("flush_log")):
         # in the past this called flushLog()
@@ -530,6 +552,10 @@ def handleCmd(srvObj,
         if (not fileVersion): fileVersion = -1
         fileObj = ngamsFileInfo.ngamsFileInfo()
         fileObj.read(srvObj.getHostId(), srvObj.getDb(), fileId, fileVersion)
+        if srvObj.getCfg().getArchiveDigests():
+            digests = srvObj.getDb().getFileDigests(fileId, fileObj.getFileVersion(),
+                                                    fileObj.getDiskId())
+            fileObj.setDigests(digests)
         diskObj = ngamsDiskInfo.ngamsDiskInfo()
         try:
             diskObj.read(srvObj.getDb(), fileObj.getDiskId())
@@ -557,6 +583,15 @@ def handleCmd(srvObj,
         fileId = fileAccess
         msg = _checkFileAccess(srvObj, reqPropsObj, httpRef, fileId,
                                fileVersion, diskId)
+    elif (locationCache):
+        cache = srvObj.location_cache
+        msg = "Location cache: size=%d, hits=%d, misses=%d" % \
+              (len(cache), cache.hits, cache.misses)
+    elif (sqlCache):
+        msg = "SQL cache: size=%d, hits=%d, misses=%d" % \
+              srvObj.getDb().getSqlCacheStats()
+    elif (dbStats):
+        msg = _dbStats(srvObj, maxElements)
     elif (dbTime):
         logger.debug("Querying total DB time")
         msg = "Total DB time: %.6fs" % srvObj.getDb().getDbTime()
@@ -50,7 +50,7 @@ from ngamsLib.ngamsCore import TRACE, NGAMS_SUBSCRIPTION_THR, isoTime2Secs,\
     NGAMS_HTTP_SUCCESS, NGAMS_SUCCESS, getFileSize, rmFile, loadPlugInEntryPoint,\
     toiso8601, NGAMS_HTTP_HDR_CHECKSUM, NGAMS_HTTP_HDR_FILE_INFO, fromiso8601
 from ngamsLib import ngamsDbm, ngamsStatus, ngamsHighLevelLib, ngamsFileInfo, ngamsDbCore,\
-    ngamsHttpUtils
+    ngamsHttpUtils, io_hints
 
 
 logger = logging.getLogger(__name__)
@@ -748,7 +748,10 @@ def _deliveryThread(srvObj,
                         hdrs = {NGAMS_HTTP_HDR_CHECKSUM: fileChecksum}
                         if fileInfoObjHdr:
                             hdrs[NGAMS_HTTP_HDR_FILE_INFO] = fileInfoObjHdr
-                        with open(filename, "rb") as f:
+                        cfg = srvObj.getCfg()
+                        with open(filename, "rb") as f, \
+                             io_hints.sequential_read(f, enabled=cfg.getIoHints(),
+                                                      drop=cfg.getDropCacheAfterBackgroundReads()):
                             reply, msg, hdrs, data = \
                                    ngamsHttpUtils.httpPostUrl(sendUrl, f, fileMimeType,
                                                         contDisp=contDisp,
@@ -0,0 +1,410 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Multi-process request handling. The server process (the coordinator) keeps
+running the background threads, while a number of forked request processes
+share the server's port via SO_REUSEPORT and handle the client requests.
+
+Commands acting on the state held by the coordinator are forwarded to it
+through a private HTTP port, and the coordinator restarts the request
+processes after changing its state so they inherit it. Request processes in
+turn send back the events the coordinator needs to know about (newly archived
+files, log records, etc) through a queue.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+from six.moves import queue as Queue  # @UnresolvedImport
+
+from ngamsLib import ngamsBufferPool, ngamsHttpUtils
+from ngamsLib.ngamsCore import NGAMS_ONLINE_CMD, NGAMS_OFFLINE_CMD, \
+    NGAMS_INIT_CMD, NGAMS_EXIT_CMD, NGAMS_SUBSCRIBE_CMD, NGAMS_UNSUBSCRIBE_CMD, \
+    NGAMS_CACHEDEL_CMD
+
+
+logger = logging.getLogger(__name__)
+
+# Commands acting on the state held by the coordinator
+COORDINATOR_CMDS = frozenset([
+    NGAMS_ONLINE_CMD, NGAMS_OFFLINE_CMD, NGAMS_INIT_CMD, NGAMS_EXIT_CMD,
+    NGAMS_SUBSCRIBE_CMD, NGAMS_UNSUBSCRIBE_CMD, NGAMS_CACHEDEL_CMD,
+    'USUBSCRIBE', 'TRIGGERSUBSCRIPTION', 'GETSUBQINFO', 'MIRREXEC',
+    'UPDATECONFIGPAR'
+])
+
+# Commands after which request processes need to inherit the new state
+RESTART_CMDS = frozenset([
+    NGAMS_ONLINE_CMD, NGAMS_OFFLINE_CMD, NGAMS_INIT_CMD, 'UPDATECONFIGPAR'
+])
+
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', None)
+
+# Request processes inherit the coordinator's state, so they must be forked
+# regardless of the default start method (python 2 always forks)
+if hasattr(multiprocessing, 'get_context'):
+    _mp = multiprocessing.get_context('fork')
+else:
+    _mp = multiprocessing
+
+# The DB connections inherited from the coordinator are kept here so they are
+# never closed (which would close them for the coordinator too)
+_inherited_dbs = []
+
+
+class CoordinatorLink(object):
+    """The link between a request process and the coordinator"""
+
+    def __init__(self, idx, port, events, inbox):
+        self.idx = idx
+        self.port = port
+        self.events = events
+        self.inbox = inbox
+        self.listening = _mp.Event()
+        self.closed = _mp.Event()
+
+    def send(self, name, item=None):
+        """Sends an event to the coordinator"""
+        self.events.put((name, item))
+
+
+class _LogForwarder(logging.Handler):
+    """Sends log records to the coordinator, which actually logs them"""
+
+    def __init__(self, link):
+        super(_LogForwarder, self).__init__()
+        self.link = link
+
+    def emit(self, record):
+        try:
+            # Make sure records can be pickled
+            if record.args:
+                record.msg = record.msg % record.args
+                record.args = None
+            if record.exc_info:
+                self.format(record)
+                record.exc_info = None
+            record.threadName = 'R%d-%s' % (self.link.idx, record.threadName)
+            self.link.send('log-record', record)
+        except:
+            self.handleError(record)
+
+
+class _DbChangeForwarder(object):
+    """
+    Looks like an ngamsEvent to the DB, but sends the DB change information
+    to the coordinator, where the Janitor Thread listens for it
+    """
+
+    def __init__(self, link):
+        self.link = link
+
+    def addEventInfo(self, info):
+        self.link.send('db-change', info)
+        return self
+
+    def isSet(self):
+        return True
+
+    def set(self):
+        return self
+
+
+class SharedLocationCache(object):
+    """
+    A location cache whose invalidations are also applied to the caches of
+    the other processes
+    """
+
+    def __init__(self, cache, link):
+        self._cache = cache
+        self._link = link
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def invalidate(self, file_id):
+        self._cache.invalidate(file_id)
+        self._link.send('invalidate', file_id)
+
+    def clear(self):
+        self._cache.clear()
+        self._link.send('clear', None)
+
+
+def _reset_logging_locks():
+    """
+    Replaces the locks of the logging module and its handlers, which other
+    threads of the coordinator might have been holding when we were forked,
+    and therefore would never be released in this process
+    """
+    logging._lock = threading.RLock()
+    for ref in list(logging._handlerList):
+        handler = ref()
+        if handler is not None:
+            handler.createLock()
+
+
+def _reuse_port(server_class):
+    class server(server_class):
+        def server_bind(self):
+            self.socket.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+            server_class.server_bind(self)
+    return server
+
+
+def _share_serving_state(srvObj, busy):
+    """
+    Notifies the serving listeners inherited from the coordinator only when
+    all request processes become idle, or when the first becomes busy
+    """
+    listeners = srvObj.serving_listeners
+    def listener(serving):
+        with busy.get_lock():
+            busy.value += 1 if serving else -1
+            if busy.value == (1 if serving else 0):
+                for l in listeners:
+                    l(serving)
+    srvObj.serving_listeners = [listener]
+
+
+def _request_process(srvObj, link, address, server_class, coordinator_server,
+                     busy, coordinator_pid):
+    """Entry point for request processes"""
+
+    # Stop serving gracefully on SIGTERM, or when the coordinator is gone
+    stop_evt = threading.Event()
+    servers = []
+    def stop(*_):
+        if not stop_evt.is_set():
+            stop_evt.set()
+            for s in servers:
+                s.draining = True
+                threading.Thread(target=s.shutdown, name="Shutdown").start()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # The coordinator's port is not ours to serve
+    coordinator_server.socket.close()
+
+    # Log records and DB changes go to the coordinator
+    _reset_logging_locks()
+    for h in list(logging.root.handlers):
+        logging.root.removeHandler(h)
+    logging.root.addHandler(_LogForwarder(link))
+
+    # Other threads of the coordinator might have been holding the locks of
+    # these objects when we were forked, so we start afresh
+    ngamsHttpUtils.reset_connection_pool()
+    ngamsBufferPool.reset_pools()
+
+    _inherited_dbs.append(srvObj.db)
+    srvObj.connect_to_db()
+    srvObj.getDb().addDbChangeEvt(_DbChangeForwarder(link))
+    srvObj.init_request_state()
+
+    srvObj.coordinator = link
+    srvObj.location_cache = SharedLocationCache(srvObj.location_cache, link)
+    _share_serving_state(srvObj, busy)
+
+    server = _reuse_port(server_class)(srvObj, address)
+    servers.append(server)
+    link.listening.set()
+    if stop_evt.is_set():
+        server.server_close()
+        link.closed.set()
+        srvObj.close_db()
+        return
+
+    def read_inbox():
+        while not stop_evt.is_set():
+            try:
+                name, item = link.inbox.get(timeout=0.5)
+            except Queue.Empty:
+                if os.getppid() != coordinator_pid:
+                    logger.warning("Coordinator is gone, stopping")
+                    stop()
+                continue
+            if name == 'invalidate':
+                srvObj.location_cache._cache.invalidate(item)
+            elif name == 'clear':
+                srvObj.location_cache._cache.clear()
+    inbox_reader = threading.Thread(target=read_inbox, name="InboxReader")
+    inbox_reader.daemon = True
+    inbox_reader.start()
+
+    logger.info("Request process %d serving on %s:%d", link.idx, address[0], address[1])
+    server.serve_forever(poll_interval=0.1)
+    server.server_close()
+    link.closed.set()
+
+    # Let requests being served finish
+    timeout = srvObj.getCfg().getTimeOut() or 60
+    start = time.time()
+    while srvObj.serving_count and time.time() - start < timeout:
+        time.sleep(0.1)
+    logger.info("Request process %d stopped", link.idx)
+    srvObj.close_db()
+
+
+class RequestProcesses(object):
+    """
+    The group of request processes, managed by the coordinator `srvObj`.
+    Request processes serve `address` using instances of `server_class`,
+    and forward commands to `coordinator_server`.
+    """
+
+    def __init__(self, srvObj, n, address, server_class, coordinator_server):
+        self.srvObj = srvObj
+        self.n = n
+        self.address = address
+        self.server_class = server_class
+        self.coordinator_server = coordinator_server
+        self.busy = _mp.Value('i', 0)
+        self.events = _mp.Queue()
+        self.procs = {}
+        self._lock = threading.Lock()
+        self._stop_evt = threading.Event()
+        self._events_reader = None
+
+    def _start(self, idx):
+        port = self.coordinator_server.server_address[1]
+        link = CoordinatorLink(idx, port, self.events, _mp.Queue())
+        args = (self.srvObj, link, self.address, self.server_class,
+                self.coordinator_server, self.busy, os.getpid())
+        proc = _mp.Process(target=_request_process,
+                           name="RequestProcess-%d" % idx, args=args)
+        proc.start()
+        self.procs[idx] = (proc, link)
+
+    def start(self):
+        """Starts the request processes"""
+        with self._lock:
+            for idx in range(self.n):
+                self._start(idx)
+        self._events_reader = threading.Thread(target=self._read_events,
+                                               name="RequestProcessesEvents")
+        self._events_reader.start()
+        logger.info("Started %d request processes", self.n)
+
+    def restart(self):
+        """
+        Replaces the request processes with new ones, which inherit the
+        current state of the coordinator. This returns once only the new
+        processes accept connections; old ones finish serving their current
+        requests in the background.
+        """
+        logger.info("Restarting request processes")
+        with self._lock:
+            old = list(self.procs.values())
+            for idx in range(self.n):
+                self._start(idx)
+            new = list(self.procs.values())
+        for _, link in new:
+            if not link.listening.wait(10):
+                logger.warning("Request process %d not listening yet", link.idx)
+        for proc, _ in old:
+            proc.terminate()
+        for proc, link in old:
+            if not link.closed.wait(10):
+                logger.warning("Old request process %d still listening", link.idx)
+
+    def stop(self):
+        """Stops all request processes, waiting for them to finish"""
+        # Events keep being read while the processes finish so their
+        # queues can be flushed on exit; only then the reader stops
+        with self._lock:
+            procs = [proc for proc, _ in self.procs.values()]
+            self.procs = {}
+        for proc in procs:
+            proc.terminate()
+        timeout = (self.srvObj.getCfg().getTimeOut() or 60) + 5
+        for proc in procs:
+            proc.join(timeout)
+            if proc.exitcode is None:
+                logger.warning("Request process %d didn't exit cleanly, killing it", proc.pid)
+                os.kill(proc.pid, signal.SIGKILL)
+                proc.join()
+        self._stop_evt.set()
+        if self._events_reader:
+            self._events_reader.join(10)
+
+    def _broadcast(self, name, item):
+        with self._lock:
+            links = [link for _, link in self.procs.values()]
+        for link in links:
+            link.inbox.put((name, item))
+
+    def _check_procs(self):
+        # Old processes are reaped and dead ones are replaced
+        multiprocessing.active_children()
+        with self._lock:
+            for idx, (proc, _) in list(self.procs.items()):
+                if proc.exitcode is not None:
+                    logger.error("Request process %d exited with code %d, replacing it",
+                                 idx, proc.exitcode)
+                    self._start(idx)
+
+    def _read_events(self):
+
+        srvObj = self.srvObj
+        last_check = time.time()
+        while not self._stop_evt.is_set():
+
+            if time.time() - last_check > 1:
+                self._check_procs()
+                last_check = time.time()
+
+            try:
+                name, item = self.events.get(timeout=0.1)
+            except Queue.Empty:
+                continue
+
+            try:
+                if name == 'log-record':
+                    logger.handle(item)
+                elif name == 'archive-event':
+                    srvObj.fire_archive_event(*item)
+                elif name == 'subscription-info':
+                    srvObj.addSubscriptionInfo(*item)
+                elif name == 'trigger-subscription':
+                    srvObj.triggerSubscriptionThread()
+                elif name == 'db-change':
+                    srvObj.getDb().triggerEvents(item)
+                elif name == 'invalidate':
+                    srvObj.location_cache.invalidate(item)
+                    self._broadcast(name, item)
+                elif name == 'clear':
+                    srvObj.location_cache.clear()
+                    self._broadcast(name, item)
+                else:
+                    raise ValueError("Unknown event: name=%s, item=%r" % (name, item))
+            except:
+                logger.exception("Error while handling event %s from request process", name)
@@ -0,0 +1,215 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Pools of pre-started worker threads used to serve requests, and the
+dispatching of incoming connections to them
+"""
+
+import collections
+import errno
+import logging
+import select
+import socket
+import threading
+import time
+
+from six.moves import queue as Queue  # @UnresolvedImport
+
+
+logger = logging.getLogger(__name__)
+
+class WorkerPool(object):
+    """
+    A fixed number of threads serving tasks from a queue of up to `queue_size`
+    elements. Tasks that wait more than `queue_timeout` seconds in the queue
+    are rejected instead of being served.
+    """
+
+    def __init__(self, name, nthreads, queue_size, queue_timeout):
+        self.name = name
+        self.queue_timeout = queue_timeout
+        self._queue = Queue.Queue(queue_size)
+        self._threads = [threading.Thread(target=self._work, name='%s-%d' % (name, i))
+                         for i in range(nthreads)]
+        for t in self._threads:
+            t.start()
+        logger.info("Started %d worker threads for %s requests", nthreads, name)
+
+    def submit(self, serve, reject, *args):
+        """
+        Queues the call of `serve` with `args`. If the task waits too long to
+        be served, `reject` is called instead. Returns whether the task was
+        queued; if the queue is full it is up to the caller to reject it.
+        """
+        try:
+            self._queue.put_nowait((time.time(), serve, reject, args))
+            return True
+        except Queue.Full:
+            logger.warning("Queue of %s requests is full, rejecting request", self.name)
+            return False
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            queued_at, serve, reject, args = task
+            waited = time.time() - queued_at
+            try:
+                if waited > self.queue_timeout:
+                    logger.warning("%s request waited %.3f [s] in queue, rejecting it", self.name, waited)
+                    reject(*args)
+                else:
+                    serve(*args)
+            except:
+                logger.exception("Unexpected error while serving %s request", self.name)
+
+    def stop(self):
+        """Stops the threads of this pool once all queued tasks are served"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+
+def request_command(data):
+    """
+    Returns the NGAS command of the HTTP request whose first bytes are
+    `data`, or None if the request line is not complete yet.
+    """
+    parts = data.split(b' ', 2)
+    if len(parts) < 3:
+        return None
+    path = parts[1].split(b'?', 1)[0].strip(b'/')
+    return path.decode('latin1')
+
+class Dispatcher(object):
+    """
+    Dispatches incoming connections to different pools of worker threads
+    depending on the command they request. The request line of each
+    connection is peeked at (i.e., without consuming it) as soon as data is
+    available. Connections whose request line cannot be read (because they
+    don't send anything within `timeout` seconds, or send it incomplete) are
+    handed over to the default pool. Connections that cannot be queued are
+    rejected by a separate thread, so slow clients don't hold back others.
+    """
+
+    _peek_size = 1024
+
+    def __init__(self, default_pool, pools_by_cmd, timeout):
+        self.default_pool = default_pool
+        self.pools_by_cmd = pools_by_cmd
+        self.timeout = timeout
+        self._incoming = []
+        self._pending = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._rejector = WorkerPool('rejected', 1, 0, float('inf'))
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='Dispatcher')
+        self._thread.start()
+
+    def _peek(self, sock):
+        try:
+            data = sock.recv(self._peek_size, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return None, False
+            return None, True
+        # Peeked data stays readable, so we don't wait for incomplete
+        # request lines, these go to the default pool
+        return request_command(data), True
+
+    def _dispatch(self, cmd, serve, reject, args):
+        pool = self.pools_by_cmd.get(cmd, self.default_pool)
+        if not pool.submit(serve, reject, *args):
+            self._rejector.submit(reject, reject, *args)
+
+    def dispatch(self, sock, serve, reject, *args):
+        """
+        Dispatches connection `sock` to the corresponding pool, where
+        `serve` or `reject` will be called with `args`.
+        """
+        cmd, ready = self._peek(sock)
+        if ready:
+            self._dispatch(cmd, serve, reject, args)
+            return
+        with self._lock:
+            self._incoming.append((sock, time.time(), serve, reject, args))
+        self._wakeup_w.send(b'x')
+
+    def _run(self):
+
+        # Connections waiting for their request line are kept in _pending,
+        # indexed by file descriptor in the order they arrived.
+        # Only this thread uses it, new connections come through _incoming
+        poller = select.poll()
+        poller.register(self._wakeup_r, select.POLLIN)
+        pending = self._pending
+        while not self._stopped:
+
+            with self._lock:
+                incoming, self._incoming = self._incoming, []
+            for entry in incoming:
+                fd = entry[0].fileno()
+                pending[fd] = entry
+                poller.register(fd, select.POLLIN)
+
+            try:
+                events = poller.poll(1000)
+            except select.error:
+                events = []
+
+            for fd, _ in events:
+                if fd == self._wakeup_r.fileno():
+                    self._wakeup_r.recv(4096)
+                    continue
+                entry = pending.get(fd)
+                if entry is None:
+                    continue
+                cmd, ready = self._peek(entry[0])
+                if ready:
+                    del pending[fd]
+                    poller.unregister(fd)
+                    self._dispatch(cmd, entry[2], entry[3], entry[4])
+
+            now = time.time()
+            while pending:
+                fd = next(iter(pending))
+                _, accepted_at, serve, reject, args = pending[fd]
+                if now - accepted_at <= self.timeout:
+                    break
+                del pending[fd]
+                poller.unregister(fd)
+                self._dispatch(None, serve, reject, args)
+
+    def stop(self):
+        """Stops dispatching connections"""
+        self._stopped = True
+        self._wakeup_w.send(b'x')
+        self._thread.join()
+        for _, _, _, reject, args in list(self._pending.values()) + self._incoming:
+            self._rejector.submit(reject, reject, *args)
+        self._pending.clear()
+        self._incoming = []
+        self._rejector.stop()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
@@ -32,10 +32,12 @@
 Contains the Test Suite for the ARCHIVE Command.
 """
 
+import base64
 import contextlib
 import functools
 import getpass
 import glob
+import hashlib
 import os
 import subprocess
 from multiprocessing.pool import ThreadPool
@@ -1594,6 +1596,319 @@ class ngamsArchiveCmdTest(ngamsTestSuite):
             else:
                 self.assertNotIn('NGAMS_ER_FILE_NOK', stat.getMessage())
 
+    def test_QArchive_pipelined(self):
+        """
+        Check that pipelined archiving stores the same data and checksum
+        as the serial implementation
+        """
+
+        file_id = "SmallFile.fits"
+        filename = "src/SmallFile.fits"
+        cfg = [['NgamsCfg.ArchiveHandling[1].PipelineBuffers', 4],
+               ['NgamsCfg.Server[1].BlockSize', 1024]]
+        _, db = self.prepExtSrv(cfgProps=cfg)
+        client = sendPclCmd()
+
+        variants = ['crc32']
+        if _crc32c_available:
+            variants.append('crc32c')
+        for variant in variants:
+            stat = client.archive(filename, cmd="QARCHIVE", mimeType='application/octet-stream',
+                                  pars=[['crc_variant', variant]])
+            self.assertEqual(NGAMS_SUCCESS, stat.getStatus())
+
+        res = db.query2("SELECT checksum, checksum_plugin FROM ngas_files WHERE file_id = {} ORDER BY file_version ASC", (file_id,))
+        self.assertEqual(len(variants), len(res))
+        for (checksum, variant), expected_variant in zip(res, variants):
+            expected = ngamsFileUtils.get_checksum(4096, filename, expected_variant)
+            self.assertEqual(str(expected), str(checksum))
+            self.assertEqual(expected_variant, str(variant))
+
+        # The data itself is intact
+        trgFile = 'tmp/test_QArchive_pipelined_tmp'
+        stat = client.retrieve(file_id, targetFile=trgFile)
+        self.assertEqual(NGAMS_SUCCESS, stat.getStatus())
+        with open(filename, 'rb') as f1, open(trgFile, 'rb') as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    def test_QArchive_splice(self):
+        """
+        Check that archiving with splice transfers enabled stores the data
+        intact, both when checksums are calculated at reception time (and
+        thus splice is not used) and when they are not
+        """
+
+        file_id = "SmallFile.fits"
+        filename = "src/SmallFile.fits"
+        cfg = [['NgamsCfg.ArchiveHandling[1].SpliceTransfer', 1],
+               ['NgamsCfg.Server[1].BlockSize', 1024]]
+        _, db = self.prepExtSrv(cfgProps=cfg)
+        client = sendPclCmd()
+
+        variants = [-1, 'crc32']
+        for variant in variants:
+            stat = client.archive(filename, cmd="QARCHIVE", mimeType='application/octet-stream',
+                                  pars=[['crc_variant', variant]])
+            self.assertEqual(NGAMS_SUCCESS, stat.getStatus())
+
+        res = db.query2("SELECT checksum, checksum_plugin FROM ngas_files WHERE file_id = {} ORDER BY file_version ASC", (file_id,))
+        self.assertEqual(len(variants), len(res))
+        self.assertEqual((None, None), res[0])
+        expected = ngamsFileUtils.get_checksum(4096, filename, 'crc32')
+        self.assertEqual(str(expected), str(res[1][0]))
+
+        # The data itself is intact in all versions
+        for version in range(1, len(variants) + 1):
+            trgFile = 'tmp/test_QArchive_splice_tmp'
+            stat = client.retrieve(file_id, fileVersion=version, targetFile=trgFile)
+            self.assertEqual(NGAMS_SUCCESS, stat.getStatus())
+            with open(filename, 'rb') as f1, open(trgFile, 'rb') as f2:
+                self.assertEqual(f1.read(), f2.read())
+
+    def test_QArchive_durability(self):
+        """
+        Check that files are correctly archived and registered under all
+        durability policies, including when archiving concurrently
+        """
+
+        filename = "src/SmallFile.fits"
+        nfiles = 4
+        for policy in ('none', 'file', 'group'):
+            cfg = [['NgamsCfg.ArchiveHandling[1].Durability', policy],
+                   ['NgamsCfg.ArchiveHandling[1].GroupCommitWindow', 100]]
+            _, db = self.prepExtSrv(cfgProps=cfg)
+
+            def archive(n):
+                return sendPclCmd().archive(filename, cmd="QARCHIVE", mimeType='application/octet-stream',
+                                            pars=[['file_id', 'file-%s-%d' % (policy, n)]])
+            tp = ThreadPool(nfiles)
+            try:
+                for stat in tp.map(archive, range(nfiles)):
+                    self.assertEqual(NGAMS_SUCCESS, stat.getStatus())
+            finally:
+                tp.close()
+
+            res = db.query2("SELECT count(*) FROM ngas_files WHERE file_id LIKE {}", ('file-%s-%%' % policy,))
+            self.assertEqual(nfiles, res[0][0])
+            self.terminateAllServer()
+
+    def test_QArchive_group_commit(self):
+        """
+        Check that files archived concurrently within the same group commit
+        window are flushed to disk with a single flush of their volume
+        """
+
+        filename = "src/SmallFile.fits"
+        nfiles = 4
+        cfg = [['NgamsCfg.ArchiveHandling[1].Durability', 'group'],
+               ['NgamsCfg.ArchiveHandling[1].GroupCommitWindow', 2000],
+               ['NgamsCfg.Log[1].LocalLogLevel', '5']]
+        srvCfg, _ = self.prepExtSrv(cfgProps=cfg)
+
+        def archive(n):
+            return sendPclCmd().archive(filename, cmd="QARCHIVE", mimeType='application/octet-stream',
+                                        pars=[['file_id', 'file-%d' % n]])
+        tp = ThreadPool(nfiles)
+        try:
+            for stat in tp.map(archive, range(nfiles)):
+                self.assertEqual(NGAMS_SUCCESS, stat.getStatus())
+        finally:
+            tp.close()
+
+        with open(srvCfg.getLocalLogFile()) as f:
+            flushes = [l for l in f if 'Flushed volume with' in l]
+        self.assertEqual(1, len(flushes))
+        self.assertIn('Flushed volume with %d files' % nfiles, flushes[0])
+
+    def test_disk_stats_flush(self):
+        """
+        Check that the disk statistics accumulated in memory are written to
+        the database after enough files are archived, and when going offline
+        """
+
+        filename = "src/SmallFile.fits"
+        cfg = [['NgamsCfg.Server[1].DiskStatsFlushInterval', 3600],
+               ['NgamsCfg.Server[1].DiskStatsFlushFiles', 3]]
+        _, db = self.prepExtSrv(cfgProps=cfg)
+        client = sendPclCmd()
+
+        def disk_stats():
+            sql = "SELECT sum(number_of_files), sum(bytes_stored) FROM ngas_disks"
+            return tuple(db.query2(sql)[0])
+
+        sizes = []
+        for n in range(4):
+            stat = client.archive(filename, cmd="QARCHIVE", mimeType='application/octet-stream',
+                                  pars=[['file_id', 'file-%d' % n]])
+            self.assertEqual(NGAMS_SUCCESS, stat.getStatus())
+            sizes.append(stat.getDiskStatusList()[0].getFileObj(0).getFileSize())
+        self.assertEqual((3, sum(sizes[:3])), disk_stats())
+
+        self.assertStatus(client.offline())
+        self.assertEqual((4, sum(sizes)), disk_stats())
+
+    def test_file_entry_upsert(self):
+        """
+        Check that writing the entry of an existing file updates its row,
+        and that writing a new version inserts a new one
+        """
+
+        _, db = self.prepExtSrv()
+        stat = sendPclCmd().archive("src/SmallFile.fits", cmd="QARCHIVE",
+                                    mimeType='application/octet-stream')
+        self.assertEqual(NGAMS_SUCCESS, stat.getStatus())
+        file_id = "SmallFile.fits"
+
+        def rows():
+            sql = ("SELECT file_version, file_size, ingestion_date FROM ngas_files "
+                   "WHERE file_id = {} ORDER BY file_version ASC")
+            return [tuple(r) for r in db.query2(sql, (file_id,))]
+
+        (_, size, ing_date), = rows()
+        fileInfo = ngamsFileInfo.ngamsFileInfo().read(getHostName() + ':8888', db, file_id)
+        fileInfo.setFileSize(size + 1)
+        fileInfo.write(getHostName() + ':8888', db, genSnapshot=0)
+        self.assertEqual([(1, size + 1, ing_date)], rows())
+
+        fileInfo.setFileVersion(2).setFileSize(size)
+        fileInfo.write(getHostName() + ':8888', db, genSnapshot=0)
+        self.assertEqual([1, 2], [r[0] for r in rows()])
+
+        # Both entries were written with a single statement each, without
+        # checking first whether the file was already there
+        upserts = ('ON CONFLICT', 'ON DUPLICATE KEY', 'MERGE INTO')
+        stats = dict(db.getQueryStats())
+        writes = [sql for sql in stats
+                  if 'ngas_files' in sql and any(u in sql for u in upserts)]
+        self.assertEqual(1, len(writes))
+        self.assertEqual(2, stats[writes[0]].count)
+        for sql in stats:
+            self.assertFalse(sql.startswith('UPDATE ngas_files SET file_name'), sql)
+
+    def test_file_entries_batch(self):
+        """
+        Check that the entries of many files are written together, updating
+        existing entries and the statistics of the disk for new ones
+        """
+
+        _, db = self.prepExtSrv()
+        stat = sendPclCmd().archive("src/SmallFile.fits", cmd="QARCHIVE",
+                                    mimeType='application/octet-stream')
+        self.assertEqual(NGAMS_SUCCESS, stat.getStatus())
+        file_id = "SmallFile.fits"
+        host_id = getHostName() + ':8888'
+
+        fileInfo = ngamsFileInfo.ngamsFileInfo().read(host_id, db, file_id)
+        disk_id = fileInfo.getDiskId()
+
+        def disk_stats():
+            sql = "SELECT number_of_files, bytes_stored FROM ngas_disks WHERE disk_id = {}"
+            return tuple(db.query2(sql, (disk_id,))[0])
+        n_files, stored = disk_stats()
+
+        size = fileInfo.getFileSize()
+        fileInfos = [fileInfo.clone().setFileSize(size + 1)]
+        fileInfos += [fileInfo.clone().setFileVersion(v) for v in (2, 3)]
+        inserted = db.writeFileEntries(host_id, fileInfos, updateDiskInfo=1)
+        self.assertEqual([2, 3], [f.getFileVersion() for f in inserted])
+
+        sql = ("SELECT file_version, file_size FROM ngas_files "
+               "WHERE file_id = {} ORDER BY file_version ASC")
+        rows = [tuple(r) for r in db.query2(sql, (file_id,))]
+        self.assertEqual([(1, size + 1), (2, size), (3, size)], rows)
+        self.assertEqual((n_files + 2, stored + 2 * size), disk_stats())
+
+    def test_QArchive_preallocate(self):
+        """
+        Check that data is archived correctly into preallocated staging files
+        """
+
+        file_id = "SmallFile.fits"
+        filename = "src/SmallFile.fits"
+        cfg = [['NgamsCfg.ArchiveHandling[1].Preallocate', 1]]
+        self.prepExtSrv(cfgProps=cfg)
+        client = sendPclCmd()
+
+        stat = client.archive(filename, cmd="QARCHIVE", mimeType='application/octet-stream')
+        self.assertEqual(NGAMS_SUCCESS, stat.getStatus())
+
+        trgFile = 'tmp/test_QArchive_preallocate_tmp'
+        stat = client.retrieve(file_id, targetFile=trgFile)
+        self.assertEqual(NGAMS_SUCCESS, stat.getStatus())
+        with open(filename, 'rb') as f1, open(trgFile, 'rb') as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+    @skipIf(not hasattr(os, 'posix_fallocate'), "posix_fallocate not available")
+    def test_QArchive_preallocate_quick_fail(self):
+        """
+        Tries to archive a file bigger than the available disk space, and
+        the server fails quickly when trying to preallocate its staging file
+        """
+
+        cfg = [['NgamsCfg.ArchiveHandling[1].Preallocate', 1]]
+        self.prepExtSrv(cfgProps=cfg)
+
+        params = {'filename': 'dummy_name.fits',
+                  'mime_type': 'application/octet-stream'}
+        status, _, _, data = ngamsHttpUtils.httpPost('localhost', 8888, 'QARCHIVE',
+                                                     generated_file(2**50),
+                                                     mimeType='application/octet-stream',
+                                                     pars=params, timeout=120)
+
+        self.assertNotEqual(status, 200)
+        status = ngamsStatus.ngamsStatus().unpackXmlDoc(data, 1)
+        self.assertStatus(status, expectedStatus=NGAMS_FAILURE)
+        self.assertIn('NGAMS_ER_NO_DISK_SPACE', status.getMessage())
+
+    def test_QArchive_digests(self):
+        """
+        Check that additional digests are calculated on the incoming data,
+        and that they are reported by STATUS and RETRIEVE
+        """
+
+        filename = "src/SmallFile.fits"
+        with open(filename, 'rb') as f:
+            data = f.read()
+        expected = {'sha256': hashlib.sha256(data).hexdigest(),
+                    'md5': hashlib.md5(data).hexdigest()}
+
+        for nbuffers in (0, 4):
+            cfg = [['NgamsCfg.ArchiveHandling[1].Digests', 'sha256,MD5'],
+                   ['NgamsCfg.ArchiveHandling[1].PipelineBuffers', nbuffers]]
+            _, db = self.prepExtSrv(cfgProps=cfg)
+            client = sendPclCmd()
+
+            file_id = 'digests_%d' % nbuffers
+            stat = client.archive(filename, cmd="QARCHIVE", mimeType='application/octet-stream',
+                                  pars=[['file_id', file_id]])
+            self.assertEqual(NGAMS_SUCCESS, stat.getStatus())
+
+            res = db.query2("SELECT digest_name, digest FROM ngas_files_digests WHERE file_id = {}", (file_id,))
+            self.assertEqual(expected, dict(res))
+
+            stat = client.status(pars=[['file_id', file_id]])
+            file_info = stat.getDiskStatusList()[0].getFileObjList()[0]
+            self.assertEqual(expected, file_info.getDigests())
+
+            def retrieve_digest(want_digest):
+                hdrs = {'Want-Digest': want_digest} if want_digest else {}
+                resp = ngamsHttpUtils.httpGet('localhost', 8888, 'RETRIEVE',
+                                              pars=[['file_id', file_id]], hdrs=hdrs)
+                with contextlib.closing(resp):
+                    self.assertEqual(200, resp.status)
+                    self.assertEqual(data, resp.read())
+                    return resp.getheader('Digest')
+
+            sha256 = 'SHA-256=' + base64.b64encode(hashlib.sha256(data).digest()).decode('ascii')
+            md5 = 'MD5=' + base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+            self.assertIsNone(retrieve_digest(None))
+            self.assertEqual(sha256, retrieve_digest('SHA-256'))
+            digest = retrieve_digest('sha-256;q=1, MD5;q=0.5')
+            self.assertIn(sha256, digest)
+            self.assertIn(md5, digest)
+
+            self.terminateAllServer()
+
     @skip("Run manually when necessary")
     def test_performance_of_crc32(self):
 
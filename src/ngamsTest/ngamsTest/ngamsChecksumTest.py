@@ -0,0 +1,82 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+This module contains the Test Suite for the checksum calculations
+"""
+
+import io
+import os
+
+from ngamsLib import ngamsChecksum
+from .ngamsTestLib import ngamsTestSuite
+
+
+def _crc_variants():
+    variants = ['crc32', 'crc32z']
+    try:
+        ngamsChecksum.get_checksum_info('crc32c')
+        variants.append('crc32c')
+    except Exception:
+        pass
+    return variants
+
+
+class ngamsChecksumTest(ngamsTestSuite):
+
+    def test_crc_combine(self):
+
+        data = os.urandom(100000)
+        for variant in _crc_variants():
+            def crc(x):
+                return ngamsChecksum.get_checksum(4096, io.BytesIO(x), variant)
+            expected = crc(data)
+            for split in (0, 1, 4096, 54321, len(data)):
+                first, second = data[:split], data[split:]
+                combined = ngamsChecksum.crc_combine(crc(first), crc(second),
+                                                     len(second), variant)
+                self.assertTrue(ngamsChecksum.get_checksum_info(variant).equals(expected, combined))
+
+    def test_parallel_checksum(self):
+
+        # Large enough to be split in a few extents, plus some extra bytes
+        fname = 'tmp/test_parallel_checksum'
+        with open(fname, 'wb') as f:
+            f.write(os.urandom(50 * 1024 * 1024 + 1234))
+
+        for variant in _crc_variants():
+            expected = ngamsChecksum.get_checksum(65536, fname, variant)
+            for nthreads in (1, 2, 3, 4, 8):
+                crc = ngamsChecksum.get_checksum_parallel(65536, fname, variant, nthreads)
+                self.assertEqual(expected, crc)
+
+            # Kernel hints don't alter the outcome
+            crc = ngamsChecksum.get_checksum_parallel(65536, fname, variant, 2,
+                                                      hints=True, drop_cache=True)
+            self.assertEqual(expected, crc)
+            crc = ngamsChecksum.get_checksum(65536, fname, variant,
+                                             hints=True, drop_cache=True)
+            self.assertEqual(expected, crc)
+
+        # Digests can't be combined, but are still calculated correctly
+        expected = ngamsChecksum.get_checksum(65536, fname, 'sha256')
+        self.assertEqual(expected,
+                         ngamsChecksum.get_checksum_parallel(65536, fname, 'sha256', 4))
@@ -188,4 +188,20 @@ class ngamsMIMEMultipartTest(ngamsTestLib.ngamsTestSuite):
         message = message.getvalue()
         mlen = len(message)
 
-        self.assertEqual(mlen, rlen)
\ No newline at end of file
+        self.assertEqual(mlen, rlen)
+
+    def test_MultipartParserFileContents(self):
+        """Checks that parsed files keep their contents with all reading sizes"""
+
+        message = self._createMIMEMessage(False)
+        for size in (1, 7, 64, 1000, 65536):
+            outdir = tempfile.mkdtemp(dir='tmp')
+            inputContent = io.BytesIO(message)
+            handler = ngamsMIMEMultipart.FilesystemWriterHandler(13, basePath=outdir)
+            parser = ngamsMIMEMultipart.MIMEMultipartParser(handler, inputContent, len(message), size)
+            parser.parse()
+
+            self.assertEqual(len(message), parser.getBytesRead())
+            for myfile in self.myfiles:
+                with open(myfile, 'rb') as f1, open(os.path.join(outdir, myfile), 'rb') as f2:
+                    self.assertEqual(f1.read(), f2.read())
@@ -36,7 +36,7 @@ import subprocess
 import shutil
 import sys
 
-from ngamsLib.ngamsCore import getHostName
+from ngamsLib.ngamsCore import getHostName, NGAMS_SUCCESS, NGAMS_FAILURE
 from ngamsPClient import ngamsPClient
 from .ngamsTestLib import ngamsTestSuite, waitReqCompl, unzip
 
@@ -485,6 +485,44 @@ class ngamsPClientTest(ngamsTestSuite):
         unzip(tmpFile, unzipedTmpFile)
         self.checkFilesEq("src/SmallFile.fits", unzipedTmpFile, "Retrieved file incorrect")
 
+    def test_retrieve_segmented(self):
+
+        self.prepExtSrv()
+        client = ngamsPClient.ngamsPClient(port=8888)
+        with open("tmp/source", 'wb') as f:
+            f.write(os.urandom(1000000))
+        client.archive("tmp/source", mimeType='application/octet-stream')
+
+        status = client.retrieve_segmented("source", targetFile="tmp/retrieved",
+                                           streams=3, segment_size=65536)
+        self.assertEqual(NGAMS_SUCCESS, status.getStatus())
+        self.assertNotIn("could not be verified", status.getMessage())
+        self.checkFilesEq("tmp/source", "tmp/retrieved", "Retrieved file incorrect")
+        self.assertFalse(os.path.exists("tmp/retrieved.journal"))
+
+        # Pretend a previous retrieval left the first segment done, but in
+        # reality it contains garbage. The segment is not retrieved again,
+        # and checksum verification notices
+        with open("tmp/retrieved", 'r+b') as f:
+            f.write(b'\0' * 65536)
+        stat = client.get_status('STATUS', pars=[('file_id', 'source')])
+        checksum = stat.getDiskStatusList()[0].getFileObjList()[0].getChecksum()
+        journal = ngamsPClient._retrieval_journal("tmp/retrieved.journal",
+                    {'file_id': 'source', 'file_version': 1, 'size': 1000000,
+                     'checksum': checksum, 'segment_size': 65536})
+        journal.add((0, 65535))
+        status = client.retrieve_segmented("source", targetFile="tmp/retrieved",
+                                           streams=3, segment_size=65536)
+        self.assertEqual(NGAMS_FAILURE, status.getStatus())
+        self.assertIn("doesn't match", status.getMessage())
+        self.assertTrue(os.path.exists("tmp/retrieved"))
+
+        # Bad data means we start from scratch
+        status = client.retrieve_segmented("source", targetFile="tmp/retrieved",
+                                           streams=3, segment_size=65536)
+        self.assertEqual(NGAMS_SUCCESS, status.getStatus())
+        self.checkFilesEq("tmp/source", "tmp/retrieved", "Retrieved file incorrect")
+
 
     def test_ServerMultiplexing_01(self):
         """
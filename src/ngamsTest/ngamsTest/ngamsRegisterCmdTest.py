@@ -109,4 +109,28 @@ class ngamsRegisterCmdTest(ngamsTestSuite):
         tmpFileObj = ngamsFileInfo.ngamsFileInfo().unpackSqlResult(tmpFileRes)
         saveInFile(fileInfoTmp, filterDbStatus1(tmpFileObj.dumpBuf()))
         self.checkFilesEq(fileInfoRef, fileInfoTmp,
-                          "Incorrect info in DB for registered file")
\ No newline at end of file
+                          "Incorrect info in DB for registered file")
+
+    def test_RegisterCmd_same_file_id(self):
+        """
+        Files with the same File ID registered by the same request get
+        different versions, even if their entries are written in batches
+        """
+        _, dbObj = self.prepExtSrv()
+        tmpSrcDir = "/tmp/ngamsTest/NGAS/FitsStorage2-Main-3/saf/test"
+        checkCreatePath(tmpSrcDir)
+        for name in ("SmallFile1.fits", "SmallFile2.fits"):
+            shutil.copy("src/SmallFile.fits", os.path.join(tmpSrcDir, name))
+        sendExtCmd(8888, NGAMS_REGISTER_CMD, [["path", tmpSrcDir]])
+
+        diskId = "tmp-ngamsTest-NGAS-FitsStorage2-Main-3"
+        fileId = "TEST.2001-05-08T15:25:00.123"
+        host_id = getHostName() + ":8888"
+        startTime = time.time()
+        while ((time.time() - startTime) < 10):
+            if dbObj.getFileInfoFromFileIdHostId(host_id, fileId, 2, diskId):
+                break
+            time.sleep(0.1)
+        for version in (1, 2):
+            self.assertTrue(dbObj.getFileInfoFromFileIdHostId(host_id, fileId,
+                                                              version, diskId))
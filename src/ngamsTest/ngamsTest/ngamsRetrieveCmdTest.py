@@ -34,7 +34,12 @@ This module contains the Test Suite for the RETRIEVE Command.
 import contextlib
 import io
 import os
+import shutil
 import subprocess
+import tarfile
+import zipfile
+
+import psutil
 
 from ngamsLib import ngamsConfig, ngamsHttpUtils
 from ngamsLib.ngamsCore import getHostName, \
@@ -540,15 +545,13 @@ class ngamsRetrieveCmdTest(ngamsTestSuite):
         client = sendPclCmd()
         client.archive("src/SmallFile.fits")
 
-        # Partial retrieval only supports a start offset, so using only
-        # a suffix length or a begin/end range should fail
-        ranges = ['0-1', '-1']
-
-        # Not a number, missing -, negative number
-        ranges += ['a-', 'a', '0', '-100-']
+        # Not a number, missing -, negative number, end before start,
+        # empty range, wrong units
+        ranges = ['bytes=a-', 'bytes=a', 'bytes=0', 'bytes=-100-', 'bytes=5-2',
+                  'bytes=0-1,', 'bytes=', 'lines=0-1']
 
         for r in ranges:
-            hdrs = {'Range': 'bytes=' + r}
+            hdrs = {'Range': r}
             status = client.retrieve("TEST.2001-05-08T15:25:00.123", targetFile='tmp', hdrs=hdrs)
             self.assertEqual('FAILURE', status.getStatus())
             self.assertIn('Invalid Range header', status.getMessage())
@@ -582,6 +585,8 @@ class ngamsRetrieveCmdTest(ngamsTestSuite):
         piece_by_piece = io.BytesIO()
         for n in range(n_parts):
             offset = n * part_size
+            if offset >= file_size:
+                break
             response = ngamsHttpUtils.httpGet('127.0.0.1', 8888, 'RETRIEVE',
                                               pars=(('file_id', 'source'),),
                                               hdrs={'Range': 'bytes=%d-' % (offset,)})
@@ -596,4 +601,260 @@ class ngamsRetrieveCmdTest(ngamsTestSuite):
                     piece_by_piece.write(data)
 
         self.assertEqual(file_size, piece_by_piece.tell())
-        self.assertEqual(full.getvalue(), piece_by_piece.getvalue())
\ No newline at end of file
+        self.assertEqual(full.getvalue(), piece_by_piece.getvalue())
+
+    def test_range_retrieval(self):
+
+        self.prepExtSrv()
+        client = sendPclCmd()
+
+        contents = os.urandom(1024)
+        with open("tmp/source", 'wb') as f:
+            f.write(contents)
+        client.archive("tmp/source", mimeType='application/octet-stream')
+
+        def retrieve(ranges):
+            response = ngamsHttpUtils.httpGet('127.0.0.1', 8888, 'RETRIEVE',
+                                              pars=(('file_id', 'source'),),
+                                              hdrs={'Range': 'bytes=' + ranges})
+            with contextlib.closing(response):
+                return response.status, response.getheader('Content-Type'), \
+                       response.getheader('Content-Range'), response.read()
+
+        # Closed, open, suffix and oversized ranges
+        for r, first, last in (('0-0', 0, 0), ('100-199', 100, 199),
+                               ('1000-', 1000, 1023), ('-10', 1014, 1023),
+                               ('-2000', 0, 1023), ('1000-5000', 1000, 1023)):
+            status, _, content_range, data = retrieve(r)
+            self.assertEqual(206, status)
+            self.assertEqual('bytes %d-%d/1024' % (first, last), content_range)
+            self.assertEqual(contents[first:last + 1], data)
+
+        # Several ranges come back as multipart/byteranges, with
+        # unsatisfiable ranges left out
+        status, content_type, _, data = retrieve('0-9,2000-,-5,100-109')
+        self.assertEqual(206, status)
+        self.assertTrue(content_type.startswith('multipart/byteranges; boundary='))
+        boundary = content_type.split('=', 1)[1].encode('ascii')
+        parts = data.split(b'\r\n--' + boundary)
+        self.assertEqual(b'', parts[0])
+        self.assertEqual(b'--\r\n', parts[-1])
+        for part, (first, last) in zip(parts[1:-1], ((0, 9), (1019, 1023), (100, 109))):
+            hdrs, body = part.split(b'\r\n\r\n', 1)
+            self.assertIn(b'Content-Range: bytes %d-%d/1024' % (first, last), hdrs)
+            self.assertEqual(contents[first:last + 1], body)
+
+        # Nothing can be satisfied
+        status, _, content_range, _ = retrieve('1024-,-0')
+        self.assertEqual(416, status)
+        self.assertEqual('bytes */1024', content_range)
+
+    def test_conditional_retrieval(self):
+
+        self.prepExtSrv()
+        client = sendPclCmd()
+
+        with open("tmp/source", 'wb') as f:
+            f.write(os.urandom(1024))
+        client.archive("tmp/source", mimeType='application/octet-stream')
+
+        def retrieve(hdrs=None):
+            response = ngamsHttpUtils.httpGet('127.0.0.1', 8888, 'RETRIEVE',
+                                              pars=(('file_id', 'source'),),
+                                              hdrs=hdrs)
+            with contextlib.closing(response):
+                return response.status, response.getheader('ETag'), \
+                       response.getheader('Last-Modified'), response.read()
+
+        status, etag, last_modified, data = retrieve()
+        self.assertEqual(200, status)
+        self.assertEqual(1024, len(data))
+        self.assertTrue(etag.startswith('"1-'))
+        self.assertIsNotNone(last_modified)
+
+        # The client already holds the file
+        for hdrs in ({'If-None-Match': etag},
+                     {'If-None-Match': '"other", W/' + etag},
+                     {'If-None-Match': '*'},
+                     {'If-Modified-Since': last_modified}):
+            status, etag2, _, data = retrieve(hdrs)
+            self.assertEqual(304, status)
+            self.assertEqual(etag, etag2)
+            self.assertEqual(b'', data)
+
+        # If-None-Match takes precedence, and invalid dates are ignored
+        for hdrs in ({'If-None-Match': '"other"'},
+                     {'If-None-Match': '"other"', 'If-Modified-Since': last_modified},
+                     {'If-Modified-Since': 'Sat, 01 Jan 2000 00:00:00 GMT'},
+                     {'If-Modified-Since': 'not a date'}):
+            status, _, _, data = retrieve(hdrs)
+            self.assertEqual(200, status)
+            self.assertEqual(1024, len(data))
+
+        # A new version gets a new ETag
+        client.archive("tmp/source", mimeType='application/octet-stream')
+        status, etag3, _, _ = retrieve({'If-None-Match': etag})
+        self.assertEqual(200, status)
+        self.assertTrue(etag3.startswith('"2-'))
+
+    def test_location_cache(self):
+
+        self.prepExtSrv(cfgProps=(('NgamsCfg.Server[1].LocationCacheSize', '10'),))
+        client = sendPclCmd()
+
+        def archive():
+            contents = os.urandom(1024)
+            with open("tmp/source", 'wb') as f:
+                f.write(contents)
+            self.assertEqual('SUCCESS', client.archive("tmp/source", mimeType='application/octet-stream').getStatus())
+            return contents
+
+        def retrieve():
+            response = ngamsHttpUtils.httpGet('127.0.0.1', 8888, 'RETRIEVE',
+                                              pars=(('file_id', 'source'),))
+            with contextlib.closing(response):
+                return response.read()
+
+        # The second retrieval finds the location in the cache
+        contents = archive()
+        for _ in range(2):
+            self.assertEqual(contents, retrieve())
+        msg = client.get_status('STATUS', pars=[('location_cache', '1')]).getMessage()
+        self.assertEqual("Location cache: size=1, hits=1, misses=1", msg)
+
+        # A retrieval served from the cache doesn't query ngas_files at all
+        def ngas_files_queries():
+            msg = client.get_status('STATUS', pars=[('db_stats', '1')]).getMessage()
+            return sum(int(line.split(', ')[0]) for line in msg.split('; ')[1:]
+                       if 'ngas_files' in line)
+        count = ngas_files_queries()
+        self.assertEqual(contents, retrieve())
+        self.assertEqual(count, ngas_files_queries())
+
+        # Archiving a new version invalidates the cached location
+        contents = archive()
+        self.assertEqual(contents, retrieve())
+
+    def test_location_cache_register(self):
+        """Registering a new version of a file invalidates its cached location"""
+
+        self.prepExtSrv(cfgProps=(('NgamsCfg.Server[1].LocationCacheSize', '10'),))
+        client = sendPclCmd()
+        self.assertStatus(client.archive("src/SmallFile.fits"))
+        fileId = "TEST.2001-05-08T15:25:00.123"
+
+        def etag():
+            response = ngamsHttpUtils.httpGet('127.0.0.1', 8888, 'RETRIEVE',
+                                              pars=(('file_id', fileId),))
+            with contextlib.closing(response):
+                response.read()
+                return response.getheader('ETag')
+
+        # The first version is now in the cache
+        for _ in range(2):
+            self.assertTrue(etag().startswith('"1-'))
+
+        regFile = "/tmp/ngamsTest/NGAS/FitsStorage2-Main-3/saf/test/SmallFile.fits"
+        checkCreatePath(os.path.dirname(regFile))
+        shutil.copy("src/SmallFile.fits", regFile)
+        self.assertStatus(client.get_status('REGISTER', pars=[('path', regFile),
+                                                              ('wait', '1')]))
+        self.assertTrue(etag().startswith('"2-'))
+
+    def test_host_topology(self):
+
+        # The master node locates the file on the sub-node through its cached
+        # view of the ngas_hosts table
+        cfgPars = [["NgamsCfg.Server[1].HostTopologyRefresh", "60"]]
+        self.prepCluster(((8000, cfgPars), 8011))
+        client = sendPclCmd(port=8000)
+        self.assertStatus(sendPclCmd(port=8011).archive("src/SmallFile.fits"))
+        fileId = "TEST.2001-05-08T15:25:00.123"
+        for _ in range(2):
+            self.assertStatus(client.retrieve(fileId, targetFile="tmp"))
+
+    def test_file_access_probes(self):
+
+        # The file is on two sub-nodes, and the one with the latest version
+        # dies, leaving its disks registered as mounted
+        cfgPars = [["NgamsCfg.Server[1].FileAccessProbeTimeout", "5"]]
+        self.prepCluster([(port, cfgPars) for port in (8000, 8001, 8002)])
+        for port in (8001, 8002, 8002):
+            self.assertStatus(sendPclCmd(port=port).archive("src/SmallFile.fits"))
+        srvProcess = [i[0] for i in self.extSrvInfo if i[1] == 8002][0]
+        for p in psutil.Process(srvProcess.pid).children(recursive=True):
+            p.kill()
+        srvProcess.kill()
+        srvProcess.wait()
+
+        # The master node probes both sub-nodes concurrently and serves
+        # the previous version from the one still up, also when skipping
+        # the other one. The quick location is skipped since it only
+        # considers online servers
+        client = sendPclCmd(port=8000)
+        fileId = "TEST.2001-05-08T15:25:00.123"
+        pars = [('quick_location', '0')]
+        for _ in range(2):
+            self.assertStatus(client.retrieve(fileId, pars=pars, targetFile="tmp"))
+
+    def test_batch_retrieve(self):
+
+        # One file is local to the contacted server, the other is remote
+        self.prepCluster((8000, 8011))
+        self.assertStatus(sendPclCmd(port=8000).archive("src/SmallFile.fits"))
+        self.assertStatus(sendPclCmd(port=8011).archive("src/TinyTestFile.fits"))
+        fileIds = ("TEST.2001-05-08T15:25:00.123", "NCU.2003-11-11T11:11:11.111")
+
+        def retrieve(fileId):
+            pars = (('file_id', fileId),)
+            resp = ngamsHttpUtils.httpGet('127.0.0.1', 8000, 'RETRIEVE', pars=pars)
+            with contextlib.closing(resp):
+                self.assertEqual(200, resp.status)
+                return resp.getheader('Content-Disposition').split('"')[1], resp.read()
+        expected = dict(retrieve(fileId) for fileId in fileIds)
+
+        # Files listed in the request body
+        files = ''.join('<File FileId="%s"/>' % fileId for fileId in fileIds)
+        files = '<FileList>%s</FileList>' % files
+        for fmt in ('tar', 'zip'):
+            status, _, _, data = ngamsHttpUtils.httpPost('127.0.0.1', 8000,
+                'BRETRIEVE', files.encode('ascii'), 'text/xml', pars=(('format', fmt),))
+            self.assertEqual(200, status)
+            if fmt == 'tar':
+                with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+                    contents = {m.name: tar.extractfile(m).read() for m in tar}
+            else:
+                with zipfile.ZipFile(io.BytesIO(data)) as z:
+                    self.assertIsNone(z.testzip())
+                    contents = {name: z.read(name) for name in z.namelist()}
+            self.assertEqual(expected, contents)
+
+        # Files matching a pattern
+        resp = ngamsHttpUtils.httpGet('127.0.0.1', 8000, 'BRETRIEVE',
+                                      pars=(('file_id', 'NCU.*'),))
+        with contextlib.closing(resp):
+            self.assertEqual(200, resp.status)
+            with tarfile.open(fileobj=io.BytesIO(resp.read())) as tar:
+                self.assertEqual(1, len(tar.getmembers()))
+
+    def test_proxy_streaming(self):
+        """
+        Files retrieved through a proxy are relayed back to the client
+        block by block, with the original Content-Length
+        """
+
+        blockSize = [["NgamsCfg.Server[1].BlockSize", "1024"]]
+        self.prepCluster(((8000, blockSize), 8011))
+
+        data = os.urandom(100 * 1024 + 13)
+        with open("tmp/source", 'wb') as f:
+            f.write(data)
+        stat = sendPclCmd(port=8011).archive("tmp/source", mimeType='application/octet-stream')
+        self.assertEqual(NGAMS_SUCCESS, stat.getStatus())
+
+        response = ngamsHttpUtils.httpGet('127.0.0.1', 8000, 'RETRIEVE',
+                                          pars=(('file_id', 'source'),))
+        with contextlib.closing(response):
+            self.assertEqual(200, response.status)
+            self.assertEqual(str(len(data)), response.getheader('Content-Length'))
+            self.assertEqual(data, response.read())
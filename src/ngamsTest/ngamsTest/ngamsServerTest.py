@@ -32,7 +32,9 @@ This module contains the Test Suite for the NG/AMS Server.
 """
 
 import contextlib
+import logging
 import os
+import resource
 import socket
 import subprocess
 import sys
@@ -40,9 +42,15 @@ import threading
 import time
 import unittest
 import uuid
+from multiprocessing.pool import ThreadPool
+
+import psutil
+from six.moves import http_client as httplib  # @UnresolvedImport
+from six.moves import queue as Queue  # @UnresolvedImport
 
 from ngamsLib import ngamsHttpUtils
-from ngamsLib.ngamsCore import NGAMS_SUCCESS, NGAMS_HTTP_SERVICE_NA
+from ngamsLib.ngamsCore import NGAMS_SUCCESS, NGAMS_FAILURE, NGAMS_HTTP_SERVICE_NA
+from ngamsServer import request_processes, worker_pool
 from .ngamsTestLib import ngamsTestSuite, saveInFile, sendPclCmd, this_dir
 
 
@@ -53,6 +61,32 @@ def handleCmd(_, req, __):
     open(os.path.join(this_dir, req['fname']), 'wb').close()
 
 
+@contextlib.contextmanager
+def logging_locks_held(handler):
+    """
+    Holds the logging locks in another thread while the block runs, up to a
+    couple of seconds (newer pythons acquire them themselves before forking)
+    """
+    acquired, release = threading.Event(), threading.Event()
+    def hold():
+        with logging._lock, handler.lock:
+            acquired.set()
+            release.wait(2)
+    t = threading.Thread(target=hold)
+    t.start()
+    acquired.wait()
+    try:
+        yield
+    finally:
+        release.set()
+        t.join()
+
+
+def _log_after_fork():
+    request_processes._reset_logging_locks()
+    logging.getLogger(__name__).error("Logging after fork")
+
+
 class ngamsServerTest(ngamsTestSuite):
 
     def test_slow_receiving_client(self):
@@ -115,6 +149,162 @@ class ngamsServerTest(ngamsTestSuite):
         with contextlib.closing(resp):
             self.assertEqual(NGAMS_HTTP_SERVICE_NA, resp.status)
 
+    def test_worker_threads(self):
+
+        saveInFile("tmp/handleHttpRequest_tmp", "handleHttpRequest_Block5secs")
+        cfg = (('NgamsCfg.Server[1].WorkerThreads', '1'),
+               ('NgamsCfg.Server[1].QuickWorkerThreads', '1'),
+               ('NgamsCfg.Server[1].RequestQueueSize', '1'),
+               ('NgamsCfg.Server[1].RequestQueueTimeout', '2'))
+        self.prepExtSrv(srvModule="ngamsSrvTestDynReqCallBack", cfgProps=cfg)
+
+        def online(_):
+            resp = ngamsHttpUtils.httpGet('127.0.0.1', 8888, 'ONLINE')
+            with contextlib.closing(resp):
+                return resp.status
+
+        # Fire off two clients: the first one is served by the only worker
+        # thread, taking 5 seconds, while the second one waits in the queue
+        # for longer than allowed
+        pool = ThreadPool(2)
+        try:
+            results = pool.map_async(online, range(2))
+            time.sleep(1)
+
+            # The queue is full, so this one doesn't get through
+            self.assertEqual(NGAMS_HTTP_SERVICE_NA, online(None))
+
+            # STATUS is served by the quick worker thread though
+            start = time.time()
+            self.assertEqual(NGAMS_SUCCESS, sendPclCmd().status().getStatus())
+            self.assertLess(time.time() - start, 2)
+
+            statuses = sorted(results.get())
+            self.assertNotEqual(NGAMS_HTTP_SERVICE_NA, statuses[0])
+            self.assertEqual(NGAMS_HTTP_SERVICE_NA, statuses[1])
+        finally:
+            pool.close()
+
+    def test_dispatcher_many_connections(self):
+
+        # More connections than select() can handle wait for their
+        # request lines, and are all dispatched once they arrive
+        nconns = 1100
+        if resource.getrlimit(resource.RLIMIT_NOFILE)[0] < 2 * nconns + 100:
+            self.skipTest("Not enough file descriptors available")
+        served = Queue.Queue()
+        pool = worker_pool.WorkerPool('test', 4, nconns, 60)
+        dispatcher = worker_pool.Dispatcher(pool, {}, 60)
+        pairs = [socket.socketpair() for _ in range(nconns)]
+        try:
+            start = time.time()
+            for client, server in pairs:
+                dispatcher.dispatch(server, served.put, self.fail, server)
+            for client, _ in pairs:
+                client.sendall(b'GET /STATUS HTTP/1.0\r\n\r\n')
+            for _ in range(nconns):
+                served.get(timeout=10)
+            self.assertLess(time.time() - start, 10)
+        finally:
+            dispatcher.stop()
+            pool.stop()
+            for client, server in pairs:
+                client.close()
+                server.close()
+
+    def test_keep_alive(self):
+
+        cfg = (('NgamsCfg.Server[1].KeepAliveTimeout', '5'),
+               ('NgamsCfg.Server[1].KeepAliveMaxRequests', '2'))
+        self.prepExtSrv(cfgProps=cfg)
+
+        # Two requests go through the same connection, which is then closed
+        # by the server after reaching the maximum number of requests
+        conn = httplib.HTTPConnection('127.0.0.1', 8888, timeout=10)
+        with contextlib.closing(conn):
+            for close in (False, True):
+                conn.request('GET', '/STATUS')
+                resp = conn.getresponse()
+                self.assertEqual(200, resp.status)
+                resp.read()
+                self.assertEqual(close, resp.will_close)
+                self.assertEqual(close, resp.getheader('Connection') == 'close')
+
+        # Connections are reused by the client-side pool
+        sock = None
+        for _ in range(2):
+            resp = ngamsHttpUtils.httpGet('127.0.0.1', 8888, 'STATUS')
+            with contextlib.closing(resp):
+                self.assertEqual(200, resp.status)
+                if sock is not None:
+                    self.assertIs(sock, resp._conn.sock)
+                sock = resp._conn.sock
+                resp.read()
+
+    def test_keep_alive_worker_threads(self):
+
+        # Worker threads are not held by idle connections
+        cfg = (('NgamsCfg.Server[1].KeepAliveTimeout', '5'),
+               ('NgamsCfg.Server[1].WorkerThreads', '1'))
+        self.prepExtSrv(cfgProps=cfg)
+        conn = httplib.HTTPConnection('127.0.0.1', 8888, timeout=10)
+        with contextlib.closing(conn):
+            conn.request('GET', '/STATUS')
+            resp = conn.getresponse()
+            self.assertEqual(200, resp.status)
+            resp.read()
+            self.assertTrue(resp.will_close)
+
+    def test_request_processes(self):
+
+        self.prepExtSrv(cfgProps=(('NgamsCfg.Server[1].RequestProcesses', '2'),))
+        client = sendPclCmd()
+
+        # The port is served by the request processes only
+        def listeners():
+            srv = psutil.Process(self.extSrvInfo[-1][0].pid)
+            procs = [srv] + srv.children(recursive=True)
+            return [p.pid for p in procs
+                    for c in p.connections('tcp')
+                    if c.status == psutil.CONN_LISTEN and c.laddr[1] == 8888]
+        pids = listeners()
+        self.assertEqual(2, len(pids))
+        self.assertNotIn(self.extSrvInfo[-1][0].pid, pids)
+
+        self.assertEqual(NGAMS_SUCCESS, client.archive("src/SmallFile.fits").getStatus())
+        for _ in range(4):
+            status = client.retrieve("TEST.2001-05-08T15:25:00.123", targetFile="tmp")
+            self.assertEqual(NGAMS_SUCCESS, status.getStatus())
+
+        # State changes are handled by the server process, and inherited by
+        # new request processes
+        self.assertEqual(NGAMS_SUCCESS, client.offline().getStatus())
+        self.assertEqual('OFFLINE', client.status().getState())
+        self.assertEqual(NGAMS_FAILURE, client.archive("src/SmallFile.fits").getStatus())
+        self.assertEqual(NGAMS_SUCCESS, client.online().getStatus())
+        self.assertEqual('ONLINE', client.status().getState())
+        self.assertEqual(NGAMS_SUCCESS, client.archive("src/SmallFile.fits").getStatus())
+        self.assertEqual(2, len(listeners()))
+        self.assertFalse(set(pids) & set(listeners()))
+
+    def test_request_processes_logging_locks(self):
+
+        # A request process can log even if the logging locks were held by
+        # another thread of the coordinator when it was forked
+        handler = logging.FileHandler(os.devnull)
+        logging.root.addHandler(handler)
+        try:
+            with logging_locks_held(handler):
+                proc = request_processes._mp.Process(target=_log_after_fork)
+                proc.start()
+                proc.join(10)
+            if proc.exitcode is None:
+                proc.terminate()
+            self.assertEqual(0, proc.exitcode)
+        finally:
+            logging.root.removeHandler(handler)
+            handler.close()
+
     def test_user_command_plugin(self):
 
         # Let this module implement the TEST command
@@ -40,7 +40,8 @@ def cleanUpAfterProc(dummy):
 def genReplyRetrieveFail(srvObj,
                          reqPropsObj,
                          httpRef,
-                         statusObjList):
+                         statusObjList,
+                         digests=None):
     """
     Used to override ngamsRetrieveCmd.genReplyRetrieve(). This implementation
     simluates a broken socket connection while data is being sent back to the
@@ -31,10 +31,37 @@
 This module contains the Test Suite for the STATUS Command.
 """
 
+import contextlib
+import logging
+
+from ngamsLib import ngamsDbCore
 from ngamsLib.ngamsCore import toiso8601
 from .ngamsTestLib import ngamsTestSuite, getNcu11, sendPclCmd
 
 
+class _RecordsHandler(logging.Handler):
+    """Keeps the records it handles"""
+
+    def __init__(self):
+        super(_RecordsHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+@contextlib.contextmanager
+def _capture_logs(name, level):
+    """Yields the records of `level` or above logged by logger `name`"""
+    logger = logging.getLogger(name)
+    handler = _RecordsHandler()
+    handler.setLevel(level)
+    logger.addHandler(handler)
+    try:
+        yield handler.records
+    finally:
+        logger.removeHandler(handler)
+
+
 class ngamsStatusCmdTest(ngamsTestSuite):
     """
     Synopsis:
@@ -174,4 +201,51 @@ class ngamsStatusCmdTest(ngamsTestSuite):
         # Checks should be scucessfull with and wihtout files archived
         run_checks()
         self.assertArchive('src/SmallFile.fits', 'application/octet-stream')
-        run_checks()
\ No newline at end of file
+        run_checks()
+
+    def test_sql_cache(self):
+        """Checks that SQL templates are formatted once and then reused"""
+
+        self.prepExtSrv()
+        client = sendPclCmd()
+
+        def sql_cache_stats():
+            msg = client.get_status('STATUS', pars=[('sql_cache', '1')]).getMessage()
+            self.assertTrue(msg.startswith('SQL cache: '), msg)
+            return dict(kv.split('=') for kv in msg[len('SQL cache: '):].split(', '))
+
+        self.assertArchive('src/SmallFile.fits', 'application/octet-stream')
+        before = sql_cache_stats()
+        self.assertArchive('src/SmallFile.fits', 'application/octet-stream')
+        after = sql_cache_stats()
+        self.assertGreater(int(after['hits']), int(before['hits']))
+        self.assertEqual(int(after['size']), int(after['misses']))
+
+    def test_db_stats(self):
+        """Checks that latency statistics are kept for each DB query, and slow queries are logged"""
+
+        _, db = self.prepExtSrv()
+        client = sendPclCmd()
+        self.assertArchive('src/SmallFile.fits', 'application/octet-stream')
+
+        msg = client.get_status('STATUS', pars=[('db_stats', '1')]).getMessage()
+        lines = msg.split('; ')
+        self.assertTrue(lines[0].startswith('DB query statistics'), msg)
+        inserts = [l for l in lines[1:] if 'INSERT INTO ngas_files' in l]
+        self.assertEqual(1, len(inserts), msg)
+        count, total, p50, p95, p99, max_ = inserts[0].split(', ')[:6]
+        self.assertGreaterEqual(int(count), 1)
+        self.assertLessEqual(float(p50), float(p99))
+        self.assertLessEqual(float(p99), float(max_))
+
+        # The test's own DB object logs all queries as slow
+        db.setSlowQueryTime(1e-9)
+        with _capture_logs('ngamsLib.ngamsDbCore', logging.WARNING) as records:
+            with ngamsDbCore.query_context('TEST'):
+                db.query2("SELECT count(*) FROM ngas_files WHERE file_id = {}", ('SmallFile.fits',))
+        self.assertEqual(1, len(records))
+        self.assertIn('Slow DB query from TEST', records[0].getMessage())
+        self.assertIn('SmallFile.fits', records[0].getMessage())
+        counts = [stats.count for query, stats in db.getQueryStats()
+                  if query.startswith('SELECT count(*) FROM ngas_files')]
+        self.assertEqual([1], counts)
@@ -447,6 +447,7 @@ def delNgasTbls(dbObj):
     dbObj.query2("DELETE FROM ngas_disks")
     dbObj.query2("DELETE FROM ngas_disks_hist")
     dbObj.query2("DELETE FROM ngas_files")
+    dbObj.query2("DELETE FROM ngas_files_digests")
     dbObj.query2("UPDATE ngas_containers set parent_container_id = null")
     dbObj.query2("DELETE FROM ngas_containers")
     dbObj.query2("DELETE FROM ngas_subscr_queue")
@@ -19,36 +19,257 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
 #    MA 02111-1307  USA
 #
+"""
+Benchmarks the checksum and I/O paths used by NGAS to ingest data, for each
+checksum variant and block size.
 
+The following benchmarks are available:
+
+ * memory: checksum of an in-memory buffer
+ * file-warm: checksum of a file whose contents are in the page cache
+ * file-cold: checksum of a file whose contents were evicted from the page cache
+ * archive: archive_contents reading from a local socket pair
+ * pipelined: archive_contents_pipelined reading from a local socket pair
+ * parallel: parallel checksum of a file, for different number of threads
+ * digests: archiving with additional digests, serially and pipelined
+
+Results are written as a JSON document that describes the environment the
+benchmarks were run on, so runs on different NGAS versions and hardware can
+be compared against each other.
+"""
+
+import argparse
+import datetime
 import io
-import itertools
-import time
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import socket
 import sys
+import tempfile
+import threading
+import time
+
+from ngamsLib import ngamsCore
+from ngamsServer import ngamsArchiveUtils, ngamsFileUtils
+
+
+logger = logging.getLogger(__name__)
+
+all_benchmarks = ('memory', 'file-warm', 'file-cold', 'archive', 'pipelined',
+                  'parallel', 'digests')
+
+def _comma_list(conv=str):
+    return lambda s: [conv(x.strip()) for x in s.split(',') if x.strip()]
 
-from ngamsServer import ngamsFileUtils
+def _measure(func, repeat):
+    """Runs `func` `repeat` times, returning the elapsed times and the last result"""
+    times = []
+    res = None
+    for _ in range(repeat):
+        start = time.time()
+        res = func()
+        times.append(time.time() - start)
+    return times, res
 
-if len(sys.argv) > 1:
-    fname = sys.argv[1]
+def _result(benchmark, variant, block_size, size, times, **extra):
+    size_mb = size / 1024. / 1024.
+    times = sorted(times)
+    res = {'benchmark': benchmark, 'variant': variant, 'block_size': block_size,
+           'size': size, 'times': times,
+           'best_mb_s': size_mb / times[0],
+           'median_mb_s': size_mb / times[len(times) // 2]}
+    res.update(extra)
+    logger.info("%-9s %-6s %8d %9.3f [MB/s] %s", benchmark, variant, block_size,
+                res['best_mb_s'], extra or '')
+    return res
+
+def _error(benchmark, variant, block_size, e, **extra):
+    logger.warning("%-9s %-6s %8d failed: %s", benchmark, variant, block_size, e)
+    res = {'benchmark': benchmark, 'variant': variant, 'block_size': block_size,
+           'error': str(e)}
+    res.update(extra)
+    return res
+
+def drop_cache(fname):
+    """Evicts the contents of `fname` from the page cache"""
+    if not hasattr(os, 'posix_fadvise'):
+        raise Exception('posix_fadvise not available')
+    fd = os.open(fname, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+def warm_cache(fname, block_size=1024 * 1024):
+    """Reads `fname` so its contents are in the page cache"""
     with open(fname, 'rb') as f:
-        data = f.read()
-        size_mb = len(data) / 1024. / 1024.
-        print("Checking file %s (%d bytes)\n" % (fname, len(data)))
-else:
-    size_mb = 128
-    data = ' ' * 1024 * 1024 * size_mb
-
-print("Algo   Chksum   Chksum(int) BufSize            Speed")
-print("====== ======== =========== ======= ================")
-for variant, bufsize_log2 in itertools.product(('crc32', 'crc32c', 'crc32z'), range(9, 21)):
-
-    f = io.BytesIO(data)
-
-    bufsize = 2 ** bufsize_log2
-    start = time.time()
-    crc = ngamsFileUtils.get_checksum(bufsize, f, variant)
-    end = time.time()
-
-    if crc is None:
-        print("Variant not supported: %s" % variant)
+        while f.read(block_size):
+            pass
+
+def archive_from_socket(data, out_fname, block_size, variant, pipelined,
+                        nbuffers, digests=()):
+    """
+    Archives `data` into `out_fname`, sending it through a local socket pair
+    """
+    s1, s2 = socket.socketpair()
+    def send():
+        try:
+            s1.sendall(data)
+        finally:
+            s1.close()
+    sender = threading.Thread(target=send)
+    sender.start()
+    fin = s2.makefile('rb')
+    try:
+        if pipelined:
+            return ngamsArchiveUtils.archive_contents_pipelined(out_fname, fin,
+                       len(data), block_size, variant, nbuffers=nbuffers,
+                       digests=digests)
+        return ngamsArchiveUtils.archive_contents(out_fname, fin, len(data),
+                   block_size, variant, digests=digests)
+    finally:
+        fin.close()
+        s2.close()
+        sender.join()
+
+def _stage_times(res):
+    return {'rtime': res.rtime, 'wtime': res.wtime, 'crctime': res.crctime}
+
+def run_benchmarks(opts, data, fname):
+
+    size = len(data)
+    results = []
+    for variant in opts.variants:
+
+        # Unsupported variants are reported once
+        try:
+            ngamsFileUtils.get_checksum_info(variant)
+        except Exception as e:
+            results.append(_error(None, variant, None, e))
+            continue
+
+        for block_size in opts.block_sizes:
+
+            def run(benchmark, func, **extra):
+                try:
+                    times, res = _measure(func, opts.repeat)
+                    if hasattr(res, 'rtime'):
+                        extra.update(_stage_times(res))
+                    results.append(_result(benchmark, variant, block_size, size, times, **extra))
+                except Exception as e:
+                    results.append(_error(benchmark, variant, block_size, e, **extra))
+
+            if 'memory' in opts.benchmarks:
+                run('memory', lambda: ngamsFileUtils.get_checksum(block_size, io.BytesIO(data), variant))
+
+            if 'file-warm' in opts.benchmarks:
+                warm_cache(fname)
+                run('file-warm', lambda: ngamsFileUtils.get_checksum(block_size, fname, variant))
+
+            if 'file-cold' in opts.benchmarks:
+                def cold():
+                    drop_cache(fname)
+                    return ngamsFileUtils.get_checksum(block_size, fname, variant)
+                run('file-cold', cold)
+
+            out_fname = fname + '.out'
+            try:
+                if 'archive' in opts.benchmarks:
+                    run('archive', lambda: archive_from_socket(data, out_fname, block_size,
+                                                               variant, False, opts.nbuffers))
+
+                if 'pipelined' in opts.benchmarks:
+                    run('pipelined', lambda: archive_from_socket(data, out_fname, block_size,
+                                                                 variant, True, opts.nbuffers),
+                        nbuffers=opts.nbuffers)
+
+                if 'digests' in opts.benchmarks and opts.digests:
+                    for pipelined in (False, True):
+                        run('digests', lambda: archive_from_socket(data, out_fname, block_size,
+                                                                   variant, pipelined, opts.nbuffers,
+                                                                   digests=opts.digests),
+                            digests=opts.digests, pipelined=pipelined)
+            finally:
+                if os.path.exists(out_fname):
+                    os.unlink(out_fname)
+
+            if 'parallel' in opts.benchmarks:
+                warm_cache(fname)
+                for nthreads in opts.threads:
+                    run('parallel', lambda: ngamsFileUtils.get_checksum_parallel(block_size, fname,
+                                                                                 variant, nthreads),
+                        threads=nthreads)
+
+    return results
+
+def environment(opts, size):
+    """Describes the environment where the benchmarks are run"""
+    return {'ngas_version': ngamsCore.getNgamsVersion(),
+            'python_version': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpus': multiprocessing.cpu_count(),
+            'hostname': socket.gethostname(),
+            'date': datetime.datetime.utcnow().isoformat(),
+            'directory': opts.directory,
+            'size': size,
+            'repeat': opts.repeat}
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file', nargs='?', help='Use the contents of this file as data instead of generating it', default=None)
+    parser.add_argument('-s', '--size-mb',     help='Amount of data to generate, in MB', type=int, default=128)
+    parser.add_argument('-d', '--directory',   help='Directory where temporary files are written', default=tempfile.gettempdir())
+    parser.add_argument('-V', '--variants',    help='Comma-separated checksum variants', type=_comma_list(), default='crc32,crc32c,crc32z')
+    parser.add_argument('-b', '--block-sizes', help='Comma-separated block sizes, in bytes', type=_comma_list(int),
+                        default=','.join(str(2 ** x) for x in range(12, 21, 2)))
+    parser.add_argument('-B', '--benchmarks',  help='Comma-separated benchmarks to run, out of: %s' % ', '.join(all_benchmarks),
+                        type=_comma_list(), default=','.join(all_benchmarks))
+    parser.add_argument('-t', '--threads',     help='Comma-separated number of threads for the parallel benchmark', type=_comma_list(int), default='2,4')
+    parser.add_argument('-D', '--digests',     help='Comma-separated digests for the digests benchmark', type=_comma_list(), default='md5,sha256')
+    parser.add_argument('-n', '--nbuffers',    help='Number of buffers used by the pipelined benchmarks', type=int, default=4)
+    parser.add_argument('-r', '--repeat',      help='Number of times each benchmark is run', type=int, default=3)
+    parser.add_argument('-o', '--output',      help='File where the JSON results are written to. Defaults to stdout', default=None)
+    parser.add_argument('-v', '--verbose',     help='Be more verbose', action='count', default=2)
+
+    opts = parser.parse_args()
+
+    levels = {0:logging.CRITICAL, 1:logging.ERROR, 2:logging.WARNING,
+              3:logging.INFO,     4:logging.DEBUG, 5:logging.NOTSET}
+    logging.basicConfig(level=levels[min(opts.verbose, 5)], stream=sys.stderr)
+
+    unknown = set(opts.benchmarks) - set(all_benchmarks)
+    if unknown:
+        parser.error('Unknown benchmarks: %s' % ', '.join(sorted(unknown)))
+
+    if opts.file:
+        with open(opts.file, 'rb') as f:
+            data = f.read()
     else:
-        print("%-6s %08x %11d %-7d %9.3f [MB/s]" % (variant, crc & 0xffffffff, crc, bufsize, size_mb / (end - start)))
\ No newline at end of file
+        data = b' ' * (opts.size_mb * 1024 * 1024)
+
+    fd, fname = tempfile.mkstemp(prefix='crc_benchmark_', dir=opts.directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        results = run_benchmarks(opts, data, fname)
+    finally:
+        os.unlink(fname)
+
+    doc = {'environment': environment(opts, len(data)), 'results': results}
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump(doc, f, indent=2, sort_keys=True)
+    else:
+        json.dump(doc, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+#
+"""
+Measures the fragmentation of staging files written concurrently with and
+without preallocation. Extents are counted using the filefrag tool.
+
+Usage: fragmentation_benchmark.py <directory> [nfiles] [size_mb]
+"""
+
+import io
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+from ngamsServer import ngamsArchiveUtils
+
+if len(sys.argv) < 2:
+    print(__doc__)
+    sys.exit(1)
+
+dirname = sys.argv[1]
+nfiles = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+size_mb = int(sys.argv[3]) if len(sys.argv) > 3 else 256
+size = size_mb * 1024 * 1024
+block_size = 64 * 1024
+data = b' ' * size
+
+def extents(fname):
+    out = subprocess.check_output(['filefrag', fname]).decode('ascii')
+    return int(re.search(r'(\d+) extents? found', out).group(1))
+
+print("Prealloc Files Size[MB] Extents(avg) Extents(max)            Speed")
+print("======== ===== ======== ============ ============ ================")
+for prealloc in (False, True):
+
+    fnames = [os.path.join(dirname, 'fragmentation_benchmark_%d' % i) for i in range(nfiles)]
+    def archive(fname):
+        ngamsArchiveUtils.archive_contents(fname, io.BytesIO(data), size,
+                                           block_size, None, prealloc=prealloc)
+    threads = [threading.Thread(target=archive, args=(fname,)) for fname in fnames]
+
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    end = time.time()
+
+    counts = [extents(fname) for fname in fnames]
+    for fname in fnames:
+        os.unlink(fname)
+
+    print("%-8s %5d %8d %12.1f %12d %9.3f [MB/s]" % (prealloc, nfiles, size_mb,
+          float(sum(counts)) / nfiles, max(counts), nfiles * size_mb / (end - start)))